@@ -0,0 +1,348 @@
+import json
+import os
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Tuple
+import requests
+from context_builder import (
+    DEFAULT_BUDGET,
+    DEFAULT_FOLD_THRESHOLD,
+    DEFAULT_PASSAGE_BUDGET,
+    DEFAULT_SUMMARY_BUDGET,
+    PASSAGE_INSTRUCTIONS,
+    ContextBuilder,
+)
+from credential_loader import Credentials, load_config
+from response_cache import (
+    DEFAULT_MAX_ENTRIES,
+    DEFAULT_TTL,
+    DEFAULT_WINDOW,
+    ResponseCache,
+    cache_key,
+    replay,
+)
+from telemetry import span
+from transport import PooledTransport, get_transport
+import streamlit as st
+
+if TYPE_CHECKING:
+    from documents import DocumentIngestor
+    from embeddings import Embedder
+    from vector_index import Passage, VectorStore
+
+
+TOGETHERAI_CHAT_URL = "https://api.together.xyz/v1/chat/completions"
+SYSTEM_PROMPT = (
+    "You are AcademAI, an academic assistant for students. Answer clearly and "
+    "accurately, explain your reasoning, and say so when you are unsure."
+)
+MAX_TOKENS = 1024
+# (connect, read) timeouts; the read timeout applies between streamed chunks.
+STREAM_TIMEOUT = (10, 60)
+RETRIEVED_PASSAGES = 4
+# Passages less similar than this to the prompt are left out of it.
+MIN_PASSAGE_SCORE = 0.2
+
+
+class AssistantEngine:
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        url: str = TOGETHERAI_CHAT_URL,
+        system_prompt: str = SYSTEM_PROMPT,
+        transport: PooledTransport = None,
+    ) -> None:
+        self.model = model
+        self.url = url
+        self.system_prompt = system_prompt
+        self.transport = transport or get_transport()
+        self.headers = {"authorization": f"Bearer {api_key}"}
+        self.stream_headers = dict(self.headers, accept="text/event-stream")
+
+    def payload(self, messages: List[dict], stream: bool) -> str:
+        return json.dumps(
+            {
+                "model": self.model,
+                "messages": [{"role": "system", "content": self.system_prompt}]
+                + messages,
+                "max_tokens": MAX_TOKENS,
+                "stream": stream,
+            }
+        )
+
+    def complete(self, messages: List[dict]) -> str:
+        response = self.transport.post(
+            self.url,
+            self.payload(messages, False),
+            headers=self.headers,
+            timeout=STREAM_TIMEOUT,
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    def stream(
+        self, messages: List[dict], cancel: Optional[threading.Event] = None
+    ) -> Iterator[str]:
+        # Yields content deltas as the server-sent events arrive. Closing the
+        # generator early (cancel, or Streamlit stopping the script because
+        # the user navigated away) closes the response, which drops the
+        # half-read connection instead of returning it to the pool.
+        response = self.transport.stream(
+            self.url,
+            self.payload(messages, True),
+            self.stream_headers,
+            timeout=STREAM_TIMEOUT,
+        )
+        try:
+            response.raise_for_status()
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if cancel is not None and cancel.is_set():
+                    return
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    return
+                choice = json.loads(data)["choices"][0]
+                delta = choice.get("delta", {}).get("content") or choice.get("text")
+                if delta:
+                    yield delta
+        finally:
+            response.close()
+
+
+@lru_cache(maxsize=None)
+def get_assistant_engine(api_key: str, model: str, url: str) -> AssistantEngine:
+    return AssistantEngine(api_key, model, url=url)
+
+
+@st.cache_resource(show_spinner=False)
+def get_response_cache() -> ResponseCache:
+    options = load_config().response_cache
+    path = None
+    if options.get("disk", False):
+        path = os.path.join(load_config().cache_dir, "responses.sqlite3")
+    return ResponseCache(
+        max_entries=int(options.get("max_entries", DEFAULT_MAX_ENTRIES)),
+        ttl=float(options.get("ttl", DEFAULT_TTL)),
+        path=path,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_context_builder() -> ContextBuilder:
+    options = load_config().context
+    return ContextBuilder(
+        budget=int(options.get("budget", DEFAULT_BUDGET)),
+        summary_budget=int(options.get("summary_budget", DEFAULT_SUMMARY_BUDGET)),
+        fold_threshold=int(options.get("fold_threshold", DEFAULT_FOLD_THRESHOLD)),
+        passage_budget=int(options.get("passage_budget", DEFAULT_PASSAGE_BUDGET)),
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_embedder() -> "Embedder":
+    # [retrieval] embedder = "together" uses the TogetherAI embeddings API;
+    # the default hashing embedder needs no network and no model download.
+    # Retrieval (and numpy with it) is loaded on first use, after sign-in.
+    from embeddings import (
+        DEFAULT_EMBEDDING_MODEL,
+        HASHING_DIMENSIONS,
+        TOGETHERAI_EMBEDDINGS_URL,
+        HashingEmbedder,
+        TogetherEmbedder,
+    )
+
+    config = load_config()
+    options = config.retrieval
+    if options.get("embedder", "hashing") == "together":
+        return TogetherEmbedder(
+            config.togetherai_api_key,
+            model=options.get("model", DEFAULT_EMBEDDING_MODEL),
+            dimensions=int(options.get("dimensions", 768)),
+            url=config.endpoints.get(
+                "togetherai_embeddings_url", TOGETHERAI_EMBEDDINGS_URL
+            ),
+        )
+    return HashingEmbedder(int(options.get("dimensions", HASHING_DIMENSIONS)))
+
+
+@st.cache_resource(show_spinner=False)
+def get_document_store() -> "VectorStore":
+    from vector_index import VectorStore
+
+    embedder = get_embedder()
+    return VectorStore(
+        os.path.join(load_config().cache_dir, "documents"),
+        embedder.name,
+        embedder.dimensions,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_document_ingestor() -> "DocumentIngestor":
+    from documents import CHUNK_OVERLAP, CHUNK_WORDS, DocumentIngestor
+
+    options = load_config().retrieval
+    return DocumentIngestor(
+        get_document_store(),
+        get_embedder(),
+        workers=int(options.get("workers", 0)) or None,
+        words=int(options.get("chunk_words", CHUNK_WORDS)),
+        overlap=int(options.get("chunk_overlap", CHUNK_OVERLAP)),
+    )
+
+
+class Assistant(Credentials):
+    def __init__(self) -> None:
+        super().__init__()
+        with span("app.assistant"):
+            self.assistant_engine = get_assistant_engine(
+                self.config.togetherai_api_key,
+                self.config.togetherai_model,
+                self.config.endpoints.get("togetherai_url", TOGETHERAI_CHAT_URL),
+            )
+            self.context_builder = get_context_builder()
+            self.response_cache = None
+            if self.config.response_cache.get("enabled", True):
+                self.response_cache = get_response_cache()
+
+    @property
+    def document_store(self) -> Optional["VectorStore"]:
+        # Opened on first use rather than in __init__, like get_embedder().
+        if not self.config.retrieval.get("enabled", True):
+            return None
+        return get_document_store()
+
+    def response_cache_key(self, user_id: str, messages: List[dict]) -> str:
+        # With the default "user" scope a cached reply is only ever replayed
+        # to the user it was generated for; "global" shares across users,
+        # except for replies drawn from a user's own course material.
+        scope = self.config.response_cache.get("scope", "user")
+        grounded = any(
+            message["role"] == "system"
+            and message["content"].startswith(PASSAGE_INSTRUCTIONS)
+            for message in messages
+        )
+        return cache_key(
+            self.assistant_engine.model,
+            self.assistant_engine.system_prompt,
+            messages,
+            window=int(self.config.response_cache.get("window", DEFAULT_WINDOW)),
+            scope=user_id if scope == "user" or grounded else None,
+        )
+
+    def ingest_documents(
+        self, user_id: str, files: Iterable[Tuple[str, bytes]]
+    ) -> List[Tuple[str, Optional[int]]]:
+        with span("documents.ingest"):
+            return get_document_ingestor().ingest(user_id, files)
+
+    def has_document(self, user_id: str, digest: str) -> bool:
+        if self.document_store is None:
+            return False
+        return self.document_store.has_document(user_id, digest)
+
+    def list_documents(self, user_id: str) -> List[dict]:
+        if self.document_store is None:
+            return []
+        return self.document_store.documents(user_id)
+
+    def clear_documents(self, user_id: str) -> None:
+        if self.document_store is not None:
+            self.document_store.clear(user_id)
+
+    def retrieve_passages(self, user_id: str, prompt: str) -> List["Passage"]:
+        if self.document_store is None:
+            return []
+        options = self.config.retrieval
+        try:
+            with span("documents.retrieve"):
+                return self.document_store.search(
+                    user_id,
+                    get_embedder().embed([prompt])[0],
+                    k=int(options.get("passages", RETRIEVED_PASSAGES)),
+                    min_score=float(options.get("min_score", MIN_PASSAGE_SCORE)),
+                )
+        except requests.exceptions.RequestException as e:
+            # The reply goes ahead without course material.
+            return []
+
+    def build_assistant_context(
+        self, history: OrderedDict, prompt: str, user_id: Optional[str] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        passages = []
+        if user_id is not None:
+            passages = [
+                (passage.document, passage.text)
+                for passage in self.retrieve_passages(user_id, prompt)
+            ]
+        return self.context_builder.build(
+            history, prompt, self.fetch_chat_summary(), passages
+        )
+
+    def fold_chat_history(
+        self, history: OrderedDict, oldest_included: Optional[str]
+    ) -> None:
+        # Folds turns that dropped out of the token budget into the stored
+        # rolling summary. Runs after the reply has been streamed so it never
+        # delays the first token, and only once enough turns have piled up.
+        if not self.config.context.get("summarize", True):
+            return
+        summary = self.fetch_chat_summary()
+        pending = self.context_builder.pending_fold(history, oldest_included, summary)
+        if not pending:
+            return
+        try:
+            text = self.assistant_engine.complete(
+                self.context_builder.summary_request(pending, summary)
+            )
+        except requests.exceptions.RequestException as e:
+            return
+        self.store_chat_summary({"upto": pending[-1][0], "text": text.strip()})
+
+    def cancel_assistant_reply(self) -> None:
+        cancel = st.session_state.get("assistant_cancel")
+        if cancel is not None:
+            cancel.set()
+
+    def stream_assistant_reply(
+        self, user_id: str, messages: List[dict]
+    ) -> Iterator[str]:
+        # Meant to be consumed by st.write_stream. The reply is stored only if
+        # it streamed to the end; a cancelled or failed reply is dropped.
+        self.cancel_assistant_reply()
+        cancel = st.session_state.assistant_cancel = threading.Event()
+        key = cached = None
+        if self.response_cache is not None:
+            key = self.response_cache_key(user_id, messages)
+            cached = self.response_cache.get(key)
+        if cached is not None:
+            stream = replay(cached)
+        else:
+            stream = self.assistant_engine.stream(messages, cancel)
+        parts = []
+        try:
+            for delta in stream:
+                if cancel.is_set():
+                    return
+                parts.append(delta)
+                yield delta
+        except requests.exceptions.RequestException as e:
+            st.error(
+                f"""
+                # There was an error getting a reply from the assistant.
+                - You may want to try again.
+                - If the problem persists, please contact the developer.
+                """
+            )
+            return
+        if not cancel.is_set():
+            reply = "".join(parts)
+            if key is not None and cached is None:
+                self.response_cache.put(key, reply)
+            self.push_chat_message_for_user(
+                user_id, {"role": "assistant", "content": reply}
+            )
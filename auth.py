@@ -1,83 +1,112 @@
+import hmac
 import json
 import requests
+import secrets
 from credential_loader import Credentials
+from session import UserSession
+from telemetry import span, traced
+from token_verifier import (
+    GOOGLE_CERTS_URL,
+    EmailNotVerified,
+    InvalidIdToken,
+    get_token_verifier,
+)
+from token_refresh import TokenRefreshError
+from circuit_breaker import CircuitOpen
+from transport import (
+    BLOCKED,
+    INVALID_CREDENTIALS,
+    classify_error,
+    get_identity_toolkit,
+)
+from typing import Optional
 import streamlit as st
-import re
+import time
+
+
+# How long a successful password check may stand in for another sign-in
+# during the same sensitive action.
+REAUTH_TTL = 120
+TOO_MANY_ATTEMPTS_WARNING = """
+                ##### Error: Too many attempts.
+                - Please try again later.
+                - You are temporarily blocked from signing in.
+                - Be sure to verify your email.
+                - Get access instantly by resetting your password.
+                - Or, wait for a while and try again.
+                """
 
 
 class FirebaseAuthenticator(Credentials):
 
     def __init__(self) -> None:
         super().__init__()
-        self.firebase_config = self.get_firebase_config().get("apiKey")
+        with span("app.auth_clients"):
+            self.identity_toolkit = get_identity_toolkit(
+                self.get_firebase_config().get("apiKey"),
+                base_url=self.config.identity_toolkit_url,
+                pool_size=self.config.pool_size,
+            )
+            self.token_verifier = get_token_verifier(
+                self.get_firebase_config().get("projectId"),
+                self.config.endpoints.get("certs_url", GOOGLE_CERTS_URL),
+            )
 
+    @traced("identity_toolkit.verifyPassword")
     def sign_in_with_email_and_password(self, email: str, password: str) -> dict:
 
-        request_ref = "https://www.googleapis.com/identitytoolkit/v3/relyingparty/verifyPassword?key={0}".format(
-            self.firebase_config
-        )
-        headers = {"content-type": "application/json; charset=UTF-8"}
-        data = json.dumps(
-            {"email": email, "password": password, "returnSecureToken": True}
+        request_object = self.identity_toolkit.post(
+            "verifyPassword",
+            {"email": email, "password": password, "returnSecureToken": True},
         )
-        request_object = requests.post(request_ref, headers=headers, data=data)
         self.raise_detailed_error(request_object)
         return request_object.json()
 
+    @traced("identity_toolkit.getAccountInfo")
     def get_account_info(self, id_token: str) -> dict:
 
-        request_ref = "https://www.googleapis.com/identitytoolkit/v3/relyingparty/getAccountInfo?key={0}".format(
-            self.firebase_config
+        request_object = self.identity_toolkit.post(
+            "getAccountInfo", {"idToken": id_token}
         )
-        headers = {"content-type": "application/json; charset=UTF-8"}
-        data = json.dumps({"idToken": id_token})
-        request_object = requests.post(request_ref, headers=headers, data=data)
         self.raise_detailed_error(request_object)
         return request_object.json()
 
+    @traced("identity_toolkit.sendEmailVerification")
     def send_email_verification(self, id_token: str) -> dict:
 
-        request_ref = "https://www.googleapis.com/identitytoolkit/v3/relyingparty/getOobConfirmationCode?key={0}".format(
-            self.firebase_config
+        request_object = self.identity_toolkit.post(
+            "getOobConfirmationCode",
+            {"requestType": "VERIFY_EMAIL", "idToken": id_token},
         )
-        headers = {"content-type": "application/json; charset=UTF-8"}
-        data = json.dumps({"requestType": "VERIFY_EMAIL", "idToken": id_token})
-        request_object = requests.post(request_ref, headers=headers, data=data)
         self.raise_detailed_error(request_object)
         return request_object.json()
 
+    @traced("identity_toolkit.sendPasswordReset")
     def send_password_reset_email(self, email: str) -> dict:
 
-        request_ref = "https://www.googleapis.com/identitytoolkit/v3/relyingparty/getOobConfirmationCode?key={0}".format(
-            self.firebase_config
+        request_object = self.identity_toolkit.post(
+            "getOobConfirmationCode",
+            {"requestType": "PASSWORD_RESET", "email": email},
         )
-        headers = {"content-type": "application/json; charset=UTF-8"}
-        data = json.dumps({"requestType": "PASSWORD_RESET", "email": email})
-        request_object = requests.post(request_ref, headers=headers, data=data)
         self.raise_detailed_error(request_object)
         return request_object.json()
 
+    @traced("identity_toolkit.signupNewUser")
     def create_user_with_email_and_password(self, email: str, password: str) -> dict:
 
-        request_ref = "https://www.googleapis.com/identitytoolkit/v3/relyingparty/signupNewUser?key={0}".format(
-            self.firebase_config
+        request_object = self.identity_toolkit.post(
+            "signupNewUser",
+            {"email": email, "password": password, "returnSecureToken": True},
         )
-        headers = {"content-type": "application/json; charset=UTF-8"}
-        data = json.dumps(
-            {"email": email, "password": password, "returnSecureToken": True}
-        )
-        request_object = requests.post(request_ref, headers=headers, data=data)
         self.raise_detailed_error(request_object)
         return request_object.json()
 
+    @traced("identity_toolkit.deleteAccount")
     def delete_user_account(self, id_token: str) -> dict:
 
-        request_ref = "https://www.googleapis.com/identitytoolkit/v3/relyingparty/deleteAccount?key={0}".format(
-            self.firebase_config
+        request_object = self.identity_toolkit.post(
+            "deleteAccount", {"idToken": id_token}
         )
-        headers = {"content-type": "application/json; charset=UTF-8"}
-        data = json.dumps({"idToken": id_token})
-        request_object = requests.post(request_ref, headers=headers, data=data)
         self.raise_detailed_error(request_object)
         return request_object.json()
 
@@ -91,10 +120,12 @@ class FirebaseAuthenticator(Credentials):
     def sign_in(self, email: str, password: str) -> None:
 
         try:
-            id_token = self.sign_in_with_email_and_password(email, password)["idToken"]
-            account_info = self.get_account_info(id_token)
-            user_info = account_info["users"][0]
-            if not user_info["emailVerified"]:
+            tokens = self.sign_in_with_email_and_password(email, password)
+            id_token = tokens["idToken"]
+            try:
+                with span("auth.verify_id_token"):
+                    claims = self.token_verifier.verify(id_token)
+            except EmailNotVerified:
                 self.send_email_verification(id_token)
                 st.session_state.auth_warning = """
                 ##### Email not verified.
@@ -102,48 +133,67 @@ class FirebaseAuthenticator(Credentials):
                 - Please check your spam folder if you don't see it in your inbox.
                 """
             else:
-                user_info["idToken"] = id_token
-                user_info["fullUserInfo"] = account_info
-                st.session_state.user_info = user_info
+                user_session = UserSession.from_claims(claims, tokens)
+                st.session_state.user_session = user_session
+                self.on_sign_in(user_session)
                 st.rerun()
         except requests.exceptions.HTTPError as error:
             error_message = json.loads(error.args[1])["error"]["message"]
-            if error_message in {
-                "INVALID_EMAIL",
-                "EMAIL_NOT_FOUND",
-                "INVALID_PASSWORD",
-                "MISSING_PASSWORD",
-                "INVALID_LOGIN_CREDENTIALS",
-            }:
+            error_class = classify_error(error_message)
+            if error_class == INVALID_CREDENTIALS:
                 st.session_state.auth_warning = """
                 ##### Error: Invalid login credentials.
                 - Please check your email and password.
                 - Forgot your password?
                 - Click the 'Forgot Password' button to reset it.
                 """
-            elif any(
-                re.search(pattern, error_message, re.IGNORECASE)
-                for pattern in {
-                    "TOO_MANY_ATTEMPTS_TRY_LATER",
-                    "USER_DISABLED",
-                    "OPERATION_NOT_ALLOWED",
-                    "USER_NOT_FOUND",
-                    "TOO_MANY_ATTEMPTS_TRY_LATER : Too many unsuccessful login attempts. Please try again later.",
-                }
-            ):
-                st.session_state.auth_warning = """
-                ##### Error: Too many attempts.
-                - Please try again later.
-                - You are temporarily blocked from signing in.
-                - Be sure to verify your email.
-                - Get access instantly by resetting your password.
-                - Or, wait for a while and try again.
-                """
+            elif error_class == BLOCKED:
+                st.session_state.auth_warning = TOO_MANY_ATTEMPTS_WARNING
             else:
                 st.session_state.auth_warning = f"Error: {error_message}"
+        except CircuitOpen:
+            st.session_state.auth_warning = TOO_MANY_ATTEMPTS_WARNING
         except Exception as error:
             st.session_state.auth_warning = f"Error: {error}"
 
+    def on_sign_in(self, user_session: UserSession) -> None:
+
+        # Runs once the session exists, before the rerun into the home page.
+        pass
+
+    def validate_session(self) -> None:
+
+        user_session = st.session_state.get("user_session")
+        if user_session is None or user_session.is_guest:
+            return
+        try:
+            with span("auth.current_token"):
+                id_token = self.token_manager.current(user_session)
+            if st.session_state.get("verified_id_token") == id_token:
+                if time.time() < st.session_state.verified_id_token_exp:
+                    return
+            with span("auth.verify_id_token"):
+                claims = self.token_verifier.verify(id_token)
+            st.session_state.verified_id_token = id_token
+            st.session_state.verified_id_token_exp = claims["exp"]
+        except (InvalidIdToken, TokenRefreshError):
+            del st.session_state.user_session
+            st.session_state.auth_warning = """
+            ##### Session expired.
+            - Please sign in again.
+            """
+        except Exception as error:
+            # The session could not be checked (signing keys or securetoken
+            # unreachable): it is neither trusted nor thrown away.
+            st.error(
+                """
+                # Your session could not be verified right now.
+                - You may want to refresh the page in a moment.
+                - If the problem persists, please contact the developer.
+                """
+            )
+            st.stop()
+
     def create_account(self, email: str, password: str) -> None:
 
         try:
@@ -220,9 +270,13 @@ class FirebaseAuthenticator(Credentials):
     def delete_account(self, password: str) -> None:
 
         try:
-            id_token = self.sign_in_with_email_and_password(
-                st.session_state.user_info["email"], password
-            )["idToken"]
+            # The proof is single-use: a failed delete signs in afresh.
+            id_token = self.reauth_token("delete_account", password)
+            st.session_state.pop("reauth_proof", None)
+            if id_token is None:
+                id_token = self.sign_in_with_email_and_password(
+                    st.session_state.user_session.email, password
+                )["idToken"]
             self.delete_user_account(id_token)
             st.session_state.clear()
             st.session_state.auth_success = """
@@ -233,13 +287,8 @@ class FirebaseAuthenticator(Credentials):
             """
         except requests.exceptions.HTTPError as error:
             error_message = json.loads(error.args[1])["error"]["message"]
-            if error_message in {
-                "INVALID_EMAIL",
-                "EMAIL_NOT_FOUND",
-                "INVALID_PASSWORD",
-                "MISSING_PASSWORD",
-                "INVALID_LOGIN_CREDENTIALS",
-            }:
+            error_class = classify_error(error_message)
+            if error_class == INVALID_CREDENTIALS:
                 st.session_state.auth_warning = f"""
                 ##### Error: Invalid login credentials.
                 - You have to enter your password again to delete your account.
@@ -248,96 +297,64 @@ class FirebaseAuthenticator(Credentials):
                 - Forgot your password?
                 - Click the 'Forgot Password' button to reset it.
                 """
-            elif any(
-                re.search(pattern, error_message, re.IGNORECASE)
-                for pattern in {
-                    "TOO_MANY_ATTEMPTS_TRY_LATER",
-                    "USER_DISABLED",
-                    "OPERATION_NOT_ALLOWED",
-                    "USER_NOT_FOUND",
-                    "TOO_MANY_ATTEMPTS_TRY_LATER : Too many unsuccessful login attempts. Please try again later.",
-                }
-            ):
-                st.session_state.auth_warning = """
-                ##### Error: Too many attempts.
-                - Please try again later.
-                - You are temporarily blocked from signing in.
-                - Be sure to verify your email.
-                - Get access instantly by resetting your password.
-                - Or, wait for a while and try again.
-                """
+            elif error_class == BLOCKED:
+                st.session_state.auth_warning = TOO_MANY_ATTEMPTS_WARNING
             else:
                 st.session_state.auth_warning = f"Error: {error_message}"
+        except CircuitOpen:
+            st.session_state.auth_warning = TOO_MANY_ATTEMPTS_WARNING
         except Exception as error:
             st.session_state.auth_warning = f"Error: {error}"
 
-    def verify_password(self, password: str) -> bool:
+    def verify_password(self, password: str, action: str = "delete_account") -> bool:
 
+        if self.reauth_token(action, password) is not None:
+            return True
         try:
-            id_token = st.session_state.user_info["idToken"]
-            self.sign_in_with_email_and_password(
-                st.session_state.user_info["email"], password
+            tokens = self.sign_in_with_email_and_password(
+                st.session_state.user_session.email, password
             )
+            self.mint_reauth_proof(action, password, tokens)
             return True
-        except requests.exceptions.HTTPError as error:
-            error_message = json.loads(error.args[1])["error"]["message"]
-            if error_message in {
-                "INVALID_EMAIL",
-                "EMAIL_NOT_FOUND",
-                "INVALID_PASSWORD",
-                "MISSING_PASSWORD",
-                "INVALID_LOGIN_CREDENTIALS",
-            }:
-                return False
-            elif any(
-                re.search(pattern, error_message, re.IGNORECASE)
-                for pattern in {
-                    "TOO_MANY_ATTEMPTS_TRY_LATER",
-                    "USER_DISABLED",
-                    "OPERATION_NOT_ALLOWED",
-                    "USER_NOT_FOUND",
-                    "TOO_MANY_ATTEMPTS_TRY_LATER : Too many unsuccessful login attempts. Please try again later.",
-                }
-            ):
-                return False
-            else:
-                return False
+        except (requests.exceptions.HTTPError, CircuitOpen):
+            # Wrong password, throttled account or open circuit alike.
+            return False
         except Exception as error:
             return False
 
-    def get_test_user(self):
-
-        return {
-            "fullUserInfo": {
-                "users": [
-                    {
-                        "localId": "test_user_id",
-                        "email": "test_user_email",
-                        "displayName": "Test User",
-                        "photoUrl": "https://example.com/test_user_photo.jpg",
-                        "emailVerified": True,
-                        "providerUserInfo": [
-                            {
-                                "providerId": "password",
-                                "federatedId": "test_user_federated_id",
-                                "email": "test_user_email",
-                                "displayName": "Test User",
-                                "photoUrl": "https://example.com/test_user_photo.jpg",
-                                "rawId": "test_user_raw_id",
-                            }
-                        ],
-                        "validSince": "1717877715",
-                        "lastLoginAt": "1717886593722",
-                        "createdAt": "1717877715170",
-                        "lastRefreshAt": "2024-06-08T22:43:13.722Z",
-                        "testUser": True,
-                    }
-                ],
-            },
-            "idToken": "test_id_token",
+    def mint_reauth_proof(self, action: str, password: str, tokens: dict) -> None:
+
+        # The fresh id token from a password sign-in, usable for one action
+        # only. The password is kept as a keyed digest so that retyping it
+        # can be checked locally instead of signing in again.
+        key = secrets.token_bytes(32)
+        expires_at = time.time() + min(REAUTH_TTL, int(tokens.get("expiresIn", 3600)))
+        st.session_state.reauth_proof = {
+            "action": action,
+            "idToken": tokens["idToken"],
+            "expiresAt": expires_at,
+            "key": key,
+            "digest": hmac.new(key, password.encode(), "sha256").digest(),
         }
 
+    def reauth_token(self, action: str, password: str) -> Optional[str]:
+
+        proof = st.session_state.get("reauth_proof")
+        if proof is None or proof["action"] != action:
+            return None
+        if time.time() >= proof["expiresAt"]:
+            del st.session_state.reauth_proof
+            return None
+        digest = hmac.new(proof["key"], password.encode(), "sha256").digest()
+        if not hmac.compare_digest(digest, proof["digest"]):
+            return None
+        return proof["idToken"]
+
+    def get_test_user(self) -> UserSession:
+
+        return UserSession.for_guest()
+
     def sign_in_test_user(self):
 
-        st.session_state.user_info = self.get_test_user()
+        st.session_state.user_session = self.get_test_user()
         st.rerun()
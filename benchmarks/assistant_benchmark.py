@@ -0,0 +1,56 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assistant import AssistantEngine
+from standin import StandInServer
+
+
+def measure_stream(engine: AssistantEngine, messages: list) -> tuple:
+    started = time.perf_counter()
+    first_token = None
+    for _ in engine.stream(messages):
+        if first_token is None:
+            first_token = time.perf_counter() - started
+    return first_token * 1000, (time.perf_counter() - started) * 1000
+
+
+def measure_blocking(engine: AssistantEngine, messages: list) -> tuple:
+    started = time.perf_counter()
+    engine.complete(messages)
+    elapsed = (time.perf_counter() - started) * 1000
+    return elapsed, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Time to first token: streamed vs blocking completions"
+    )
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    args = parser.parse_args()
+
+    messages = [{"role": "user", "content": "Explain the central limit theorem."}]
+    with StandInServer(
+        completion_length=args.tokens, token_delay=args.token_delay
+    ) as server:
+        engine = AssistantEngine("bench", "bench-model", url=server.togetherai_url)
+        results = {
+            "streamed": [measure_stream(engine, messages) for _ in range(args.runs)],
+            "blocking": [measure_blocking(engine, messages) for _ in range(args.runs)],
+        }
+
+    print(f"{'mode':<10} {'TTFT p50 ms':>12} {'total p50 ms':>13}")
+    for mode, samples in results.items():
+        first = statistics.median(sample[0] for sample in samples)
+        total = statistics.median(sample[1] for sample in samples)
+        print(f"{mode:<10} {first:>12.2f} {total:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
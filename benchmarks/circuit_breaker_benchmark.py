@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from circuit_breaker import CircuitBreakerRegistry, CircuitOpen
+from standin import StandInServer
+from transport import IdentityToolkitClient, PooledTransport
+
+
+ERRORS = {
+    "429": (429, "RESOURCE_EXHAUSTED"),
+    "400": (400, "TOO_MANY_ATTEMPTS_TRY_LATER : Too many unsuccessful attempts."),
+}
+
+
+def outcome(call) -> str:
+    try:
+        response = call()
+    except CircuitOpen:
+        return "failed fast"
+    except requests.exceptions.RequestException:
+        return "connection error"
+    return "ok" if response.ok else f"http {response.status_code}"
+
+
+def drive(server: StandInServer, call, args) -> tuple:
+    # Every user retries sign-in once per "rerun" for the whole run; the
+    # stand-in rejects everything during the outage and recovers afterwards.
+    outcomes = Counter()
+    lock = threading.Lock()
+    started = time.monotonic()
+    stop_at = started + args.outage + args.recovery
+
+    def user(index: int) -> None:
+        payload = {"email": f"student{index}@example.com", "password": "secret"}
+        while time.monotonic() < stop_at:
+            result = outcome(lambda: call(payload))
+            with lock:
+                outcomes[result] += 1
+            time.sleep(args.rerun_interval)
+
+    server.requests_served = 0
+    server.error_rate = 1.0
+    threads = [
+        threading.Thread(target=user, args=(index,)) for index in range(args.users)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.outage)
+    outage_requests = server.requests_served
+    server.error_rate = 0.0
+    for thread in threads:
+        thread.join()
+    return outcomes, outage_requests, server.requests_served
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Identity Toolkit load during a throttling outage, "
+        "with and without client-side circuit breakers"
+    )
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--error", choices=sorted(ERRORS), default="400")
+    parser.add_argument("--outage", type=float, default=5.0)
+    parser.add_argument("--recovery", type=float, default=5.0)
+    parser.add_argument("--rerun-interval", type=float, default=0.05)
+    parser.add_argument("--base-delay", type=float, default=0.5)
+    parser.add_argument("--max-delay", type=float, default=4.0)
+    args = parser.parse_args()
+
+    with StandInServer(injected_error=ERRORS[args.error]) as server:
+        transport = PooledTransport(pool_size=args.users)
+        client = IdentityToolkitClient(
+            "bench", transport=transport, base_url=server.identity_toolkit_url
+        )
+        client.breakers = CircuitBreakerRegistry(
+            base_delay=args.base_delay, max_delay=args.max_delay
+        )
+        url = client.urls["verifyPassword"]
+        results = {
+            "unguarded": drive(
+                server, lambda payload: transport.post(url, json.dumps(payload)), args
+            ),
+            "guarded": drive(
+                server, lambda payload: client.post("verifyPassword", payload), args
+            ),
+        }
+
+    print(f"{'mode':<10} {'outage reqs':>12} {'total reqs':>11}  outcomes")
+    for mode, (outcomes, outage_requests, total_requests) in results.items():
+        summary = ", ".join(f"{name}: {count}" for name, count in outcomes.items())
+        print(f"{mode:<10} {outage_requests:>12,} {total_requests:>11,}  {summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+from standin import StandInServer
+
+
+def percentile(samples: list, pct: float) -> float:
+    # Nearest-rank percentile; pct is 0-100.
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def seed_history(server: StandInServer, uid: str, messages: int) -> list:
+    # Pushes alternating user/assistant messages straight into the stand-in's
+    # database; returns their push keys, oldest first.
+    keys = []
+    for index in range(messages):
+        role = "user" if index % 2 == 0 else "assistant"
+        keys.append(
+            server.rtdb.push(
+                ["users", uid, "chat_history"],
+                {"role": role, "content": f"message {index} " + "lorem ipsum " * 20},
+            )
+        )
+    return keys
@@ -0,0 +1,93 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import seed_history
+from history_benchmark import BenchRealtimeDB, firebase_app
+from history_cache import ChatHistoryCache
+from history_export import read_export_file
+from standin import StandInServer
+
+
+class ExportRealtimeDB(BenchRealtimeDB):
+    def __init__(self, app, uid: str, cache_path: str) -> None:
+        super().__init__(app, uid)
+        self.history_cache = ChatHistoryCache(cache_path)
+
+    def flush_chat_messages(self, user_id=None) -> None:
+        pass
+
+
+def export_to(db: ExportRealtimeDB, path: str, compress: bool) -> tuple:
+    # Returns (seconds, bytes written, peak traced memory).
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = 0
+    with open(path, "wb") as file:
+        for chunk in db.export_user_chat_history(compress=compress):
+            file.write(chunk)
+            size += len(chunk)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, size, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Streaming NDJSON export and batched import throughput"
+    )
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory, StandInServer() as server:
+        app = firebase_app(server)
+        seed_history(server, "source", args.messages)
+        source = ExportRealtimeDB(app, "source", os.path.join(directory, "a.db"))
+        exports = {}
+        for compress in (False, True):
+            name = "export.ndjson.gz" if compress else "export.ndjson"
+            path = os.path.join(directory, name)
+            elapsed, size, peak = export_to(source, path, compress)
+            exports[compress] = path
+            label = "export (gzip)" if compress else "export"
+            rows.append((label, args.messages / elapsed, size, peak))
+
+        # Imports see RTDB-like round trips; exports above ran without them.
+        server.latency = args.latency
+        for concurrency in args.concurrency:
+            uid = f"target-{concurrency}"
+            target = ExportRealtimeDB(app, uid, os.path.join(directory, f"{uid}.db"))
+            started = time.perf_counter()
+            written = target.import_user_chat_history(
+                read_export_file(exports[True]),
+                batch_size=args.batch_size,
+                concurrency=concurrency,
+                checkpoint_path=os.path.join(directory, f"{uid}.checkpoint"),
+            )
+            elapsed = time.perf_counter() - started
+            assert written == args.messages
+            assert server.rtdb.get(["users", uid, "chat_history"], {}) == (
+                server.rtdb.get(["users", "source", "chat_history"], {})
+            )
+            rows.append((f"import x{concurrency}", written / elapsed, None, None))
+
+    print(f"{args.messages:,} messages, import batches of {args.batch_size}")
+    print(f"{'mode':<16} {'msgs/s':>10} {'bytes':>14} {'peak MiB':>9}")
+    for label, rate, size, peak in rows:
+        size_text = f"{size:,}" if size is not None else "-"
+        peak_text = f"{peak / 2**20:.1f}" if peak is not None else "-"
+        print(f"{label:<16} {rate:>10,.0f} {size_text:>14} {peak_text:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common import seed_history
+from load_benchmark import secrets
+from standin import StandInServer
+from streamlit.runtime.fragment import MemoryFragmentStorage
+from streamlit.runtime.scriptrunner.script_requests import RerunData
+from streamlit.testing.v1 import AppTest, app_test
+from streamlit.testing.v1.element_tree import parse_tree_from_messages
+from streamlit.testing.v1.local_script_runner import (
+    LocalScriptRunner,
+    require_widgets_deltas,
+)
+
+
+class FragmentScriptRunner(LocalScriptRunner):
+    # AppTest builds a new runner, with empty fragment storage, for every
+    # run, and can only request full reruns. This one keeps the fragments
+    # registered by the last full run and, when fragment_id is set, asks for
+    # a run of that fragment alone, as the frontend does when a widget inside
+    # a fragment changes. CPU time of the script thread is recorded per run.
+    storage = MemoryFragmentStorage()
+    fragment_id = None
+    cpu = 0.0
+    widgets = {}
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._fragment_storage = FragmentScriptRunner.storage
+
+    def run(self, widget_state=None, query_params=None, timeout=3, page_hash=""):
+        fragment_id = FragmentScriptRunner.fragment_id
+        self.request_rerun(
+            RerunData(
+                widget_states=widget_state,
+                page_script_hash=page_hash,
+                fragment_id_queue=[fragment_id] if fragment_id else [],
+            )
+        )
+        if not self._script_thread:
+            self.start()
+        require_widgets_deltas(self, timeout)
+        messages = self.forward_msgs()
+        if fragment_id is None:
+            FragmentScriptRunner.widgets = dict(widget_fragments(messages))
+        return parse_tree_from_messages(messages)
+
+    def _run_script(self, rerun_data: RerunData) -> None:
+        started = time.thread_time()
+        try:
+            super()._run_script(rerun_data)
+        finally:
+            FragmentScriptRunner.cpu = time.thread_time() - started
+
+
+def widget_fragments(messages: list):
+    # (widget id, id of the fragment that rendered it) for every widget.
+    for message in messages:
+        if message.WhichOneof("type") != "delta" or not message.delta.fragment_id:
+            continue
+        element = message.delta.new_element
+        kind = element.WhichOneof("type")
+        widget = getattr(element, kind) if kind else None
+        if widget is not None and "id" in type(widget).DESCRIPTOR.fields_by_name:
+            yield widget.id, message.delta.fragment_id
+
+
+def interact(app: AppTest, action, fragment: bool) -> tuple:
+    # A full run brings the tree up to date, then the action's widget change
+    # is sent either as a full rerun (every interaction before fragments) or
+    # as a run of the fragment holding the widget.
+    FragmentScriptRunner.fragment_id = None
+    app.run()
+    widget = action(app)
+    if fragment:
+        FragmentScriptRunner.fragment_id = FragmentScriptRunner.widgets[widget.id]
+    started = time.perf_counter()
+    app.run()
+    elapsed = time.perf_counter() - started
+    FragmentScriptRunner.fragment_id = None
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    return FragmentScriptRunner.cpu * 1000, elapsed * 1000
+
+
+def toggle_register(app: AppTest):
+    toggle = app.toggle(key="login_register")
+    return toggle.set_value(not toggle.value)
+
+
+def search(app: AppTest):
+    field = app.text_input(key="search_query")
+    return field.input("lorem" if field.value != "lorem" else "message")
+
+
+def reset_password(app: AppTest):
+    return next(button for button in app.button if "Reset Password" in button.label)
+
+
+def send_chat(app: AppTest):
+    return app.chat_input[0].set_value("Explain the central limit theorem.")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Script-thread CPU per interaction, as a full rerun and as "
+        "a fragment rerun, against the local Firebase stand-in"
+    )
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--history", type=int, default=200)
+    parser.add_argument("--completion-length", type=int, default=50)
+    args = parser.parse_args()
+    app_test.LocalScriptRunner = FragmentScriptRunner
+
+    results = []
+    with tempfile.TemporaryDirectory() as cache_dir, StandInServer(
+        completion_length=args.completion_length
+    ) as server:
+        seed_history(server, "uid-student0", args.history)
+        app_secrets = secrets(server, cache_dir, True)
+        signed_out = AppTest.from_file(os.path.join(ROOT, "main.py"))
+        signed_out.secrets.update(app_secrets)
+        signed_out.run()
+        signed_in = AppTest.from_file(os.path.join(ROOT, "main.py"))
+        signed_in.secrets.update(app_secrets)
+        signed_in.run()
+        signed_in.text_input[0].input("student0@example.com")
+        signed_in.text_input[1].input("secret")
+        next(
+            button for button in signed_in.button if button.label == "Sign In"
+        ).click().run()
+        for label, app, action in (
+            ("auth form: toggle register", signed_out, toggle_register),
+            ("sidebar: search history", signed_in, search),
+            ("settings: reset password", signed_in, reset_password),
+            ("chat: send a message", signed_in, send_chat),
+        ):
+            samples = {}
+            for fragment in (False, True):
+                runs = [interact(app, action, fragment) for _ in range(args.iterations)]
+                samples[fragment] = (
+                    statistics.median(cpu for cpu, _ in runs),
+                    statistics.median(wall for _, wall in runs),
+                )
+            results.append((label, samples))
+
+    print(
+        f"{args.iterations} interactions each, {args.history} messages of history; "
+        "script-thread CPU and wall time, medians"
+    )
+    print(
+        f"{'interaction':<28} {'full CPU':>9} {'frag CPU':>9} "
+        f"{'full ms':>9} {'frag ms':>9}"
+    )
+    for label, samples in results:
+        (full_cpu, full_wall), (frag_cpu, frag_wall) = samples[False], samples[True]
+        print(
+            f"{label:<28} {full_cpu:>9.2f} {frag_cpu:>9.2f} "
+            f"{full_wall:>9.2f} {frag_wall:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
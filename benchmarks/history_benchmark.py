@@ -0,0 +1,79 @@
+import argparse
+import functools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import firebase
+from common import seed_history
+from db import RealtimeDB, write_chat_messages
+from session import UserSession
+from standin import StandInServer
+from write_behind import WriteBehindRegistry
+
+
+class BenchRealtimeDB(RealtimeDB):
+    # Skips the Streamlit-bound constructor; the stand-in ignores auth.
+    id_token = None
+
+    def __init__(self, app: firebase.Firebase, uid: str) -> None:
+        self.app = app
+        self.db = app.database()
+        self.user_session = UserSession(uid, None, None)
+        self.chat_writes = WriteBehindRegistry(
+            functools.partial(write_chat_messages, app), background=False
+        )
+
+
+def firebase_app(server: StandInServer) -> firebase.Firebase:
+    return firebase.initialize_app(
+        {
+            "apiKey": "bench",
+            "authDomain": "bench.firebaseapp.com",
+            "databaseURL": server.url,
+            "projectId": "bench",
+            "storageBucket": "bench.appspot.com",
+        }
+    )
+
+
+def timed(call) -> tuple:
+    started = time.perf_counter()
+    result = call()
+    return (time.perf_counter() - started) * 1000, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Full vs paged vs delta history")
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--new-messages", type=int, default=2)
+    args = parser.parse_args()
+
+    with StandInServer() as server:
+        uid = "bench-user"
+        keys = seed_history(server, uid, args.messages)
+        db = BenchRealtimeDB(firebase_app(server), uid)
+
+        full_ms, full = timed(db.fetch_user_chat_history)
+        pages = db.iter_user_chat_history_pages(args.page_size, newest_first=True)
+        first_page_ms, first_page = timed(lambda: next(pages))
+        paged_ms, paged = timed(
+            lambda: sum(
+                len(page) for page in db.iter_user_chat_history_pages(args.page_size)
+            )
+        )
+        seed_history(server, uid, args.new_messages)
+        delta_ms, delta = timed(lambda: db.fetch_user_chat_history_since(keys[-1]))
+
+    print(f"{'mode':<24} {'ms':>10} {'messages':>10}")
+    print(f"{'full fetch':<24} {full_ms:>10.2f} {len(full):>10}")
+    print(f"{'newest page':<24} {first_page_ms:>10.2f} {len(first_page):>10}")
+    print(f"{'all pages':<24} {paged_ms:>10.2f} {paged:>10}")
+    print(f"{'delta since last key':<24} {delta_ms:>10.2f} {len(delta):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import base64
+import io
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+from image_pipeline import prepare_image, to_chunks
+
+
+def photo(width: int, height: int, seed: int) -> bytes:
+    rng = random.Random(seed)
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(200):
+        x, y = rng.randrange(width), rng.randrange(height)
+        radius = rng.randrange(10, width // 8)
+        colour = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x, y, x + radius, y + radius), fill=colour)
+    noise = Image.effect_noise((width, height), 40).convert("RGB")
+    image = Image.blend(image, noise, 0.25)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def screenshot(width: int, height: int, seed: int) -> bytes:
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for row in range(0, height, 24):
+        draw.text((20, row), "lorem ipsum " * rng.randrange(2, 12), fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def corpus() -> list:
+    images = [photo(4032, 3024, seed) for seed in range(3)]
+    images += [photo(1280, 960, seed) for seed in range(3, 6)]
+    images += [screenshot(1920, 1080, seed) for seed in range(4)]
+    return images
+
+
+def wire_size(data: bytes) -> int:
+    return len(base64.b64encode(data))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Bytes on the wire: raw inline images vs the storage pipeline"
+    )
+    parser.add_argument(
+        "--duplicates",
+        type=int,
+        default=2,
+        help="how many times each image is uploaded",
+    )
+    args = parser.parse_args()
+
+    uploads = corpus() * args.duplicates
+    raw_write = sum(wire_size(data) for data in uploads)
+    raw_read = raw_write
+
+    stored = set()
+    pipeline_write = pipeline_read_full = pipeline_read_thumb = 0
+    largest_write = 0
+    for data in uploads:
+        prepared = prepare_image(data)
+        if prepared.digest not in stored:
+            stored.add(prepared.digest)
+            for variant in (prepared.full, prepared.thumbnail):
+                chunks = to_chunks(variant)
+                pipeline_write += sum(len(chunk) for chunk in chunks.values())
+                largest_write = max(largest_write, *map(len, chunks.values()))
+        pipeline_read_full += wire_size(prepared.full)
+        pipeline_read_thumb += wire_size(prepared.thumbnail)
+
+    def row(label: str, baseline: int, value: int) -> None:
+        saving = 100 * (1 - value / baseline)
+        print(f"{label:<26} {baseline:>14,} {value:>14,} {saving:>8.1f}%")
+
+    print(f"{len(uploads)} uploads, {len(stored)} unique images")
+    print(f"{'':<26} {'raw bytes':>14} {'pipeline':>14} {'saved':>9}")
+    row("upload", raw_write, pipeline_write)
+    row("fetch (full)", raw_read, pipeline_read_full)
+    row("fetch (thumbnail)", raw_read, pipeline_read_thumb)
+    print(f"largest single write: {largest_write:,} bytes")
+
+
+if __name__ == "__main__":
+    main()
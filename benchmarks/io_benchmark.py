@@ -0,0 +1,106 @@
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import percentile, seed_history
+from db import read_chat_history_pages, read_chat_summary
+from history_benchmark import firebase_app
+from io_executor import get_io_executor
+from standin import StandInServer
+
+
+def home_page_reads(app, uid: str) -> None:
+    # The RTDB reads of one home-page render: the rolling summary and the
+    # newest page of the chat history. Each render builds its own Database
+    # handle, as a script run does.
+    database = app.database()
+    read_chat_summary(database, uid, None)
+    next(read_chat_history_pages(app.database(), uid, lambda: None, newest_first=True))
+
+
+def burst(app, users: int, tabs: int, renders: int) -> list:
+    # Every tab of every user renders the home page `renders` times, all
+    # tabs at once, as after a deploy or at the start of a class when
+    # everyone signs in together. Returns per-render latencies in ms.
+    samples = []
+    lock = threading.Lock()
+    start = threading.Barrier(users * tabs)
+
+    def tab(uid: str) -> None:
+        start.wait()
+        for _ in range(renders):
+            started = time.perf_counter()
+            home_page_reads(app, uid)
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                samples.append(elapsed)
+
+    threads = [
+        threading.Thread(target=tab, args=(f"uid-student{user}",))
+        for user in range(users)
+        for _ in range(tabs)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Home-page RTDB reads from many concurrent sessions, with and "
+        "without the shared I/O executor"
+    )
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--tabs-per-user", type=int, default=3)
+    parser.add_argument("--renders", type=int, default=5)
+    parser.add_argument("--history", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    io = get_io_executor()
+    results = {}
+    with StandInServer(latency=args.latency) as server:
+        for user in range(args.users):
+            seed_history(server, f"uid-student{user}", args.history)
+        app = firebase_app(server)
+        for user in range(args.users):
+            home_page_reads(app, f"uid-student{user}")
+        for mode in ("off", "on"):
+            io.enabled = mode == "on"
+            calls, coalesced = io.calls, io.coalesced
+            served = server.requests_served
+            started = time.perf_counter()
+            samples = burst(app, args.users, args.tabs_per_user, args.renders)
+            elapsed = time.perf_counter() - started
+            results[mode] = (
+                samples,
+                elapsed,
+                server.requests_served - served,
+                io.coalesced - coalesced,
+            )
+
+    print(
+        f"{args.users} users x {args.tabs_per_user} tabs x {args.renders} renders, "
+        f"{args.latency * 1000:.0f} ms stand-in latency"
+    )
+    print(
+        f"{'I/O executor':<14} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8} "
+        f"{'wall s':>7} {'requests':>9} {'coalesced':>10}"
+    )
+    for mode, (samples, elapsed, served, coalesced) in results.items():
+        print(
+            f"{mode:<14} {percentile(samples, 50):>8.1f} "
+            f"{percentile(samples, 99):>8.1f} {statistics.mean(samples):>8.1f} "
+            f"{elapsed:>7.2f} {served:>9,} {coalesced:>10,}"
+        )
+
+
+if __name__ == "__main__":
+    main()
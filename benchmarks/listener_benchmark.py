@@ -0,0 +1,90 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import seed_history
+from history_benchmark import firebase_app
+from history_stream import ChatHistoryListeners
+from standin import StandInServer
+
+
+def wait_for(condition, timeout: float = 10.0) -> float:
+    started = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - started > timeout:
+            raise TimeoutError("listener did not catch up")
+        time.sleep(0.0005)
+    return (time.perf_counter() - started) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Chat history on rerun: full re-fetch vs streaming mirror"
+    )
+    parser.add_argument("--messages", type=int, default=5_000)
+    parser.add_argument("--reruns", type=int, default=50)
+    parser.add_argument("--remote-writes", type=int, default=50)
+    args = parser.parse_args()
+
+    uid = "student"
+    path = ["users", uid, "chat_history"]
+    with StandInServer(keep_alive=1.0) as server:
+        seed_history(server, uid, args.messages)
+        database = firebase_app(server).database()
+
+        refetch = []
+        for _ in range(args.reruns):
+            started = time.perf_counter()
+            history = database.child("users").child(uid).child("chat_history").get()
+            refetch.append((time.perf_counter() - started) * 1000)
+        assert len(history.val()) == args.messages
+
+        listeners = ChatHistoryListeners(server.url)
+        started = time.perf_counter()
+        listener = listeners.subscribe(uid, None)
+        listener.ready.wait()
+        first_snapshot = (time.perf_counter() - started) * 1000
+        mirror = []
+        for _ in range(args.reruns):
+            started = time.perf_counter()
+            history = listener.read(None)
+            mirror.append((time.perf_counter() - started) * 1000)
+        assert len(history) == args.messages
+
+        # Messages written by another device or tab.
+        propagation = []
+        for index in range(args.remote_writes):
+            key = server.rtdb.push(path, {"role": "user", "content": f"remote {index}"})
+            propagation.append(wait_for(lambda: key in listener.read(None)))
+
+        # A dropped stream resumes from the last key instead of starting over.
+        served = server.requests_served
+        server.drop_streams()
+        key = server.rtdb.push(path, {"role": "user", "content": "while reconnecting"})
+        resume = wait_for(lambda: key in listener.read(None))
+        expected = server.rtdb.get(path, {})
+        consistent = dict(listener.read(None)) == expected
+        listeners.close(uid)
+
+    print(f"{args.messages:,} messages, {args.reruns} reruns")
+    print(f"{'read per rerun':<22} {'p50 ms':>9} {'max ms':>9}")
+    for label, samples in (("full re-fetch", refetch), ("streaming mirror", mirror)):
+        print(f"{label:<22} {statistics.median(samples):>9.3f} {max(samples):>9.3f}")
+    print(f"first snapshot: {first_snapshot:.1f} ms")
+    print(
+        f"remote write visible after: p50 {statistics.median(propagation):.2f} ms, "
+        f"max {max(propagation):.2f} ms"
+    )
+    print(
+        f"resumed after drop in {resume:.1f} ms using "
+        f"{server.requests_served - served} request(s); mirror consistent: "
+        f"{consistent}"
+    )
+
+
+if __name__ == "__main__":
+    main()
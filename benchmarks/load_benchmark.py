@@ -0,0 +1,238 @@
+import argparse
+import gc
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common import percentile, seed_history
+from io_executor import get_io_executor
+from standin import StandInServer
+from streamlit.testing.v1 import AppTest
+
+
+STEPS = ("auth_page", "sign_in", "home_page", "chat")
+
+
+def secrets(server: StandInServer, cache_dir: str, prefetch: bool) -> dict:
+    return {
+        "firebase_config": {
+            "apiKey": "bench-api-key",
+            "authDomain": "bench.firebaseapp.com",
+            "projectId": server.project_id,
+            "storageBucket": "bench.appspot.com",
+            "messagingSenderId": "0",
+            "appId": "1:0:web:0",
+            "measurementId": "G-0",
+            "databaseURL": server.url,
+        },
+        "togetherai": {"api_key": "bench-togetherai-key"},
+        "endpoints": {
+            "identity_toolkit_url": server.identity_toolkit_url,
+            "certs_url": server.certs_url,
+            "securetoken_url": server.securetoken_url,
+            "togetherai_url": server.togetherai_url,
+        },
+        "cache": {"dir": cache_dir},
+        "realtime": {"prefetch": prefetch},
+    }
+
+
+class SimulatedSession:
+    # One browser tab: every step is a single script rerun driven through
+    # AppTest, exactly as the Streamlit server would run it. Tabs of the same
+    # user share an email address.
+    def __init__(self, user: int, app_secrets: dict, timeout: float) -> None:
+        self.email = f"student{user}@example.com"
+        self.app = AppTest.from_file(
+            os.path.join(ROOT, "main.py"), default_timeout=timeout
+        )
+        self.app.secrets.update(app_secrets)
+
+    def auth_page(self) -> None:
+        self.app.run()
+
+    def sign_in(self) -> None:
+        self.app.text_input[0].input(self.email)
+        self.app.text_input[1].input("secret")
+        next(button for button in self.app.button if button.label == "Sign In").click()
+        self.app.run()
+
+    def home_page(self) -> None:
+        self.app.run()
+
+    def chat(self) -> None:
+        self.app.chat_input[0].set_value("Explain the central limit theorem.")
+        self.app.run()
+
+    def failed(self) -> bool:
+        return bool(self.app.exception) or not len(self.app.chat_input)
+
+
+class ThreadSampler:
+    # Peak number of live threads in the process while driving sessions.
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.peak = threading.active_count()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self) -> "ThreadSampler":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+
+def drive(sessions: list, concurrency: int) -> tuple:
+    samples = defaultdict(list)
+    failures = 0
+    lock = threading.Lock()
+
+    def flow(session: SimulatedSession) -> None:
+        nonlocal failures
+        timings = {}
+        for step in STEPS:
+            started = time.perf_counter()
+            getattr(session, step)()
+            timings[step] = (time.perf_counter() - started) * 1000
+        with lock:
+            for step, elapsed in timings.items():
+                samples[step].append(elapsed)
+            failures += session.failed()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(flow, sessions))
+    return samples, failures, time.perf_counter() - started
+
+
+def memory_per_session(make_session, count: int) -> float:
+    # Sessions are kept alive so that everything they pin (session state,
+    # caches filled on their behalf, AppTest bookkeeping) is counted.
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = [make_session(index) for index in range(count)]
+    for session in sessions:
+        for step in STEPS:
+            getattr(session, step)()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Drive simulated Streamlit sessions through sign-in, home "
+        "page and chat against the local Firebase stand-in"
+    )
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="sessions driven in parallel threads",
+    )
+    parser.add_argument("--history", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--completion-length", type=int, default=50)
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    parser.add_argument("--memory-sessions", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument(
+        "--tabs-per-user",
+        type=int,
+        default=1,
+        help="sessions signed in as the same user, whose reads can coalesce",
+    )
+    parser.add_argument(
+        "--io-executor",
+        choices=("on", "off"),
+        default="on",
+        help="off: every request blocks its own script thread, as before",
+    )
+    parser.add_argument(
+        "--prefetch",
+        choices=("on", "off"),
+        default="on",
+        help="off: the home page loads what it needs one read at a time",
+    )
+    args = parser.parse_args()
+    io = get_io_executor()
+    io.enabled = args.io_executor == "on"
+
+    with tempfile.TemporaryDirectory() as cache_dir, StandInServer(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        completion_length=args.completion_length,
+        token_delay=args.token_delay,
+    ) as server:
+        app_secrets = secrets(server, cache_dir, args.prefetch == "on")
+        total = args.sessions + args.memory_sessions
+        for index in range(total + 1):
+            seed_history(server, f"uid-student{index}", args.history)
+
+        def make_session(index: int) -> SimulatedSession:
+            return SimulatedSession(
+                index // args.tabs_per_user, app_secrets, args.timeout
+            )
+
+        # Warm the process-wide resources the way the first visitor would.
+        drive([make_session(total * args.tabs_per_user)], 1)
+        served = server.requests_served
+        calls, coalesced = io.calls, io.coalesced
+        with ThreadSampler() as threads:
+            samples, failures, elapsed = drive(
+                [make_session(index) for index in range(args.sessions)],
+                args.concurrency,
+            )
+        served = server.requests_served - served
+        calls, coalesced = io.calls - calls, io.coalesced - coalesced
+        heap = memory_per_session(
+            lambda index: make_session(args.sessions + index), args.memory_sessions
+        )
+
+    reruns = sum(len(values) for values in samples.values())
+    print(
+        f"{args.sessions} sessions ({args.tabs_per_user} per user), concurrency "
+        f"{args.concurrency}, I/O executor {args.io_executor}, "
+        f"prefetch {args.prefetch}, {failures} failed"
+    )
+    print(
+        f"{served:,} stand-in requests; {calls:,} submitted to the I/O executor, "
+        f"{coalesced:,} coalesced; peak threads {threads.peak} "
+        f"(I/O pool {io.stats()['threads']})"
+    )
+    print(
+        f"throughput: {args.sessions / elapsed:.2f} sessions/s, "
+        f"{reruns / elapsed:.2f} reruns/s"
+    )
+    print(f"{'step':<10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for step in STEPS:
+        values = samples[step]
+        print(
+            f"{step:<10} {percentile(values, 50):>9.2f} {percentile(values, 95):>9.2f} "
+            f"{percentile(values, 99):>9.2f} {statistics.mean(values):>9.2f}"
+        )
+    print(f"heap per live session: {heap / 1024:,.1f} KiB (incl. AppTest)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SECRETS = """
+[firebase_config]
+apiKey = "bench-api-key"
+authDomain = "bench.firebaseapp.com"
+projectId = "bench"
+storageBucket = "bench.appspot.com"
+messagingSenderId = "0"
+appId = "1:0:web:0"
+measurementId = "G-0"
+databaseURL = "{database_url}"
+
+[togetherai]
+api_key = "bench-togetherai-key"
+
+[cache]
+dir = "{cache_dir}"
+"""
+
+
+def write_secrets(directory: str, database_url: str) -> None:
+    os.makedirs(os.path.join(directory, ".streamlit"), exist_ok=True)
+    with open(os.path.join(directory, ".streamlit", "secrets.toml"), "w") as file:
+        file.write(
+            SECRETS.format(
+                database_url=database_url, cache_dir=os.path.join(directory, "cache")
+            )
+        )
+
+
+def legacy_app_class():
+    # App as it was before config and the Firebase app were cached: every
+    # rerun re-read each secret (the Firebase config twice, through the
+    # Credentials base shared by both mixins) and initialized a new Firebase
+    # app. Only __init__ is kept; it is what every rerun pays.
+    import firebase
+    import streamlit as st
+    from transport import DEFAULT_POOL_SIZE, get_identity_toolkit
+
+    class Credentials:
+        def __init__(self) -> None:
+            self.firebase_config = self.get_firebase_config()
+            self.togetherai_credentials = st.secrets["togetherai"]["api_key"]
+            self.db_url = st.secrets["firebase_config"]["databaseURL"]
+
+        def get_firebase_config(self) -> dict:
+            return {
+                "apiKey": st.secrets["firebase_config"]["apiKey"],
+                "authDomain": st.secrets["firebase_config"]["authDomain"],
+                "projectId": st.secrets["firebase_config"]["projectId"],
+                "storageBucket": st.secrets["firebase_config"]["storageBucket"],
+                "messagingSenderId": st.secrets["firebase_config"]["messagingSenderId"],
+                "appId": st.secrets["firebase_config"]["appId"],
+                "measurementId": st.secrets["firebase_config"]["measurementId"],
+                "databaseURL": st.secrets["firebase_config"]["databaseURL"],
+            }
+
+    class FirebaseAuthenticator(Credentials):
+        def __init__(self) -> None:
+            super().__init__()
+            transport_config = st.secrets.get("transport", {})
+            self.identity_toolkit = get_identity_toolkit(
+                self.get_firebase_config().get("apiKey"),
+                pool_size=int(transport_config.get("pool_size", DEFAULT_POOL_SIZE)),
+            )
+
+    class RealtimeDB(Credentials):
+        def __init__(self) -> None:
+            super().__init__()
+            self.app = firebase.initialize_app(self.firebase_config)
+            if st.session_state.get("user_info") is not None:
+                self.db = self.app.database()
+                self.user_info = st.session_state.user_info["fullUserInfo"]
+                self.id_token = st.session_state.user_info["idToken"]
+
+    class App(FirebaseAuthenticator, RealtimeDB):
+        pass
+
+    return App
+
+
+def measure(call, iterations: int) -> list:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def rerun_script() -> None:
+    # Runs as an AppTest script, so that st.cache_resource and session state
+    # behave as they do under `streamlit run`; without a runtime every cached
+    # call would be a miss.
+    import streamlit as st
+    from main import App
+    from rerun_benchmark import legacy_app_class, measure
+    from session import UserSession
+
+    class CurrentApp(App):
+        # st.set_page_config may only run once per script run; the legacy
+        # App is measured without it too.
+        def set_page_config(self) -> None:
+            pass
+
+    iterations = st.session_state.iterations
+    LegacyApp = legacy_app_class()
+    signed_in = {
+        "user_info": {
+            "fullUserInfo": {"users": [{"localId": "uid-bench"}]},
+            "idToken": "bench-token",
+        },
+        "user_session": UserSession("uid-bench", "bench@example.com", "bench-token"),
+    }
+    # The first construction of each fills the process-wide caches.
+    CurrentApp()
+    LegacyApp()
+    results = {}
+    for state in ("signed out", "signed in"):
+        for mode, construct, key in (
+            ("before", LegacyApp, "user_info"),
+            ("after", CurrentApp, "user_session"),
+        ):
+            if state == "signed in":
+                st.session_state[key] = signed_in[key]
+            results[f"{mode}, {state}"] = measure(construct, iterations)
+            st.session_state.pop(key, None)
+    st.session_state.results = results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Per-rerun cost of constructing App, before and after config "
+        "and the Firebase app were cached"
+    )
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_secrets(directory, "http://127.0.0.1:9000")
+        os.chdir(directory)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from streamlit.testing.v1 import AppTest
+
+        app = AppTest.from_function(rerun_script, default_timeout=600)
+        app.session_state.iterations = args.iterations
+        app.run()
+        if app.exception:
+            sys.exit(app.exception[0].message)
+        results = app.session_state.results
+
+    print(f"{'App()':<20} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8}")
+    for mode, samples in results.items():
+        ordered = sorted(samples)
+        print(
+            f"{mode:<20} {ordered[len(ordered) // 2]:>8.3f} "
+            f"{ordered[int(len(ordered) * 0.99)]:>8.3f} "
+            f"{statistics.mean(samples):>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
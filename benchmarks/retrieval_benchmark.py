@@ -0,0 +1,121 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import percentile
+from documents import DocumentIngestor, prepare_document
+from embeddings import HashingEmbedder
+from vector_index import VectorStore
+
+
+def synthetic_documents(documents: int, words: int, vocabulary: int, seed: int = 3):
+    # Zipf-distributed words, generated lazily so only in-flight documents
+    # are ever held in memory.
+    rng = np.random.default_rng(seed)
+    terms = np.array([f"t{rank}" for rank in range(vocabulary)])
+    weights = 1 / np.arange(1, vocabulary + 1)
+    weights /= weights.sum()
+    for index in range(documents):
+        text = " ".join(terms[rng.choice(vocabulary, words, p=weights)].tolist())
+        yield f"notes-{index}.txt", f"document {index}\n{text}".encode()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Document ingestion throughput and vector retrieval latency"
+    )
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    parser.add_argument("--chunks-per-document", type=int, default=500)
+    parser.add_argument("--chunk-words", type=int, default=64)
+    parser.add_argument("--overlap", type=int, default=8)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--vocabulary", type=int, default=30_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    step = args.chunk_words - args.overlap
+    words = args.chunks_per_document * step + args.overlap
+    documents = -(-args.chunks // args.chunks_per_document)
+    embedder = HashingEmbedder(args.dimensions)
+
+    # Same work on one document in this process, for the per-chunk cost.
+    name, sample = next(synthetic_documents(1, words, args.vocabulary, seed=99))
+    started = time.perf_counter()
+    inline = prepare_document(sample, embedder, args.chunk_words, args.overlap)
+    inline_rate = len(inline.passages) / (time.perf_counter() - started)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = VectorStore(directory, embedder.name, embedder.dimensions)
+        ingestor = DocumentIngestor(
+            store,
+            embedder,
+            workers=args.workers,
+            words=args.chunk_words,
+            overlap=args.overlap,
+        )
+        ingestor.executor().submit(int).result()  # Spawn the workers first.
+        started = time.perf_counter()
+        results = ingestor.ingest(
+            "student", synthetic_documents(documents, words, args.vocabulary)
+        )
+        ingest = time.perf_counter() - started
+        ingestor.close()
+        chunks = sum(count for _, count in results)
+        vectors = os.path.getsize(store.vectors_path("student"))
+
+        rng = np.random.default_rng(5)
+        queries = [
+            " ".join(f"t{rank}" for rank in rng.integers(0, 2_000, 6))
+            for _ in range(args.queries)
+        ]
+        store.search("student", embedder.embed(queries[:1])[0], k=args.k)
+        embed, search = [], []
+        for query in queries:
+            started = time.perf_counter()
+            vector = embedder.embed([query])[0]
+            embedded = time.perf_counter()
+            store.search("student", vector, k=args.k)
+            embed.append((embedded - started) * 1000)
+            search.append((time.perf_counter() - embedded) * 1000)
+
+        # Baseline: one product over the whole matrix and a full sort.
+        matrix = store.matrix("student")
+        full = []
+        for query in queries[:10]:
+            vector = embedder.embed([query])[0]
+            started = time.perf_counter()
+            np.argsort(-(np.asarray(matrix) @ vector))[: args.k]
+            full.append((time.perf_counter() - started) * 1000)
+        del matrix
+
+    print(
+        f"{chunks:,} chunks of {args.chunk_words} words in {len(results):,} "
+        f"documents, {args.dimensions} dimensions, {args.workers} worker(s)"
+    )
+    print(
+        f"ingestion: {ingest:.1f} s, {chunks / ingest:,.0f} chunks/s "
+        f"(one document in-process: {inline_rate:,.0f} chunks/s); "
+        f"vectors {vectors / 1e6:.0f} MB"
+    )
+    print(f"{'query (k=' + str(args.k) + ')':<28} {'p50 ms':>9} {'p99 ms':>9}")
+    for label, samples in (
+        ("embed query", embed),
+        ("blocked top-k + passages", search),
+        ("full product + argsort", full),
+    ):
+        print(
+            f"{label:<28} {statistics.median(samples):>9.2f} "
+            f"{percentile(samples, 99):>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
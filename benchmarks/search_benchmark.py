@@ -0,0 +1,114 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import percentile
+from search_index import SearchIndexes
+
+SUBJECTS = (
+    "derivative integral limit matrix eigenvalue vector theorem proof lemma "
+    "probability variance distribution regression entropy photosynthesis "
+    "mitochondria enzyme protein equilibrium momentum velocity acceleration "
+    "thermodynamics electron molecule reaction oxidation essay thesis citation"
+).split()
+
+
+def synthetic_history(messages: int, vocabulary: int, seed: int = 7) -> list:
+    # Zipf-distributed filler words plus a couple of subject terms, so some
+    # terms are in most messages and most terms are rare, as in real text.
+    rng = random.Random(seed)
+    words = [f"w{rank}" for rank in range(vocabulary)]
+    weights = [1 / (rank + 1) for rank in range(vocabulary)]
+    history = []
+    for index in range(messages):
+        content = rng.choices(words, weights, k=rng.randint(8, 60))
+        content += rng.sample(SUBJECTS, 2)
+        role = "user" if index % 2 == 0 else "assistant"
+        history.append((f"-M{index:09d}", {"role": role, "content": " ".join(content)}))
+    return history
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Chat history search: inverted index vs scanning every message"
+    )
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--push-batch", type=int, default=1)
+    args = parser.parse_args()
+
+    history = synthetic_history(args.messages, args.vocabulary)
+    rng = random.Random(11)
+    queries = [
+        rng.choice(
+            [
+                f"{rng.choice(SUBJECTS)}",
+                f"{rng.choice(SUBJECTS)} {rng.choice(SUBJECTS)}",
+                f"w{rng.randint(0, 50)} {rng.choice(SUBJECTS)[:4]}",
+                f"w{rng.randint(1000, args.vocabulary - 1)}",
+            ]
+        )
+        for _ in range(args.queries)
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        indexes = SearchIndexes(directory)
+        index = indexes.get("student")
+        # As push_chat_message_for_user does: a few messages per call.
+        started = time.perf_counter()
+        for start in range(0, len(history), args.push_batch):
+            index.add(history[start : start + args.push_batch])
+        build = time.perf_counter() - started
+        index.save()
+        snapshot = os.path.getsize(index.snapshot_path)
+
+        indexes.loaded.clear()
+        started = time.perf_counter()
+        index = indexes.get("student")
+        load = time.perf_counter() - started
+        assert len(index) == args.messages
+
+        indexed = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, offset=0, limit=10)
+            indexed.append((time.perf_counter() - started) * 1000)
+        deep = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, offset=100, limit=10)
+            deep.append((time.perf_counter() - started) * 1000)
+
+    scan = []
+    for query in queries[: max(1, args.queries // 10)]:
+        needle = query.split()[0]
+        started = time.perf_counter()
+        [key for key, message in history if needle in message["content"]]
+        scan.append((time.perf_counter() - started) * 1000)
+
+    print(f"{args.messages:,} messages, {args.queries} queries")
+    print(
+        f"build {build:.1f} s ({build / args.messages * 1e6:.0f} µs per message), "
+        f"snapshot {snapshot / 1e6:.2f} MB, load {load * 1000:.0f} ms"
+    )
+    print(f"{'query':<26} {'p50 ms':>9} {'p99 ms':>9}")
+    for label, samples in (
+        ("index, first page", indexed),
+        ("index, page 11", deep),
+        ("substring scan, 1 term", scan),
+    ):
+        print(
+            f"{label:<26} {statistics.median(samples):>9.2f} "
+            f"{percentile(samples, 99):>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session import UserSession
+
+
+def account_info_layout(fields: dict) -> dict:
+    # What sign_in kept before: the whole getAccountInfo response, with the
+    # user record doubling as user_info.
+    account_info = {
+        "kind": "identitytoolkit#GetAccountInfoResponse",
+        "users": [
+            {
+                "localId": fields["uid"],
+                "email": fields["email"],
+                "passwordHash": "UkVEQUNURUQ=",
+                "emailVerified": True,
+                "passwordUpdatedAt": 1717877715170,
+                "providerUserInfo": [
+                    {
+                        "providerId": "password",
+                        "federatedId": fields["email"],
+                        "email": fields["email"],
+                        "rawId": fields["email"],
+                    }
+                ],
+                "validSince": "1717877715",
+                "lastLoginAt": "1717886593722",
+                "createdAt": "1717877715170",
+                "lastRefreshAt": "2024-06-08T22:43:13.722Z",
+            }
+        ],
+    }
+    user_info = account_info["users"][0]
+    user_info["idToken"] = fields["id_token"]
+    user_info["fullUserInfo"] = account_info
+    return user_info
+
+
+def claims_dict_layout(fields: dict) -> dict:
+    user_info = {
+        "localId": fields["uid"],
+        "email": fields["email"],
+        "emailVerified": True,
+        "idToken": fields["id_token"],
+        "refreshToken": fields["refresh_token"],
+        "expiresAt": fields["expires_at"],
+    }
+    user_info["fullUserInfo"] = {"users": [user_info]}
+    return user_info
+
+
+def slots_layout(fields: dict) -> UserSession:
+    return UserSession(
+        fields["uid"],
+        fields["email"],
+        fields["id_token"],
+        fields["refresh_token"],
+        fields["expires_at"],
+    )
+
+
+def session_fields(index: int) -> dict:
+    return {
+        "uid": f"uid-{index:028d}",
+        "email": f"student{index}@example.com",
+        "id_token": f"eyJ{index:x}." + "x" * 900,
+        "refresh_token": f"AMf-{index:x}" + "y" * 200,
+        "expires_at": 1717890000.0 + index,
+    }
+
+
+def footprint(build, fields: list) -> float:
+    # Token and id strings are created up front and shared by every layout,
+    # so only the per-session structure is measured.
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = [build(entry) for entry in fields]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del sessions
+    return (after - before) / len(fields)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Per-session memory of the session state user record"
+    )
+    parser.add_argument("--sessions", type=int, default=10_000)
+    args = parser.parse_args()
+
+    fields = [session_fields(index) for index in range(args.sessions)]
+    strings = sum(
+        sys.getsizeof(value) for value in fields[0].values() if isinstance(value, str)
+    )
+    results = {
+        "getAccountInfo dict": footprint(account_info_layout, fields),
+        "claims dict": footprint(claims_dict_layout, fields),
+        "UserSession": footprint(slots_layout, fields),
+    }
+
+    print(f"{args.sessions:,} sessions; shared strings ~{strings:,} bytes/session")
+    print(f"{'layout':<20} {'bytes/session':>14} {'total MiB':>10}")
+    for layout, per_session in results.items():
+        total = per_session * args.sessions / (1024 * 1024)
+        print(f"{layout:<20} {per_session:>14,.0f} {total:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+import datetime
+import json
+import queue
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import jwt
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+
+class LocalSigningKey:
+    # Stands in for Google's securetoken signing keys: an RSA key pair and a
+    # self-signed certificate served in the same {kid: pem} shape.
+    def __init__(self, kid: str = "standin-key") -> None:
+        self.kid = kid
+        self.private_key = rsa.generate_private_key(
+            public_exponent=65537, key_size=2048
+        )
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "standin")])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        certificate = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(self.private_key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(self.private_key, hashes.SHA256())
+        )
+        self.certificate_pem = certificate.public_bytes(
+            serialization.Encoding.PEM
+        ).decode()
+
+    def certificates(self) -> dict:
+        return {self.kid: self.certificate_pem}
+
+    def mint(
+        self,
+        project_id: str,
+        uid: str,
+        email: str,
+        email_verified: bool = True,
+        lifetime: int = 3600,
+        now: float = None,
+    ) -> str:
+        now = int(time.time() if now is None else now)
+        claims = {
+            "iss": "https://securetoken.google.com/" + project_id,
+            "aud": project_id,
+            "auth_time": now,
+            "user_id": uid,
+            "sub": uid,
+            "iat": now,
+            "exp": now + lifetime,
+            "email": email,
+            "email_verified": email_verified,
+        }
+        return jwt.encode(
+            claims, self.private_key, algorithm="RS256", headers={"kid": self.kid}
+        )
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Unbuffered, the status line and headers go out in one segment and the
+    # body in another; on a kept-alive connection the body then waits on the
+    # client's delayed ACK (Nagle), adding ~40 ms that a real server does
+    # not. Responses are buffered and sent when handled (streams flush each
+    # chunk), and TCP_NODELAY covers whatever is still written in pieces.
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def read_body(self) -> bytes:
+        length = int(self.headers.get("content-length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def send_json(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json; charset=UTF-8")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_message(self, status: int, message: str) -> None:
+        self.send_json(
+            status, {"error": {"code": status, "message": message, "errors": []}}
+        )
+
+    def inject(self) -> bool:
+        self.server.requests_served += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            self.send_error_message(*self.server.injected_error)
+            return True
+        return False
+
+    def rtdb_request(self):
+        parts = urlsplit(self.path)
+        if not parts.path.endswith(".json"):
+            return None, None
+        segments = parts.path[: -len(".json")].split("/")
+        path = [segment for segment in segments if segment]
+        query = {
+            key: json.loads(values[0])
+            for key, values in parse_qs(parts.query).items()
+            if key not in {"auth", "print"}
+        }
+        return path, query
+
+    def do_GET(self) -> None:
+        if self.inject():
+            return
+        path, query = self.rtdb_request()
+        if path is not None and "text/event-stream" in self.headers.get("accept", ""):
+            self.stream_events(path, query)
+        elif path is not None:
+            self.send_json(200, self.server.rtdb.get(path, query))
+        elif self.path == "/certs":
+            body = json.dumps(self.server.signing_key.certificates()).encode()
+            self.send_response(200)
+            self.send_header("content-type", "application/json; charset=UTF-8")
+            self.send_header("cache-control", "public, max-age=3600")
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error_message(404, "NOT_FOUND")
+
+    def do_POST(self) -> None:
+        body = self.read_body()
+        if self.inject():
+            return
+        path, _ = self.rtdb_request()
+        if path is not None:
+            key = self.server.rtdb.push(path, json.loads(body))
+            self.send_json(200, {"name": key})
+        elif self.path.startswith("/v1/chat/completions"):
+            self.chat_completion(json.loads(body))
+        elif self.path.startswith("/identitytoolkit/v3/relyingparty/"):
+            endpoint = self.path.split("?")[0].rsplit("/", 1)[-1]
+            payload = json.loads(body or b"{}")
+            self.send_json(200, self.server.identity_toolkit(endpoint, payload))
+        elif self.path.startswith("/securetoken/v1/token"):
+            self.send_json(200, self.server.secure_token(json.loads(body or b"{}")))
+        else:
+            self.send_error_message(404, "NOT_FOUND")
+
+    def send_chunk(self, data: bytes) -> None:
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def send_event(self, event: str, data) -> None:
+        payload = json.dumps(data).encode()
+        self.send_chunk(b"event: %s\ndata: %s\n\n" % (event.encode(), payload))
+
+    def stream_events(self, path: list, query: dict) -> None:
+        # RTDB REST streaming: an initial put of the whole location, then a
+        # put for every change below it, with keep-alives in between. Streams
+        # end when the server drops them (see StandInServer.drop_streams).
+        events = self.server.rtdb.subscribe(path)
+        generation = self.server.stream_generation
+        self.close_connection = True
+        try:
+            self.send_response(200)
+            self.send_header("content-type", "text/event-stream")
+            self.send_header("transfer-encoding", "chunked")
+            self.end_headers()
+            snapshot = self.server.rtdb.get(path, query)
+            self.send_event("put", {"path": "/", "data": snapshot})
+            while self.server.stream_generation == generation:
+                try:
+                    event = events.get(timeout=self.server.keep_alive)
+                except queue.Empty:
+                    self.send_event("keep-alive", None)
+                    continue
+                if event is not None:
+                    self.send_event(*event)
+            self.send_chunk(b"")
+        except OSError:
+            pass
+        finally:
+            self.server.rtdb.unsubscribe(events)
+
+    def chat_completion(self, payload: dict) -> None:
+        tokens = self.server.completion_tokens(payload)
+        if not payload.get("stream"):
+            time.sleep(self.server.token_delay * len(tokens))
+            content = "".join(tokens)
+            self.send_json(200, {"choices": [{"message": {"content": content}}]})
+            return
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+        for token in tokens:
+            time.sleep(self.server.token_delay)
+            event = {"choices": [{"delta": {"content": token}}]}
+            self.send_chunk(b"data: %s\n\n" % json.dumps(event).encode())
+        self.send_chunk(b"data: [DONE]\n\n")
+        self.send_chunk(b"")
+
+    def do_PUT(self) -> None:
+        body = self.read_body()
+        if self.inject():
+            return
+        path, _ = self.rtdb_request()
+        value = json.loads(body)
+        self.server.rtdb.set(path, value)
+        self.send_json(200, value)
+
+    def do_PATCH(self) -> None:
+        body = self.read_body()
+        if self.inject():
+            return
+        path, _ = self.rtdb_request()
+        value = json.loads(body)
+        self.server.rtdb.update(path, value)
+        self.send_json(200, value)
+
+    def do_DELETE(self) -> None:
+        if self.inject():
+            return
+        path, _ = self.rtdb_request()
+        self.server.rtdb.set(path, None)
+        self.send_json(200, None)
+
+
+class RealtimeDatabase:
+    # In-memory tree implementing the subset of the RTDB REST API used by
+    # db.py: get with key-ordered queries, push, set, multi-path update,
+    # remove and streaming change events.
+    def __init__(self) -> None:
+        self.root = {}
+        self.lock = threading.Lock()
+        self.push_counter = 0
+        self.subscribers = []
+
+    def subscribe(self, path: list) -> queue.Queue:
+        events = queue.Queue()
+        with self.lock:
+            self.subscribers.append((path, events))
+        return events
+
+    def unsubscribe(self, events: queue.Queue) -> None:
+        with self.lock:
+            self.subscribers = [
+                item for item in self.subscribers if item[1] is not events
+            ]
+
+    def wake(self) -> None:
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for _, events in subscribers:
+            events.put(None)
+
+    def notify(self, path: list, value) -> None:
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for watched, events in subscribers:
+            if path[: len(watched)] == watched:
+                relative = "/" + "/".join(path[len(watched) :])
+                events.put(("put", {"path": relative, "data": value}))
+            elif watched[: len(path)] == path:
+                events.put(("put", {"path": "/", "data": self.get(watched, {})}))
+
+    def node(self, path: list, create: bool = False):
+        node = self.root
+        for segment in path:
+            if not isinstance(node, dict) or (segment not in node and not create):
+                return None
+            node = node.setdefault(segment, {})
+        return node
+
+    def get(self, path: list, query: dict):
+        with self.lock:
+            node = self.node(path)
+            if not isinstance(node, dict) or not query:
+                return node or None
+            items = sorted(node.items()) if "orderBy" in query else list(node.items())
+        if "startAt" in query:
+            items = [item for item in items if item[0] >= query["startAt"]]
+        if "endAt" in query:
+            items = [item for item in items if item[0] <= query["endAt"]]
+        if "limitToFirst" in query:
+            items = items[: query["limitToFirst"]]
+        if "limitToLast" in query:
+            items = items[-query["limitToLast"] :]
+        if query.get("shallow"):
+            return {key: True for key, _ in items} or None
+        return dict(items) or None
+
+    def set(self, path: list, value) -> None:
+        with self.lock:
+            if not path:
+                self.root = value or {}
+            else:
+                parent = self.node(path[:-1], create=True)
+                if value is None:
+                    parent.pop(path[-1], None)
+                else:
+                    parent[path[-1]] = value
+        if self.subscribers:
+            self.notify(path, value)
+
+    def update(self, path: list, values: dict) -> None:
+        for key, value in values.items():
+            self.set(path + [segment for segment in key.split("/") if segment], value)
+
+    def push(self, path: list, value) -> str:
+        with self.lock:
+            self.push_counter += 1
+            key = f"-S{self.push_counter:012d}"
+        self.set(path + [key], value)
+        return key
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        injected_error: tuple = (400, "TOO_MANY_ATTEMPTS_TRY_LATER"),
+        project_id: str = "standin",
+        completion_length: int = 200,
+        token_delay: float = 0.005,
+        keep_alive: float = 30.0,
+    ) -> None:
+        super().__init__((host, port), StandInHandler)
+        self.project_id = project_id
+        self.signing_key = LocalSigningKey()
+        self.rtdb = RealtimeDatabase()
+        self.completion_length = completion_length
+        self.token_delay = token_delay
+        self.latency = latency
+        self.error_rate = error_rate
+        self.injected_error = injected_error
+        self.requests_served = 0
+        self.keep_alive = keep_alive
+        self.stream_generation = 0
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def identity_toolkit_url(self) -> str:
+        return f"{self.url}/identitytoolkit/v3/relyingparty"
+
+    @property
+    def togetherai_url(self) -> str:
+        return f"{self.url}/v1/chat/completions"
+
+    def completion_tokens(self, payload: dict) -> list:
+        prompt = payload["messages"][-1]["content"]
+        return [f"token{index} " for index in range(self.completion_length)] + [
+            f"(re: {prompt[:20]})"
+        ]
+
+    @property
+    def certs_url(self) -> str:
+        return f"{self.url}/certs"
+
+    @property
+    def securetoken_url(self) -> str:
+        return f"{self.url}/securetoken/v1/token"
+
+    def secure_token(self, payload: dict) -> dict:
+        local_id = payload["refresh_token"].replace("refresh-token-", "", 1)
+        email = local_id.replace("uid-", "", 1) + "@example.com"
+        return {
+            "id_token": self.signing_key.mint(self.project_id, local_id, email),
+            "refresh_token": payload["refresh_token"],
+            "expires_in": "3600",
+            "user_id": local_id,
+        }
+
+    def identity_toolkit(self, endpoint: str, payload: dict) -> dict:
+        email = payload.get("email", "student@example.com")
+        local_id = "uid-" + email.split("@")[0]
+        if endpoint in {"verifyPassword", "signupNewUser"}:
+            return {
+                "localId": local_id,
+                "email": email,
+                "idToken": self.signing_key.mint(self.project_id, local_id, email),
+                "refreshToken": "refresh-token-" + local_id,
+                "expiresIn": "3600",
+                "registered": True,
+            }
+        if endpoint == "getAccountInfo":
+            return {
+                "users": [{"localId": local_id, "email": email, "emailVerified": True}]
+            }
+        return {"email": email}
+
+    def start(self) -> "StandInServer":
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def drop_streams(self) -> None:
+        # Ends every open event stream, as a network blip or RTDB rebalancing
+        # would; listeners are expected to reconnect and resume.
+        self.stream_generation += 1
+        self.rtdb.wake()
+
+    def stop(self) -> None:
+        self.drop_streams()
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "StandInServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
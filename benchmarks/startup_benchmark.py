@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# Modules the sign-in page must render without. Each is loaded on first use
+# once a user is signed in (or never, for the image pipeline).
+DEFERRED = ("firebase", "numpy", "pandas", "pyarrow", "jwt", "cryptography", "PIL")
+
+
+def import_times(module: str) -> dict:
+    # -X importtime in a fresh interpreter: module -> cumulative microseconds.
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def cold_start(app_secrets: dict) -> dict:
+    # Runs in its own interpreter (see --child), so nothing is imported or
+    # cached yet when the first script run starts.
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(ROOT, "main.py"), default_timeout=60)
+    app.secrets.update(app_secrets)
+    started = time.perf_counter()
+    app.run()
+    auth = time.perf_counter() - started
+    loaded = [name for name in DEFERRED if name in sys.modules]
+    app.text_input[0].input("student0@example.com")
+    app.text_input[1].input("secret")
+    next(button for button in app.button if button.label == "Sign In").click()
+    started = time.perf_counter()
+    app.run()
+    home = time.perf_counter() - started
+    started = time.perf_counter()
+    app.run()
+    rerun = time.perf_counter() - started
+    return {
+        "auth_ms": auth * 1000,
+        "home_ms": home * 1000,
+        "rerun_ms": rerun * 1000,
+        "loaded": loaded,
+        "failed": bool(app.exception) or not len(app.chat_input),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Cold-start import time and first-render latency of the "
+        "sign-in and home pages, checked against a regression budget"
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--history", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--budget-import-ms", type=float, default=250.0)
+    parser.add_argument("--budget-auth-ms", type=float, default=600.0)
+    parser.add_argument("--budget-home-ms", type=float, default=1500.0)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(cold_start(json.loads(args.child))))
+        return
+    # Only the parent runs the stand-in, which itself loads requests, PyJWT
+    # and cryptography; the children must start without them.
+    from common import seed_history
+    from load_benchmark import secrets
+    from standin import StandInServer
+
+    # Imports main.py adds on top of Streamlit's own.
+    baseline = import_times("streamlit")
+    imports = []
+    for _ in range(args.runs):
+        times = import_times("main")
+        imports.append((times["main"] - times["streamlit"]) / 1000)
+    extra = import_times("main")
+    heaviest = sorted(
+        (
+            name
+            for name in extra
+            if name not in baseline and "." not in name and name != "main"
+        ),
+        key=lambda name: -extra[name],
+    )[:8]
+
+    runs = []
+    with tempfile.TemporaryDirectory() as cache_dir, StandInServer(
+        latency=args.latency
+    ) as server:
+        seed_history(server, "uid-student0", args.history)
+        for index in range(args.runs):
+            app_secrets = secrets(server, os.path.join(cache_dir, str(index)), True)
+            result = subprocess.run(
+                [sys.executable, __file__, "--child", json.dumps(app_secrets)],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    import_ms = statistics.median(imports)
+    auth_ms = statistics.median(run["auth_ms"] for run in runs)
+    home_ms = statistics.median(run["home_ms"] for run in runs)
+    rerun_ms = statistics.median(run["rerun_ms"] for run in runs)
+    loaded = sorted({name for run in runs for name in run["loaded"]})
+    print(f"{args.runs} cold starts, {args.history} messages of history")
+    print(
+        f"import main (beyond streamlit): {import_ms:.0f} ms; heaviest: "
+        + ", ".join(f"{name} {extra[name] / 1000:.0f} ms" for name in heaviest)
+    )
+    print(f"{'first render':<28} {'p50 ms':>9} {'budget':>9}")
+    print(f"{'sign-in page':<28} {auth_ms:>9.1f} {args.budget_auth_ms:>9.0f}")
+    print(f"{'sign in -> home page':<28} {home_ms:>9.1f} {args.budget_home_ms:>9.0f}")
+    print(f"{'home page rerun':<28} {rerun_ms:>9.1f}")
+    print(f"deferred modules loaded by the sign-in page: {', '.join(loaded) or 'none'}")
+
+    over = []
+    if import_ms > args.budget_import_ms:
+        over.append(f"import {import_ms:.0f} ms > {args.budget_import_ms:.0f} ms")
+    if auth_ms > args.budget_auth_ms:
+        over.append(f"sign-in page {auth_ms:.0f} ms > {args.budget_auth_ms:.0f} ms")
+    if home_ms > args.budget_home_ms:
+        over.append(f"home page {home_ms:.0f} ms > {args.budget_home_ms:.0f} ms")
+    if loaded:
+        over.append(f"sign-in page loaded {', '.join(loaded)}")
+    if any(run["failed"] for run in runs):
+        over.append("a run did not reach the chat input")
+    if over:
+        sys.exit("over budget: " + "; ".join(over))
+
+
+if __name__ == "__main__":
+    main()
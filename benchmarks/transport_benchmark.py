@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from common import percentile
+from standin import StandInServer
+from transport import JSON_HEADERS, IdentityToolkitClient, PooledTransport
+
+
+def run(call, requests_count: int, concurrency: int) -> list:
+    def timed(_):
+        started = time.perf_counter()
+        call()
+        return (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(timed, range(requests_count)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Pooled vs unpooled Identity Toolkit latency"
+    )
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    # getAccountInfo rather than verifyPassword: the stand-in signs an RS256
+    # token for every sign-in, and that CPU, not the connection, would be
+    # what gets measured.
+    payload = {"idToken": "bench"}
+    with StandInServer(latency=args.latency) as server:
+        url = f"{server.identity_toolkit_url}/getAccountInfo?key=bench"
+        client = IdentityToolkitClient(
+            "bench",
+            transport=PooledTransport(pool_size=args.pool_size),
+            base_url=server.identity_toolkit_url,
+        )
+        data = json.dumps(payload)
+        results = {
+            "unpooled": run(
+                lambda: requests.post(url, headers=JSON_HEADERS, data=data),
+                args.requests,
+                args.concurrency,
+            ),
+            "pooled": run(
+                lambda: client.post("getAccountInfo", payload),
+                args.requests,
+                args.concurrency,
+            ),
+        }
+
+    print(f"{'mode':<10} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8}")
+    for mode, samples in results.items():
+        print(
+            f"{mode:<10} {percentile(samples, 50):>8.3f} "
+            f"{percentile(samples, 99):>8.3f} {statistics.mean(samples):>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import mmap
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Cached blobs are rechecked against their validator after this many seconds.
+DEFAULT_REVALIDATE_AFTER = 300.0
+
+
+class BlobEntry:
+    __slots__ = ("size", "validator", "validated_at")
+
+    def __init__(
+        self, size: int, validator: Optional[str], validated_at: float
+    ) -> None:
+        self.size = size
+        self.validator = validator
+        self.validated_at = validated_at
+
+
+class BlobCache:
+    # Size-bounded LRU of immutable blobs stored one file per key. Hits are
+    # returned as read-only memory maps, so serving a large image again does
+    # not copy it into a new bytes object. Concurrent misses for the same key
+    # share one download.
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        revalidate_after: float = DEFAULT_REVALIDATE_AFTER,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.total = 0
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        # Files left by a previous process are kept, but revalidated on first
+        # use since their validators were not persisted.
+        files = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.startswith("."):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = BlobEntry(size, None, 0.0)
+            self.total += size
+        self.evict()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def open(self, name: str) -> Optional[mmap.mmap]:
+        try:
+            with open(self.path(name), "rb") as file:
+                return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Evicted by another thread, or an empty file that cannot be mapped.
+            self.discard(name)
+            return None
+
+    def put(self, name: str, data: bytes, validator: Optional[str] = None) -> None:
+        handle, temporary = tempfile.mkstemp(dir=self.directory, prefix=".")
+        with os.fdopen(handle, "wb") as file:
+            file.write(data)
+        os.replace(temporary, self.path(name))
+        with self.lock:
+            previous = self.entries.pop(name, None)
+            if previous is not None:
+                self.total -= previous.size
+            self.entries[name] = BlobEntry(len(data), validator, self.clock())
+            self.total += len(data)
+        self.evict()
+
+    def discard(self, name: str) -> None:
+        with self.lock:
+            entry = self.entries.pop(name, None)
+            if entry is not None:
+                self.total -= entry.size
+        try:
+            os.remove(self.path(name))
+        except OSError:
+            pass
+
+    def evict(self) -> None:
+        # Unlinking a file that is still mapped is fine on POSIX; the mapping
+        # stays valid until it is closed.
+        victims = []
+        with self.lock:
+            while self.total > self.max_bytes and len(self.entries) > 1:
+                name, entry = self.entries.popitem(last=False)
+                self.total -= entry.size
+                victims.append(name)
+        for name in victims:
+            try:
+                os.remove(self.path(name))
+            except OSError:
+                pass
+
+    def lookup(
+        self, name: str, validate: Optional[Callable[[], Optional[str]]]
+    ) -> Optional[mmap.mmap]:
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                return None
+            self.entries.move_to_end(name)
+            stale = (
+                validate is not None
+                and self.clock() - entry.validated_at >= self.revalidate_after
+            )
+        if stale:
+            current = validate()
+            if current is None or current != entry.validator:
+                self.discard(name)
+                return None
+            entry.validated_at = self.clock()
+        return self.open(name)
+
+    def get_or_fetch(
+        self,
+        name: str,
+        fetch: Callable[[], Optional[bytes]],
+        validate: Optional[Callable[[], Optional[str]]] = None,
+    ) -> Optional[mmap.mmap]:
+        cached = self.lookup(name, validate)
+        if cached is not None:
+            return cached
+        with self.lock:
+            future = self.in_flight.get(name)
+            leader = future is None
+            if leader:
+                future = self.in_flight[name] = Future()
+        if not leader:
+            future.result()
+            return self.open(name)
+        try:
+            validator = validate() if validate is not None else None
+            data = fetch()
+            if data:
+                self.put(name, data, validator)
+            future.set_result(None)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[name]
+        return self.open(name) if data else None
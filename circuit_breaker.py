@@ -0,0 +1,139 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+
+FAILURE_THRESHOLD = 3
+BASE_DELAY = 1.0
+MAX_DELAY = 300.0
+MAX_IN_FLIGHT = 32
+# How long a call may wait for a global in-flight slot before failing fast.
+SLOT_TIMEOUT = 5.0
+MAX_BREAKERS = 10_000
+
+
+class CircuitOpen(Exception):
+    def __init__(self, key: str, retry_after: float) -> None:
+        super().__init__(f"{key} is unavailable for {retry_after:.1f}s")
+        self.key = key
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    # closed -> open after `threshold` consecutive failures; open fails fast
+    # until the backoff expires, then half-open lets exactly one probe call
+    # through. Every reopening doubles the backoff (with jitter) up to
+    # max_delay; a success closes the circuit and resets it.
+    def __init__(
+        self,
+        key: str,
+        threshold: int = FAILURE_THRESHOLD,
+        base_delay: float = BASE_DELAY,
+        max_delay: float = MAX_DELAY,
+        clock: Callable[[], float] = time.monotonic,
+        jitter: Callable[[], float] = random.random,
+    ) -> None:
+        self.key = key
+        self.threshold = threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.jitter = jitter
+        self.failures = 0
+        self.openings = 0
+        self.open_until = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self.lock:
+            if self.open_until is None:
+                return
+            now = self.clock()
+            if now < self.open_until:
+                raise CircuitOpen(self.key, self.open_until - now)
+            if self.probing:
+                raise CircuitOpen(self.key, 0.0)
+            self.probing = True
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.failures = 0
+            self.openings = 0
+            self.open_until = None
+            self.probing = False
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                delay = min(self.max_delay, self.base_delay * 2**self.openings)
+                self.open_until = self.clock() + delay * (0.5 + self.jitter() / 2)
+                self.openings += 1
+                self.failures = 0
+            self.probing = False
+
+    def release(self) -> None:
+        # The call finished without a verdict (e.g. a user error), so a
+        # half-open circuit may send its next probe.
+        with self.lock:
+            self.probing = False
+
+
+class CircuitBreakerRegistry:
+    def __init__(
+        self,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        slot_timeout: float = SLOT_TIMEOUT,
+        max_breakers: int = MAX_BREAKERS,
+        **breaker_options,
+    ) -> None:
+        self.breaker_options = breaker_options
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.slot_timeout = slot_timeout
+        self.max_breakers = max_breakers
+        self.breakers = OrderedDict()
+        self.lock = threading.Lock()
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        with self.lock:
+            breaker = self.breakers.get(key)
+            if breaker is None:
+                breaker = self.breakers[key] = CircuitBreaker(
+                    key, **self.breaker_options
+                )
+                while len(self.breakers) > self.max_breakers:
+                    self.breakers.popitem(last=False)
+            else:
+                self.breakers.move_to_end(key)
+            return breaker
+
+    @contextmanager
+    def guard(self, *keys: Optional[str]) -> Iterator[list]:
+        # Yields the breakers for the given keys (None entries are skipped);
+        # the caller reports the outcome on each. Breakers that were not told
+        # anything are released on exit.
+        breakers = []
+        try:
+            for key in keys:
+                if key is not None:
+                    breaker = self.breaker(key)
+                    breaker.before_call()
+                    breakers.append(breaker)
+        except CircuitOpen:
+            for breaker in breakers:
+                breaker.release()
+            raise
+        if not self.slots.acquire(timeout=self.slot_timeout):
+            for breaker in breakers:
+                breaker.release()
+            raise CircuitOpen("in-flight limit", self.slot_timeout)
+        try:
+            yield breakers
+        finally:
+            self.slots.release()
+            for breaker in breakers:
+                breaker.release()
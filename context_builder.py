@@ -0,0 +1,176 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Mapping, Optional, Sequence, Tuple
+
+
+DEFAULT_BUDGET = 3000
+DEFAULT_SUMMARY_BUDGET = 400
+# Fold older turns into the summary once this many tokens have dropped out
+# of the window, so that summaries are regenerated rarely.
+DEFAULT_FOLD_THRESHOLD = 1000
+DEFAULT_MAX_CACHED = 100_000
+# Tokens of the budget that retrieved course material may take.
+DEFAULT_PASSAGE_BUDGET = 1000
+# Role markers and separators the chat template adds around each message.
+MESSAGE_OVERHEAD = 4
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+PASSAGE_INSTRUCTIONS = (
+    "Excerpts from the student's course material that may be relevant. Use them "
+    "when they help and name the document you drew on."
+)
+SUMMARY_INSTRUCTIONS = (
+    "Update the running summary of this tutoring conversation with the new "
+    "messages below. Keep every fact, definition, formula and open question the "
+    "student may refer back to. Reply with the summary only, in at most {words} "
+    "words."
+)
+
+
+def count_tokens(text: str) -> int:
+    # Close enough to BPE tokenizers for budgeting: one token per punctuation
+    # mark and roughly one per four characters of each word.
+    return sum(1 + (len(piece) - 1) // 4 for piece in TOKEN_PATTERN.findall(text))
+
+
+class ContextBuilder:
+    def __init__(
+        self,
+        budget: int = DEFAULT_BUDGET,
+        summary_budget: int = DEFAULT_SUMMARY_BUDGET,
+        fold_threshold: int = DEFAULT_FOLD_THRESHOLD,
+        count: Callable[[str], int] = count_tokens,
+        max_cached: int = DEFAULT_MAX_CACHED,
+        passage_budget: int = DEFAULT_PASSAGE_BUDGET,
+    ) -> None:
+        self.budget = budget
+        self.summary_budget = summary_budget
+        self.fold_threshold = fold_threshold
+        self.passage_budget = passage_budget
+        self.count = count
+        self.max_cached = max_cached
+        # Push keys are immutable, so a message's count never changes.
+        self.counts = OrderedDict()
+        self.lock = threading.Lock()
+
+    def tokens(self, key: str, message: Mapping[str, str]) -> int:
+        with self.lock:
+            count = self.counts.get(key)
+            if count is not None:
+                self.counts.move_to_end(key)
+                return count
+        count = self.count(message["content"]) + MESSAGE_OVERHEAD
+        with self.lock:
+            self.counts[key] = count
+            while len(self.counts) > self.max_cached:
+                self.counts.popitem(last=False)
+        return count
+
+    def build(
+        self,
+        history: "OrderedDict[str, dict]",
+        prompt: str,
+        summary: Optional[Mapping[str, str]] = None,
+        passages: Sequence[Tuple[str, str]] = (),
+    ) -> Tuple[List[dict], Optional[str]]:
+        # Walks the history from the newest message backwards and stops at the
+        # first one that no longer fits, so the cost is bounded by the window
+        # rather than the length of the history. Returns the prompt messages
+        # and the key of the oldest message that made it in. Retrieved
+        # (document, text) passages, best first, are placed ahead of the
+        # history and kept within passage_budget.
+        remaining = self.budget - self.count(prompt) - MESSAGE_OVERHEAD
+        if summary:
+            remaining -= self.count(summary["text"]) + MESSAGE_OVERHEAD
+        excerpts = []
+        if passages:
+            allowance = min(self.passage_budget, remaining) - (
+                self.count(PASSAGE_INSTRUCTIONS) + MESSAGE_OVERHEAD
+            )
+            for document, text in passages:
+                excerpt = f"[{document}] {text}"
+                cost = self.count(excerpt)
+                if cost > allowance:
+                    break
+                allowance -= cost
+                remaining -= cost
+                excerpts.append(excerpt)
+            if excerpts:
+                remaining -= self.count(PASSAGE_INSTRUCTIONS) + MESSAGE_OVERHEAD
+        selected = []
+        for key in reversed(history):
+            if summary and key <= summary["upto"]:
+                break
+            message = history[key]
+            cost = self.tokens(key, message)
+            if cost > remaining:
+                break
+            remaining -= cost
+            selected.append(key)
+        selected.reverse()
+        messages = []
+        if summary:
+            messages.append(
+                {
+                    "role": "system",
+                    "content": "Summary of the earlier conversation: "
+                    + summary["text"],
+                }
+            )
+        if excerpts:
+            messages.append(
+                {
+                    "role": "system",
+                    "content": "\n\n".join([PASSAGE_INSTRUCTIONS] + excerpts),
+                }
+            )
+        messages.extend(
+            {"role": history[key]["role"], "content": history[key]["content"]}
+            for key in selected
+        )
+        messages.append({"role": "user", "content": prompt})
+        return messages, selected[0] if selected else None
+
+    def pending_fold(
+        self,
+        history: "OrderedDict[str, dict]",
+        oldest_included: Optional[str],
+        summary: Optional[Mapping[str, str]] = None,
+    ) -> List[Tuple[str, dict]]:
+        # Messages that fell out of the window but are not in the summary yet,
+        # oldest first; empty until they add up to the fold threshold.
+        keys = reversed(history)
+        if oldest_included is not None:
+            for key in keys:
+                if key == oldest_included:
+                    break
+        pending = []
+        total = 0
+        for key in keys:
+            if summary and key <= summary["upto"]:
+                break
+            pending.append((key, history[key]))
+            total += self.tokens(key, history[key])
+        if total < self.fold_threshold:
+            return []
+        pending.reverse()
+        return pending
+
+    def summary_request(
+        self,
+        pending: List[Tuple[str, dict]],
+        summary: Optional[Mapping[str, str]] = None,
+    ) -> List[dict]:
+        transcript = "\n".join(
+            f"{message['role']}: {message['content']}" for _, message in pending
+        )
+        previous = summary["text"] if summary else "(none yet)"
+        return [
+            {
+                "role": "user",
+                "content": SUMMARY_INSTRUCTIONS.format(
+                    words=self.summary_budget * 3 // 4
+                )
+                + f"\n\nRunning summary:\n{previous}\n\nNew messages:\n{transcript}",
+            }
+        ]
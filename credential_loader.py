@@ -1,11 +1,114 @@
+import functools
+import os
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Mapping, Optional
 import streamlit as st
+from telemetry import configure, span
+from token_refresh import (
+    SECURE_TOKEN_URL,
+    TokenRefreshManager,
+    get_token_refresh_manager,
+)
+from transport import DEFAULT_POOL_SIZE, IDENTITY_TOOLKIT_URL
+
+
+FIREBASE_CONFIG_KEYS = (
+    "apiKey",
+    "authDomain",
+    "projectId",
+    "storageBucket",
+    "messagingSenderId",
+    "appId",
+    "measurementId",
+    "databaseURL",
+)
+DEFAULT_TOGETHERAI_MODEL = "meta-llama/Llama-3-8b-chat-hf"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "academai")
+
+
+@dataclass(frozen=True)
+class AppConfig:
+    firebase_config: Optional[Mapping[str, str]]
+    togetherai_api_key: Optional[str]
+    db_url: Optional[str]
+    pool_size: int = DEFAULT_POOL_SIZE
+    endpoints: Mapping[str, str] = field(default_factory=lambda: MappingProxyType({}))
+    cache_dir: str = DEFAULT_CACHE_DIR
+    togetherai_model: str = DEFAULT_TOGETHERAI_MODEL
+    response_cache: Mapping[str, object] = field(
+        default_factory=lambda: MappingProxyType({})
+    )
+    context: Mapping[str, object] = field(default_factory=lambda: MappingProxyType({}))
+    telemetry: Mapping[str, object] = field(
+        default_factory=lambda: MappingProxyType({})
+    )
+    realtime: Mapping[str, object] = field(default_factory=lambda: MappingProxyType({}))
+    retrieval: Mapping[str, object] = field(
+        default_factory=lambda: MappingProxyType({})
+    )
+
+    @property
+    def identity_toolkit_url(self) -> str:
+        return self.endpoints.get("identity_toolkit_url", IDENTITY_TOOLKIT_URL)
+
+
+def _read_secret(*keys: str):
+    try:
+        value = st.secrets
+        for key in keys:
+            value = value[key]
+        return value
+    except KeyError:
+        return None
+
+
+@st.cache_resource(show_spinner=False)
+def load_config() -> AppConfig:
+    try:
+        firebase_config = MappingProxyType(
+            {key: st.secrets["firebase_config"][key] for key in FIREBASE_CONFIG_KEYS}
+        )
+    except KeyError:
+        firebase_config = None
+    return AppConfig(
+        firebase_config=firebase_config,
+        togetherai_api_key=_read_secret("togetherai", "api_key"),
+        db_url=_read_secret("firebase_config", "databaseURL"),
+        pool_size=int(_read_secret("transport", "pool_size") or DEFAULT_POOL_SIZE),
+        endpoints=MappingProxyType(dict(_read_secret("endpoints") or {})),
+        cache_dir=_read_secret("cache", "dir") or DEFAULT_CACHE_DIR,
+        togetherai_model=_read_secret("togetherai", "model")
+        or DEFAULT_TOGETHERAI_MODEL,
+        response_cache=MappingProxyType(dict(_read_secret("response_cache") or {})),
+        context=MappingProxyType(dict(_read_secret("context") or {})),
+        telemetry=MappingProxyType(dict(_read_secret("telemetry") or {})),
+        realtime=MappingProxyType(dict(_read_secret("realtime") or {})),
+        retrieval=MappingProxyType(dict(_read_secret("retrieval") or {})),
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def start_telemetry() -> bool:
+    # Off unless [telemetry] enabled = true; when off, spans are shared no-ops.
+    settings = load_config().telemetry
+    enabled = bool(settings.get("enabled", False))
+    configure(
+        enabled,
+        log=bool(settings.get("log_spans", False)),
+        metrics_port=int(settings.get("metrics_port", 0)) or None,
+    )
+    return enabled
 
 
 class Credentials:
     def __init__(self) -> None:
-        try:
-            self.firebase_config = self.get_firebase_config()
-        except KeyError:
+        with span("app.load_config"):
+            self.config = load_config()
+        start_telemetry()
+        if self.config.firebase_config is not None:
+            self.firebase_config = dict(self.config.firebase_config)
+        else:
             st.error(
                 """
                 # There was an error retrieving the Firebase configuration.
@@ -13,9 +116,9 @@ class Credentials:
                 - If the problem persists, please contact the developer.
                 """
             )
-        try:
-            self.togetherai_credentials = self.get_togetherai_credentials()
-        except KeyError:
+        if self.config.togetherai_api_key is not None:
+            self.togetherai_credentials = self.config.togetherai_api_key
+        else:
             st.error(
                 """
                 # There was an error retrieving the TogetherAI API key.
@@ -23,9 +126,9 @@ class Credentials:
                 - If the problem persists, please contact the developer.
                 """
             )
-        try:
-            self.db_url = st.secrets["firebase_config"]["databaseURL"]
-        except KeyError:
+        if self.config.db_url is not None:
+            self.db_url = self.config.db_url
+        else:
             st.error(
                 """
                 # There was an error retrieving the Firebase database URL.
@@ -34,17 +137,20 @@ class Credentials:
                 """
             )
 
+    @functools.cached_property
+    def token_manager(self) -> TokenRefreshManager:
+        # Built on first use: the sign-in page never refreshes a token.
+        return get_token_refresh_manager(
+            self.get_firebase_config()["apiKey"],
+            self.config.endpoints.get("securetoken_url", SECURE_TOKEN_URL),
+        )
+
     def get_togetherai_credentials(self) -> dict:
-        return st.secrets["togetherai"]["api_key"]
+        if self.config.togetherai_api_key is None:
+            raise KeyError("togetherai")
+        return self.config.togetherai_api_key
 
     def get_firebase_config(self) -> dict:
-        return {
-            "apiKey": st.secrets["firebase_config"]["apiKey"],
-            "authDomain": st.secrets["firebase_config"]["authDomain"],
-            "projectId": st.secrets["firebase_config"]["projectId"],
-            "storageBucket": st.secrets["firebase_config"]["storageBucket"],
-            "messagingSenderId": st.secrets["firebase_config"]["messagingSenderId"],
-            "appId": st.secrets["firebase_config"]["appId"],
-            "measurementId": st.secrets["firebase_config"]["measurementId"],
-            "databaseURL": st.secrets["firebase_config"]["databaseURL"],
-        }
+        if self.config.firebase_config is None:
+            raise KeyError("firebase_config")
+        return dict(self.config.firebase_config)
@@ -1,13 +1,266 @@
-from credential_loader import Credentials
-import firebase
+import functools
+import hashlib
+import json
+import mmap
+import os
+import re
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Hashable,
+    Iterable,
+    Iterator,
+    Optional,
+    Tuple,
+    Union,
+)
+from blob_cache import BlobCache
+from credential_loader import Credentials, load_config
+from history_cache import ChatHistoryCache
+from history_export import (
+    EXPORT_PAGE_SIZE,
+    IMPORT_BATCH_SIZE,
+    IMPORT_CONCURRENCY,
+    ImportCheckpoint,
+    export_ndjson,
+    gzip_chunks,
+    import_messages,
+)
+from history_stream import IDLE_TIMEOUT, ChatHistoryListeners
+from telemetry import span, traced
+from io_executor import get_io_executor
+from prefetch import SessionPrefetch
+from session import UserSession
+from token_refresh import (
+    SECURE_TOKEN_URL,
+    TokenRefreshManager,
+    get_token_refresh_manager,
+)
+from write_behind import WriteBehindRegistry
 import streamlit as st
 
+if TYPE_CHECKING:
+    import firebase
+    from search_index import SearchIndexes
+
+
+HISTORY_PAGE_SIZE = 100
+# Image blobs are addressed by the SHA-256 of the uploaded file.
+DIGEST = re.compile(r"[0-9a-f]{64}")
+# How long a rerun waits for a new listener's first snapshot before falling
+# back to a regular read.
+SUBSCRIBE_WAIT = 5.0
+
+
+@st.cache_resource(show_spinner=False)
+def get_firebase_app() -> "firebase.Firebase":
+    # firebase (and the Google client libraries it loads) is imported on
+    # first use: the sign-in page never needs it.
+    import firebase
+
+    with span("firebase.initialize_app"):
+        return firebase.initialize_app(dict(load_config().firebase_config))
+
+
+def rtdb_call(
+    database: "firebase.database.Database",
+    request: Callable,
+    coalesce: Optional[Hashable] = None,
+    scope: Optional[str] = None,
+    write: bool = False,
+):
+    # Every RTDB request runs on the shared I/O executor, within the per-host
+    # limit. Reads pass a coalesce key naming exactly what they read (the
+    # uid included), so concurrent sessions of one user share one request.
+    # Reads and writes under users/{uid} pass the uid as their scope: a read
+    # is never shared across a write of the same user. Tokens are read
+    # before the call: a refresh must not be awaited from an I/O thread.
+    return get_io_executor().call(
+        database.database_url, request, coalesce=coalesce, scope=scope, write=write
+    )
+
+
+@traced("rtdb.chat_history.update")
+def write_chat_messages(
+    app: "firebase.Firebase", uid: str, messages: dict, token: str
+) -> None:
+    # Runs on the write-behind thread, so it builds its own Database handle.
+    database = app.database()
+    rtdb_call(
+        database,
+        lambda: database.child("users")
+        .child(uid)
+        .child("chat_history")
+        .update(messages, token=token),
+        scope=uid,
+        write=True,
+    )
+
+
+def read_chat_history_pages(
+    database: "firebase.database.Database",
+    uid: str,
+    token: Callable[[], str],
+    page_size: int = HISTORY_PAGE_SIZE,
+    after_key: Optional[str] = None,
+    newest_first: bool = False,
+) -> Iterator[OrderedDict]:
+    # Walks chat_history in push-key order, one page per request. RTDB
+    # cursors are inclusive, so each follow-up page asks for one extra entry
+    # and drops the cursor itself. With newest_first, pages are produced from
+    # the end of the history backwards (each page is still in ascending key
+    # order) and after_key bounds how far back to go. Errors propagate.
+    cursor = None
+    while True:
+        query = database.child("users").child(uid).child("chat_history").order_by_key()
+        if newest_first:
+            if cursor is not None:
+                query = query.end_at(cursor).limit_to_last(page_size + 1)
+            else:
+                query = query.limit_to_last(page_size)
+            if after_key is not None:
+                query = query.start_at(after_key)
+        else:
+            start = cursor if cursor is not None else after_key
+            if start is not None:
+                query = query.start_at(start).limit_to_first(page_size + 1)
+            else:
+                query = query.limit_to_first(page_size)
+        id_token = token()
+        with span("rtdb.chat_history.page"):
+            page = rtdb_call(
+                database,
+                lambda: query.get(token=id_token).val(),
+                coalesce=(
+                    "chat_history",
+                    uid,
+                    newest_first,
+                    cursor,
+                    after_key,
+                    page_size,
+                ),
+                scope=uid,
+            )
+        page = OrderedDict(
+            (key, message)
+            for key, message in (page or OrderedDict()).items()
+            if key not in {cursor, after_key}
+        )
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        cursor = next(iter(page)) if newest_first else next(reversed(page))
+
+
+def sync_chat_history(
+    database: "firebase.database.Database",
+    history_cache: ChatHistoryCache,
+    uid: str,
+    token: Callable[[], str],
+) -> None:
+    # Brings the cached history up to date: everything after the last synced
+    # key, then marks it fresh.
+    delta = OrderedDict()
+    for page in read_chat_history_pages(
+        database, uid, token, after_key=history_cache.synced_key(uid)
+    ):
+        delta.update(page)
+    history_cache.store(uid, delta)
+    history_cache.mark_synced(uid, next(reversed(delta), None))
+
+
+def read_chat_summary(
+    database: "firebase.database.Database", uid: str, token: str
+) -> Optional[dict]:
+    with span("rtdb.chat_summary.get"):
+        return rtdb_call(
+            database,
+            lambda: database.child("users")
+            .child(uid)
+            .child("chat_summary")
+            .get(token=token)
+            .val(),
+            coalesce=("chat_summary", uid),
+            scope=uid,
+        )
+
+
+def renew_id_token(token_manager: TokenRefreshManager, refresh_token: str) -> str:
+    # Runs on the write-behind thread, never on an I/O thread, so it may wait
+    # for the exchange; concurrent renewals of one session share it.
+    return token_manager.refresh(refresh_token).result()["idToken"]
+
+
+@st.cache_resource(show_spinner=False)
+def get_chat_write_behind() -> WriteBehindRegistry:
+    # The app and the token manager are bound here: Streamlit's caches and
+    # secrets only work from script threads, so the write-behind thread must
+    # not look them up itself.
+    config = load_config()
+    token_manager = get_token_refresh_manager(
+        config.firebase_config["apiKey"],
+        config.endpoints.get("securetoken_url", SECURE_TOKEN_URL),
+    )
+    return WriteBehindRegistry(
+        functools.partial(write_chat_messages, get_firebase_app()),
+        renew=functools.partial(renew_id_token, token_manager),
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_chat_history_cache() -> ChatHistoryCache:
+    return ChatHistoryCache(
+        os.path.join(load_config().cache_dir, "chat_history.sqlite3")
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_chat_history_listeners() -> ChatHistoryListeners:
+    config = load_config()
+    return ChatHistoryListeners(
+        config.db_url,
+        idle_timeout=float(config.realtime.get("idle_timeout", IDLE_TIMEOUT)),
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_search_indexes() -> "SearchIndexes":
+    from search_index import SearchIndexes
+
+    return SearchIndexes(os.path.join(load_config().cache_dir, "search"))
+
+
+@st.cache_resource(show_spinner=False)
+def get_blob_cache() -> BlobCache:
+    return BlobCache(os.path.join(load_config().cache_dir, "blobs"))
+
 
 class RealtimeDB(Credentials):
+    # The Firebase app, the history cache, the write-behind queue and the
+    # search indexes are set up on first use: App is constructed on the
+    # sign-in page too, and that page needs none of them.
     def __init__(self) -> None:
         super().__init__()
+        self.history_listeners = None
+        if self.config.realtime.get("subscribe", False):
+            self.history_listeners = get_chat_history_listeners()
+        if st.session_state.get("user_session") is not None:
+            self.db = self.app.database()
+            self.user_session = st.session_state.user_session
+
+    @functools.cached_property
+    def history_cache(self) -> ChatHistoryCache:
+        return get_chat_history_cache()
+
+    @functools.cached_property
+    def app(self) -> "firebase.Firebase":
         try:
-            self.app = firebase.initialize_app(self.firebase_config)
+            with span("app.firebase_app"):
+                return get_firebase_app()
         except Exception as e:
             st.error(
                 f"""
@@ -18,17 +271,97 @@ class RealtimeDB(Credentials):
                 + str(e)
             )
             st.stop()
-        if st.session_state.get("user_info") is not None:
-            self.db = self.app.database()
-            self.user_info = st.session_state.user_info["fullUserInfo"]
-            self.id_token = st.session_state.user_info["idToken"]
 
-    def push_chat_message_for_user(self, user_id: str, message: dict) -> None:
-        try:
-            self.db.child("users").child(user_id).child("chat_history").push(
-                data=message, token=self.id_token
+    @functools.cached_property
+    def chat_writes(self) -> WriteBehindRegistry:
+        return get_chat_write_behind()
+
+    @functools.cached_property
+    def search_indexes(self) -> "SearchIndexes":
+        return get_search_indexes()
+
+    @functools.cached_property
+    def storage(self) -> "RealtimeDB.Storage":
+        # Signed-in sessions only; the uid is the one validate_session checked.
+        return self.Storage(self.db, lambda: self.id_token, self.user_session.uid)
+
+    @property
+    def id_token(self) -> str:
+        return self.token_manager.current(self.user_session)
+
+    def prefetch_home_page(self, user_session: UserSession) -> None:
+        # Called by sign-in just before it reruns into the home page: starts
+        # the reads the first render and the first chat turn would make, all
+        # at once, with the fresh token. Each gets its own Database handle,
+        # since a handle is a mutable query builder.
+        if not self.config.realtime.get("prefetch", True):
+            return
+        uid, token = user_session.uid, user_session.id_token
+        prefetch = SessionPrefetch()
+        if self.history_listeners is not None:
+            self.history_listeners.subscribe(uid, token)
+        elif not self.history_cache.is_fresh(uid):
+            database = self.app.database()
+            prefetch.start(
+                "chat_history",
+                database.database_url,
+                sync_chat_history,
+                database,
+                self.history_cache,
+                uid,
+                lambda: token,
+                scope=uid,
             )
+        database = self.app.database()
+        prefetch.start(
+            "chat_summary",
+            database.database_url,
+            read_chat_summary,
+            database,
+            uid,
+            token,
+            coalesce=("chat_summary", uid),
+            scope=uid,
+        )
+        st.session_state.prefetch = prefetch
+
+    def take_prefetched(self, name: str) -> Optional[Future]:
+        prefetch = st.session_state.get("prefetch")
+        return prefetch.take(name) if prefetch is not None else None
+
+    def push_chat_message_for_user(self, user_id: str, message: dict) -> str:
+        self.report_dropped_chat_messages(user_id)
+        key = self.chat_writes.append(
+            user_id, message, self.id_token, self.user_session.refresh_token
+        )
+        self.history_cache.store(user_id, {key: message})
+        with span("search.index"):
+            self.search_indexes.get(user_id).add([(key, message)])
+        if self.history_listeners is not None:
+            listener = self.history_listeners.get(user_id)
+            if listener is not None:
+                # Shown right away; the stream echoes it once it is flushed.
+                listener.mirror.apply("put", f"/{key}", message)
+        return key
+
+    def report_dropped_chat_messages(self, user_id: str) -> None:
+        dropped = self.chat_writes.take_dropped(user_id)
+        if dropped:
+            # The local copy still has them; read the history afresh.
+            self.history_cache.invalidate(user_id)
+            st.warning(
+                f"""
+                {dropped} chat message(s) could not be saved and were dropped.
+                - They will be missing from your history on other devices.
+                """
+            )
+
+    def flush_chat_messages(self, user_id: Optional[str] = None) -> None:
+        try:
+            self.chat_writes.flush(user_id)
         except Exception as e:
+            if user_id is not None:
+                self.report_dropped_chat_messages(user_id)
             st.error(
                 f"""
                 # There was an error storing the chat message.
@@ -38,15 +371,21 @@ class RealtimeDB(Credentials):
             )
 
     def fetch_user_chat_history(self) -> dict:
+        self.flush_chat_messages(self.user_session.uid)
         try:
-            uid = self.user_info["users"][0]["localId"]
-            return (
-                self.db.child("users")
-                .child(uid)
-                .child("chat_history")
-                .get(token=self.id_token)
-                .val()
-            )
+            uid = self.user_session.uid
+            token = self.id_token
+            with span("rtdb.chat_history.get"):
+                return rtdb_call(
+                    self.db,
+                    lambda: self.db.child("users")
+                    .child(uid)
+                    .child("chat_history")
+                    .get(token=token)
+                    .val(),
+                    coalesce=("chat_history", uid),
+                    scope=uid,
+                )
         except Exception as e:
             st.error(
                 f"""
@@ -57,12 +396,210 @@ class RealtimeDB(Credentials):
             )
             st.stop()
 
-    def delete_user_chat_history(self) -> None:
+    def iter_user_chat_history_pages(
+        self,
+        page_size: int = HISTORY_PAGE_SIZE,
+        after_key: Optional[str] = None,
+        newest_first: bool = False,
+    ) -> Iterator[OrderedDict]:
+        uid = self.user_session.uid
+        self.flush_chat_messages(uid)
+        pages = read_chat_history_pages(
+            self.db,
+            uid,
+            lambda: self.id_token,
+            page_size=page_size,
+            after_key=after_key,
+            newest_first=newest_first,
+        )
+        while True:
+            try:
+                page = next(pages, None)
+            except Exception as e:
+                st.error(
+                    f"""
+                    # There was an error getting the chat messages.
+                    - You may want to refresh the page.
+                    - If the problem persists, please contact the developer.
+                    """
+                )
+                st.stop()
+            if page is None:
+                return
+            yield page
+
+    def fetch_user_chat_history_since(
+        self, last_key: Optional[str], page_size: int = HISTORY_PAGE_SIZE
+    ) -> OrderedDict:
+        history = OrderedDict()
+        for page in self.iter_user_chat_history_pages(page_size, after_key=last_key):
+            history.update(page)
+        return history
+
+    def export_user_chat_history(
+        self, compress: bool = False, page_size: int = EXPORT_PAGE_SIZE
+    ) -> Iterator[bytes]:
+        # NDJSON (optionally gzip) chunks, read page by page, so an export
+        # never holds more than one page of the history in memory.
+        chunks = export_ndjson(self.iter_user_chat_history_pages(page_size))
+        return gzip_chunks(chunks) if compress else chunks
+
+    def import_user_chat_history(
+        self,
+        messages: Iterable[Tuple[str, dict]],
+        batch_size: int = IMPORT_BATCH_SIZE,
+        concurrency: int = IMPORT_CONCURRENCY,
+        checkpoint_path: Optional[str] = None,
+    ) -> int:
+        # Bulk-writes exported (key, message) pairs with their original push
+        # keys. With checkpoint_path, a re-run skips what a previous run had
+        # already written.
+        uid = self.user_session.uid
+        checkpoint = None
+        if checkpoint_path is not None:
+            checkpoint = ImportCheckpoint(checkpoint_path, uid)
+
+        def write(batch: dict) -> None:
+            # Runs on import worker threads, so each builds its own handle.
+            token = self.id_token
+            with span("rtdb.chat_history.import"):
+                database = self.app.database()
+                rtdb_call(
+                    database,
+                    lambda: database.child("users")
+                    .child(uid)
+                    .child("chat_history")
+                    .update(batch, token=token),
+                    scope=uid,
+                    write=True,
+                )
+
+        self.flush_chat_messages(uid)
+        try:
+            return import_messages(
+                messages,
+                write,
+                batch_size=batch_size,
+                concurrency=concurrency,
+                resume_after=checkpoint.load() if checkpoint else None,
+                on_checkpoint=checkpoint.save if checkpoint else None,
+            )
+        finally:
+            self.history_cache.invalidate(uid)
+
+    def subscribe_user_chat_history(
+        self, wait: float = SUBSCRIBE_WAIT
+    ) -> Optional[OrderedDict]:
+        # Reads the live mirror kept by this user's shared listener, at no
+        # network cost once it is running. None until the listener has its
+        # first snapshot (or after it gave up), so callers can fall back.
+        listener = self.history_listeners.subscribe(
+            self.user_session.uid, self.id_token
+        )
+        if not listener.ready.wait(wait):
+            return None
+        return listener.read(self.id_token)
+
+    def load_user_chat_history(self) -> OrderedDict:
+        # Served from the local cache; RTDB is only asked for messages newer
+        # than the last synced key, and at most once per staleness window.
+        # In subscription mode the listener's mirror is used instead.
+        if self.history_listeners is not None:
+            history = self.subscribe_user_chat_history()
+            if history is not None:
+                return history
+        uid = self.user_session.uid
+        prefetched = self.take_prefetched("chat_history")
+        if prefetched is not None:
+            # Started at sign-in; if it failed, the regular read below runs.
+            with span("prefetch.chat_history"):
+                prefetched.exception()
+        if not self.history_cache.is_fresh(uid):
+            delta = self.fetch_user_chat_history_since(
+                self.history_cache.synced_key(uid)
+            )
+            self.history_cache.store(uid, delta)
+            self.history_cache.mark_synced(uid, next(reversed(delta), None))
+        return self.history_cache.load(uid)
+
+    def search_chat_history(
+        self, query: str, offset: int = 0, limit: int = 10
+    ) -> Tuple[int, list]:
+        # Returns the number of matching messages and one page of
+        # (key, message), most relevant first. Messages the index has not
+        # seen (written from another device, or before it existed) are
+        # indexed from the loaded history first.
+        index = self.search_indexes.get(self.user_session.uid)
+        history = self.load_user_chat_history()
+        if len(index) != len(history):
+            with span("search.backfill"):
+                index.add(history.items())
+        with span("search.query"):
+            total, hits = index.search(query, offset=offset, limit=limit)
+        return total, [(key, history[key]) for key, _ in hits if key in history]
+
+    def fetch_chat_summary(self) -> Optional[dict]:
+        # The rolling summary only changes when this session folds it, so it
+        # is read from RTDB once per session. It is cached with its uid, so a
+        # later sign-in as someone else in the same browser session never
+        # sees (or folds into) the previous user's summary.
+        uid = self.user_session.uid
+        cached = st.session_state.get("chat_summary")
+        if cached is None or cached[0] != uid:
+            prefetched = self.take_prefetched("chat_summary")
+            try:
+                if prefetched is not None and prefetched.exception() is None:
+                    summary = prefetched.result()
+                else:
+                    summary = read_chat_summary(self.db, uid, self.id_token)
+            except Exception as e:
+                return None
+            st.session_state.chat_summary = (uid, summary)
+        return st.session_state.chat_summary[1]
+
+    def store_chat_summary(self, summary: dict) -> None:
+        uid = self.user_session.uid
         try:
-            uid = self.user_info["users"][0]["localId"]
-            self.db.child("users").child(uid).child("chat_history").remove(
-                token=self.id_token
+            token = self.id_token
+            with span("rtdb.chat_summary.set"):
+                rtdb_call(
+                    self.db,
+                    lambda: self.db.child("users")
+                    .child(uid)
+                    .child("chat_summary")
+                    .set(summary, token=token),
+                    scope=uid,
+                    write=True,
+                )
+            st.session_state.chat_summary = (uid, summary)
+        except Exception as e:
+            st.error(
+                f"""
+                # There was an error storing the chat summary.
+                - You may want to refresh the page.
+                - If the problem persists, please contact the developer.
+                """
             )
+
+    def delete_user_chat_history(self) -> None:
+        try:
+            uid = self.user_session.uid
+            self.chat_writes.discard(uid)
+            self.history_cache.invalidate(uid)
+            self.search_indexes.drop(uid)
+            token = self.id_token
+            with span("rtdb.chat_history.remove"):
+                for node in ("chat_history", "chat_summary"):
+                    rtdb_call(
+                        self.db,
+                        lambda: self.db.child("users")
+                        .child(uid)
+                        .child(node)
+                        .remove(token=token),
+                        scope=uid,
+                        write=True,
+                    )
+            st.session_state.pop("chat_summary", None)
         except Exception as e:
             st.error(
                 f"""
@@ -74,18 +611,83 @@ class RealtimeDB(Credentials):
             st.stop()
 
     class Storage:
-        def __init__(self, db: firebase.database.Database, id_token: str) -> None:
+        # Bound to one user: uid must come from the verified session (see
+        # RealtimeDB.storage). It keys the process-wide blob cache, whose hits
+        # are served without reading RTDB under the caller's token, so it can
+        # never be a value the caller chose.
+        def __init__(
+            self,
+            db: "firebase.database.Database",
+            id_token: Union[str, Callable[[], str]],
+            uid: str,
+        ) -> None:
             self.db = db
-            self.id_token = id_token
+            self.token = id_token
+            self.uid = uid
+
+        @property
+        def id_token(self) -> str:
+            return self.token() if callable(self.token) else self.token
+
+        def blob(self, digest: str) -> "firebase.database.Database":
+            return self.db.child("users").child(self.uid).child("blobs").child(digest)
+
+        @traced("storage.store_image")
+        def store_image(self, image: bytes) -> str:
+            # Images are stored once per content hash under the user's
+            # blobs/{digest}, as a re-encoded full-size variant and a
+            # thumbnail, each split into base64 chunk nodes, so a re-upload
+            # costs a single small read. Blobs live under users/{uid}, which
+            # the database rules leave writable by that user alone: a shared
+            # blobs/{digest} node could be overwritten by anyone who knew the
+            # digest. meta is written last and marks the blob as complete.
+            from image_pipeline import prepare_image, to_chunks  # Loads PIL.
 
-        def store_image(self, image: bytes, user_id: str) -> str:
             try:
-                image_url = (
-                    self.db.child("images")
-                    .child(user_id)
-                    .put(image, token=self.id_token)
+                prepared = prepare_image(image)
+                digest = prepared.digest
+                token = self.id_token
+                meta = rtdb_call(
+                    self.db,
+                    lambda: self.blob(digest).child("meta").get(token=token).val(),
+                    coalesce=("blob_meta", self.uid, digest),
+                    scope=self.uid,
                 )
-                return image_url
+                if meta is None:
+                    for variant, data in (
+                        ("full", prepared.full),
+                        ("thumbnail", prepared.thumbnail),
+                    ):
+                        for index, chunk in to_chunks(data).items():
+                            rtdb_call(
+                                self.db,
+                                lambda: self.blob(digest)
+                                .child(variant)
+                                .child(index)
+                                .set(chunk, token=token),
+                                scope=self.uid,
+                                write=True,
+                            )
+                    rtdb_call(
+                        self.db,
+                        lambda: self.blob(digest)
+                        .child("meta")
+                        .set(
+                            {
+                                "mimeType": prepared.mime_type,
+                                "width": prepared.width,
+                                "height": prepared.height,
+                                "size": len(prepared.full),
+                                "thumbnailSize": len(prepared.thumbnail),
+                                "originalSize": prepared.original_size,
+                                "storedAt": {".sv": "timestamp"},
+                            },
+                            token=token,
+                        ),
+                        scope=self.uid,
+                        write=True,
+                    )
+                return digest
             except Exception as e:
                 st.error(
                     f"""
@@ -96,12 +698,52 @@ class RealtimeDB(Credentials):
                 )
                 st.stop()
 
-        def fetch_image(self, image_url: str) -> bytes:
+        @traced("storage.download_image")
+        def download_image(self, image_url: str, variant: str) -> Optional[bytes]:
+            from image_pipeline import from_chunks
+
+            token = self.id_token
+            chunks = rtdb_call(
+                self.db,
+                lambda: self.blob(image_url).child(variant).get(token=token).val(),
+                coalesce=("blob", self.uid, image_url, variant),
+                scope=self.uid,
+            )
+            if not chunks:
+                return None
+            return from_chunks(chunks[key] for key in sorted(chunks))
+
+        @traced("storage.image_validator")
+        def image_validator(self, image_url: str) -> Optional[str]:
+            # The blob itself is immutable; its small meta node changes only if
+            # the blob is deleted or re-encoded, so it serves as the validator.
+            token = self.id_token
+            meta = rtdb_call(
+                self.db,
+                lambda: self.blob(image_url).child("meta").get(token=token).val(),
+                coalesce=("blob_meta", self.uid, image_url),
+                scope=self.uid,
+            )
+            if meta is None:
+                return None
+            return hashlib.sha256(json.dumps(meta, sort_keys=True).encode()).hexdigest()
+
+        def fetch_image(
+            self, image_url: str, thumbnail: bool = False
+        ) -> Optional[mmap.mmap]:
+            # Returns a read-only memory map of the cached file; it supports
+            # the buffer protocol and file-style reads (e.g. PIL.Image.open).
+            # image_url becomes part of a database path and a cache file name,
+            # so anything but a digest from store_image is refused.
+            if not DIGEST.fullmatch(image_url):
+                return None
+            variant = "thumbnail" if thumbnail else "full"
             try:
-                image = (
-                    self.db.child("images").child(image_url).get(token=self.id_token)
+                return get_blob_cache().get_or_fetch(
+                    f"{self.uid}.{image_url}.{variant}",
+                    lambda: self.download_image(image_url, variant),
+                    lambda: self.image_validator(image_url),
                 )
-                return image
             except Exception as e:
                 st.error(
                     f"""
@@ -0,0 +1,149 @@
+import hashlib
+import io
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+from embeddings import Embedder
+from vector_index import VectorStore
+
+
+# Passages are windows of this many words, overlapping so that a sentence
+# cut at one boundary is whole in the neighbouring passage.
+CHUNK_WORDS = 200
+CHUNK_OVERLAP = 40
+PDF_MAGIC = b"%PDF-"
+DOCUMENT_TYPES = ("pdf", "txt", "md")
+
+
+@dataclass(frozen=True)
+class PreparedDocument:
+    passages: List[str]
+    vectors: Optional[np.ndarray]
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def extract_text(data: bytes) -> str:
+    if data.startswith(PDF_MAGIC):
+        # Only needed for PDFs, and only in the worker processes.
+        from pypdf import PdfReader
+
+        reader = PdfReader(io.BytesIO(data))
+        return "\n\n".join(page.extract_text() or "" for page in reader.pages)
+    return data.decode("utf-8", errors="replace")
+
+
+def chunk_text(
+    text: str, words: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP
+) -> List[str]:
+    tokens = text.split()
+    step = words - overlap
+    return [
+        " ".join(tokens[start : start + words])
+        for start in range(0, max(len(tokens) - overlap, 1), step)
+        if start < len(tokens)
+    ]
+
+
+def prepare_document(
+    data: bytes, embedder: Optional[Embedder], words: int, overlap: int
+) -> PreparedDocument:
+    # Runs in a worker process: parsing, chunking and (for local embedders)
+    # embedding are all CPU-bound and would otherwise hold the GIL of the
+    # process serving every session.
+    passages = chunk_text(extract_text(data), words, overlap)
+    vectors = embedder.embed(passages) if embedder is not None else None
+    return PreparedDocument(passages, vectors)
+
+
+class DocumentIngestor:
+    # Turns uploaded files into indexed passages. Files are prepared in a
+    # process pool, at most 2 * workers at a time so that memory stays
+    # bounded, and stored in upload order. Remote embedders are called from
+    # this process, where the connection pool lives.
+    def __init__(
+        self,
+        store: VectorStore,
+        embedder: Embedder,
+        workers: Optional[int] = None,
+        words: int = CHUNK_WORDS,
+        overlap: int = CHUNK_OVERLAP,
+    ) -> None:
+        self.store = store
+        self.embedder = embedder
+        self.workers = workers or multiprocessing.cpu_count()
+        self.words = words
+        self.overlap = overlap
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def executor(self) -> ProcessPoolExecutor:
+        # Started on first use. Workers are spawned rather than forked: the
+        # server process has threads (listeners, write-behind) whose locks a
+        # fork could copy while held.
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self.pool
+
+    def ingest(
+        self, uid: str, files: Iterable[Tuple[str, bytes]]
+    ) -> List[Tuple[str, Optional[int]]]:
+        # Returns (name, passages added) per file: 0 for a file the user had
+        # already added or one with no extractable text (an image-only PDF),
+        # None for one that could not be read. Callers that need to tell the
+        # first two apart check has_document before ingesting. A file with no
+        # text is not stored, so uploading it again is not a duplicate.
+        results = []
+        in_flight = deque()
+        local = self.embedder if self.embedder.local else None
+
+        def settle(oldest) -> None:
+            name, digest, future = oldest
+            try:
+                prepared = future.result()
+            except Exception:
+                # Whatever the PDF parser raises for a damaged or encrypted
+                # file, or ImportError without pypdf installed.
+                results.append((name, None))
+                return
+            if not prepared.passages:
+                results.append((name, 0))
+                return
+            vectors = prepared.vectors
+            if vectors is None:
+                vectors = self.embedder.embed(prepared.passages)
+            results.append(
+                (name, self.store.add(uid, digest, name, prepared.passages, vectors))
+            )
+
+        pool = self.executor()
+        for name, data in files:
+            digest = content_hash(data)
+            if self.store.has_document(uid, digest):
+                results.append((name, 0))
+                continue
+            if len(in_flight) >= 2 * self.workers:
+                settle(in_flight.popleft())
+            future = pool.submit(
+                prepare_document, data, local, self.words, self.overlap
+            )
+            in_flight.append((name, digest, future))
+        while in_flight:
+            settle(in_flight.popleft())
+        return results
+
+    def close(self) -> None:
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown(cancel_futures=True)
+                self.pool = None
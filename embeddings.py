@@ -0,0 +1,107 @@
+import json
+import re
+import zlib
+from abc import ABC, abstractmethod
+from typing import Sequence
+import numpy as np
+from transport import PooledTransport, get_transport
+
+
+TOGETHERAI_EMBEDDINGS_URL = "https://api.together.xyz/v1/embeddings"
+DEFAULT_EMBEDDING_MODEL = "togethercomputer/m2-bert-80M-8k-retrieval"
+HASHING_DIMENSIONS = 256
+# Texts per embeddings request.
+EMBED_BATCH_SIZE = 64
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    # Unit length, so a dot product is the cosine similarity.
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+class Embedder(ABC):
+    # Maps texts to unit-length float32 rows of a fixed width. `name` is
+    # stored next to every index built with the embedder: vectors from two
+    # embedders are not comparable. `local` embedders are plain picklable
+    # objects doing CPU work, so ingestion runs them in worker processes.
+    name = ""
+    dimensions = 0
+    local = False
+
+    @abstractmethod
+    def embed(self, texts: Sequence[str]) -> np.ndarray: ...
+
+
+class HashingEmbedder(Embedder):
+    # Signed feature hashing of lowercased words, with crc32 so that every
+    # process (and every run) maps a word to the same bucket. No model to
+    # download and fully deterministic, which makes it the default for tests
+    # and offline use; retrieval quality is that of a bag of words.
+    local = True
+
+    def __init__(self, dimensions: int = HASHING_DIMENSIONS) -> None:
+        self.dimensions = dimensions
+        self.name = f"hashing-{dimensions}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        # One bincount over the whole batch instead of a loop per text.
+        hashes, owners = [], []
+        for row, text in enumerate(texts):
+            words = WORD_PATTERN.findall(text.casefold())
+            hashes.extend(zlib.crc32(word.encode()) for word in words)
+            owners.extend([row] * len(words))
+        hashes = np.array(hashes, dtype=np.uint32)
+        buckets = np.array(owners, dtype=np.int64) * self.dimensions + (
+            hashes % self.dimensions
+        )
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+        vectors = np.bincount(
+            buckets, weights=signs, minlength=len(texts) * self.dimensions
+        ).reshape(len(texts), self.dimensions)
+        # Dampen words repeated within a text.
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        return normalize_rows(vectors)
+
+
+class TogetherEmbedder(Embedder):
+    def __init__(
+        self,
+        api_key: str,
+        model: str = DEFAULT_EMBEDDING_MODEL,
+        dimensions: int = 768,
+        url: str = TOGETHERAI_EMBEDDINGS_URL,
+        transport: PooledTransport = None,
+    ) -> None:
+        self.model = model
+        self.name = model
+        self.dimensions = dimensions
+        self.url = url
+        self.transport = transport or get_transport()
+        self.headers = {"authorization": f"Bearer {api_key}"}
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        rows = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            data = json.dumps(
+                {
+                    "model": self.model,
+                    "input": list(texts[start : start + EMBED_BATCH_SIZE]),
+                }
+            )
+            # A pure function of the input, so identical batches are shared.
+            response = self.transport.post(
+                self.url,
+                data,
+                headers=self.headers,
+                timeout=(10, 60),
+                coalesce=(self.url, data),
+            )
+            response.raise_for_status()
+            items = sorted(response.json()["data"], key=lambda item: item["index"])
+            rows.extend(item["embedding"] for item in items)
+        if not rows:
+            return np.zeros((0, self.dimensions), dtype=np.float32)
+        return normalize_rows(np.array(rows, dtype=np.float32))
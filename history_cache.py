@@ -0,0 +1,192 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Mapping, Optional
+
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# How long a user's cached history is served without asking RTDB for news.
+DEFAULT_MAX_STALENESS = 30.0
+# Decoded histories kept in memory, so warm loads skip JSON decoding.
+DEFAULT_MEMORY_USERS = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    uid TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (uid, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS users (
+    uid TEXT PRIMARY KEY,
+    synced_key TEXT,
+    synced_at REAL NOT NULL DEFAULT 0,
+    accessed REAL NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class ChatHistoryCache:
+    # On-disk mirror of users/{uid}/chat_history. synced_key is the highest
+    # push key received from RTDB; messages written locally are cached too,
+    # but the next sync still starts from synced_key so that anything another
+    # device wrote in between is not skipped.
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_staleness: float = DEFAULT_MAX_STALENESS,
+        memory_users: int = DEFAULT_MEMORY_USERS,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_staleness = max_staleness
+        self.memory_users = memory_users
+        self.clock = clock
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def is_fresh(self, uid: str) -> bool:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT synced_at FROM users WHERE uid = ?", (uid,)
+            ).fetchone()
+        return row is not None and self.clock() - row[0] < self.max_staleness
+
+    def synced_key(self, uid: str) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT synced_key FROM users WHERE uid = ?", (uid,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def store(self, uid: str, messages: Mapping[str, dict]) -> None:
+        if not messages:
+            return
+        rows = [(uid, key, json.dumps(message)) for key, message in messages.items()]
+        now = self.clock()
+        with self.lock:
+            self.connection.execute("BEGIN")
+            try:
+                replaced = sum(
+                    len(key) + length
+                    for key, length in self.connection.execute(
+                        "SELECT key, length(payload) FROM messages "
+                        "WHERE uid = ? AND key BETWEEN ? AND ?",
+                        (uid, min(messages), max(messages)),
+                    )
+                    if key in messages
+                )
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO messages (uid, key, payload) "
+                    "VALUES (?, ?, ?)",
+                    rows,
+                )
+                size = sum(len(key) + len(payload) for _, key, payload in rows)
+                self.connection.execute(
+                    "INSERT INTO users (uid) VALUES (?) ON CONFLICT (uid) DO NOTHING",
+                    (uid,),
+                )
+                self.connection.execute(
+                    "UPDATE users SET bytes = bytes + ?, version = version + 1, "
+                    "accessed = ? WHERE uid = ?",
+                    (size - replaced, now, uid),
+                )
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            cached = self.memory.pop(uid, None)
+            if cached is not None:
+                # Copy on write: readers may still be iterating the old dict.
+                history = OrderedDict(cached[1])
+                last = next(reversed(history), None)
+                in_order = last is None or all(
+                    key > last for key in messages if key not in history
+                )
+                for key in sorted(messages):
+                    history[key] = messages[key]
+                if not in_order:
+                    history = OrderedDict(sorted(history.items()))
+                self.memory[uid] = (cached[0] + 1, history)
+        self.evict(keep=uid)
+
+    def mark_synced(self, uid: str, synced_key: Optional[str]) -> None:
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO users (uid) VALUES (?) ON CONFLICT (uid) DO NOTHING",
+                (uid,),
+            )
+            self.connection.execute(
+                "UPDATE users SET synced_at = ?, "
+                "synced_key = nullif(max(coalesce(synced_key, ''), "
+                "coalesce(?, '')), '') "
+                "WHERE uid = ?",
+                (self.clock(), synced_key, uid),
+            )
+
+    def load(self, uid: str) -> OrderedDict:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT version FROM users WHERE uid = ?", (uid,)
+            ).fetchone()
+            if row is None:
+                return OrderedDict()
+            self.connection.execute(
+                "UPDATE users SET accessed = ? WHERE uid = ?", (self.clock(), uid)
+            )
+            cached = self.memory.get(uid)
+            if cached is not None and cached[0] == row[0]:
+                self.memory.move_to_end(uid)
+                return cached[1]
+            history = OrderedDict(
+                (key, json.loads(payload))
+                for key, payload in self.connection.execute(
+                    "SELECT key, payload FROM messages WHERE uid = ? ORDER BY key",
+                    (uid,),
+                )
+            )
+            self.memory[uid] = (row[0], history)
+            self.memory.move_to_end(uid)
+            while len(self.memory) > self.memory_users:
+                self.memory.popitem(last=False)
+            return history
+
+    def invalidate(self, uid: str) -> None:
+        with self.lock:
+            self.connection.execute("BEGIN")
+            self.connection.execute("DELETE FROM messages WHERE uid = ?", (uid,))
+            self.connection.execute("DELETE FROM users WHERE uid = ?", (uid,))
+            self.connection.execute("COMMIT")
+            self.memory.pop(uid, None)
+
+    def evict(self, keep: str = None) -> None:
+        with self.lock:
+            total = self.connection.execute(
+                "SELECT coalesce(sum(bytes), 0) FROM users"
+            ).fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            victims = self.connection.execute(
+                "SELECT uid, bytes FROM users WHERE uid IS NOT ? ORDER BY accessed",
+                (keep,),
+            ).fetchall()
+        for uid, size in victims:
+            if total <= self.max_bytes:
+                break
+            self.invalidate(uid)
+            total -= size
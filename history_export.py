@@ -0,0 +1,116 @@
+import gzip
+import json
+import os
+import tempfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Mapping, Optional, Tuple, Union
+
+
+EXPORT_PAGE_SIZE = 1000
+IMPORT_BATCH_SIZE = 500
+IMPORT_CONCURRENCY = 4
+# wbits for zlib that produce a gzip container.
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def export_ndjson(pages: Iterable[Mapping[str, dict]]) -> Iterator[bytes]:
+    # One JSON object per message, its push key included, in key order; one
+    # chunk per page so memory stays bounded by the page size.
+    for page in pages:
+        yield "".join(
+            json.dumps({"key": key, **message}, ensure_ascii=False) + "\n"
+            for key, message in page.items()
+        ).encode()
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def read_ndjson(lines: Iterable[Union[str, bytes]]) -> Iterator[Tuple[str, dict]]:
+    for line in lines:
+        if not line.strip():
+            continue
+        message = json.loads(line)
+        yield message.pop("key"), message
+
+
+def read_export_file(path: str) -> Iterator[Tuple[str, dict]]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as file:
+        yield from read_ndjson(file)
+
+
+class ImportCheckpoint:
+    # Highest push key known to be written, per uid, in a small JSON file
+    # replaced atomically after every advance.
+    def __init__(self, path: str, uid: str) -> None:
+        self.path = path
+        self.uid = uid
+
+    def load(self) -> Optional[str]:
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return state.get("key") if state.get("uid") == self.uid else None
+
+    def save(self, key: str) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        handle, temporary = tempfile.mkstemp(dir=directory, prefix=".")
+        with os.fdopen(handle, "w", encoding="utf-8") as file:
+            json.dump({"uid": self.uid, "key": key}, file)
+        os.replace(temporary, self.path)
+
+
+def import_messages(
+    messages: Iterable[Tuple[str, dict]],
+    write: Callable[[dict], None],
+    batch_size: int = IMPORT_BATCH_SIZE,
+    concurrency: int = IMPORT_CONCURRENCY,
+    resume_after: Optional[str] = None,
+    on_checkpoint: Optional[Callable[[str], None]] = None,
+) -> int:
+    # Writes messages (in key order, as exported) as multi-path updates of
+    # batch_size keys, up to `concurrency` at a time. Batches finish out of
+    # order, so the checkpoint only advances over the finished prefix; since
+    # push keys are kept, replaying a batch after a crash is harmless. At
+    # most 2 * concurrency batches are held in memory.
+    written = 0
+    in_flight = deque()
+
+    def settle(oldest) -> None:
+        nonlocal written
+        future, last_key, count = oldest
+        future.result()
+        written += count
+        if on_checkpoint is not None:
+            on_checkpoint(last_key)
+
+    with ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="history-import"
+    ) as pool:
+        batch = {}
+        for key, message in messages:
+            if resume_after is not None and key <= resume_after:
+                continue
+            batch[key] = message
+            if len(batch) < batch_size:
+                continue
+            if len(in_flight) >= 2 * concurrency:
+                settle(in_flight.popleft())
+            in_flight.append((pool.submit(write, batch), key, len(batch)))
+            batch = {}
+        if batch:
+            in_flight.append((pool.submit(write, batch), key, len(batch)))
+        while in_flight:
+            settle(in_flight.popleft())
+    return written
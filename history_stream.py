@@ -0,0 +1,261 @@
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+import requests
+from transport import PooledTransport, get_transport
+
+
+# RTDB sends a keep-alive event every 30 seconds; a silent connection is
+# considered dead after this long.
+READ_TIMEOUT = 75
+CONNECT_TIMEOUT = 10
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 30.0
+# A listener nobody has read from for this long disconnects and goes away.
+IDLE_TIMEOUT = 300.0
+EVENT_STREAM_HEADERS = {"accept": "text/event-stream"}
+
+
+def iter_events(lines: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    # Minimal server-sent events parser: yields (event, data) per blank-line
+    # terminated block. RTDB never splits data over several lines.
+    event, data = None, None
+    for line in lines:
+        if not line:
+            if event is not None:
+                yield event, data
+            event, data = None, None
+        elif line.startswith("event:"):
+            event = line[len("event:") :].strip()
+        elif line.startswith("data:"):
+            data = line[len("data:") :].strip()
+
+
+class ChatHistoryMirror:
+    # In-memory copy of one users/{uid}/chat_history node, kept current by
+    # applying RTDB put/patch events. Readers get an ordered snapshot that is
+    # rebuilt only when an event changed something.
+    def __init__(self) -> None:
+        self.messages = {}
+        self.version = 0
+        self.cached = (None, OrderedDict())
+        self.lock = threading.Lock()
+
+    def last_key(self) -> Optional[str]:
+        with self.lock:
+            return max(self.messages, default=None)
+
+    def apply(self, event: str, path: str, data) -> None:
+        segments = [segment for segment in path.split("/") if segment]
+        with self.lock:
+            if event == "patch":
+                for child, value in (data or {}).items():
+                    self.put(segments + [s for s in child.split("/") if s], value)
+            else:
+                self.put(segments, data)
+            self.version += 1
+
+    def put(self, segments: list, data) -> None:
+        if not segments:
+            self.messages = dict(data or {})
+        elif len(segments) == 1:
+            if data is None:
+                self.messages.pop(segments[0], None)
+            else:
+                self.messages[segments[0]] = data
+        else:
+            # A single field of a message; messages are flat role/content maps.
+            key, field = segments[0], segments[1]
+            message = dict(self.messages.get(key) or {})
+            if data is None:
+                message.pop(field, None)
+            else:
+                message[field] = data
+            if message:
+                self.messages[key] = message
+            else:
+                self.messages.pop(key, None)
+
+    def snapshot(self) -> OrderedDict:
+        # Shared between readers; callers must not mutate it.
+        with self.lock:
+            version, history = self.cached
+            if version != self.version:
+                history = OrderedDict(sorted(self.messages.items()))
+                self.cached = (self.version, history)
+            return history
+
+
+class ChatHistoryListener:
+    # One streaming GET on users/{uid}/chat_history, on a daemon thread,
+    # shared by every session of that user. After a disconnect it resumes
+    # from the last key it holds (orderBy="$key", startAt=last key), so only
+    # messages written in the meantime are downloaded again. RTDB cursors are
+    # inclusive: if the resumed snapshot no longer contains that key, the
+    # history was cleared or rewritten and a full resync follows.
+    def __init__(
+        self,
+        url: str,
+        id_token: Optional[str],
+        transport: PooledTransport = None,
+        idle_timeout: float = IDLE_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.url = url
+        self.id_token = id_token
+        self.transport = transport or get_transport()
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.mirror = ChatHistoryMirror()
+        self.ready = threading.Event()
+        self.stopped = threading.Event()
+        self.last_read = clock()
+        self.response = None
+        self.connections = 0
+        self.thread = threading.Thread(
+            target=self.run, name="chat-history-listener", daemon=True
+        )
+
+    def start(self) -> "ChatHistoryListener":
+        self.thread.start()
+        return self
+
+    def read(self, id_token: Optional[str]) -> OrderedDict:
+        # Every read hands over the reader's current token, so the stream can
+        # reconnect with a fresh one after RTDB revokes the old.
+        self.id_token = id_token
+        self.last_read = self.clock()
+        return self.mirror.snapshot()
+
+    def idle(self) -> bool:
+        return self.clock() - self.last_read > self.idle_timeout
+
+    def close(self) -> None:
+        self.stopped.set()
+        response = self.response
+        if response is not None:
+            response.close()
+
+    def run(self) -> None:
+        delay = RECONNECT_DELAY
+        try:
+            while not self.stopped.is_set() and not self.idle():
+                try:
+                    if self.listen():
+                        delay = RECONNECT_DELAY
+                        continue
+                    break
+                except (
+                    requests.exceptions.RequestException,
+                    OSError,
+                    ValueError,
+                    KeyError,
+                ):
+                    pass
+                except Exception:
+                    # close() can tear the response down under the reader.
+                    if not self.stopped.is_set():
+                        raise
+                    break
+                if self.stopped.wait(delay * (0.5 + random.random() / 2)):
+                    break
+                delay = min(MAX_RECONNECT_DELAY, delay * 2)
+        finally:
+            self.stopped.set()
+            self.ready.clear()
+
+    def listen(self) -> bool:
+        # Returns True when the stream ended in a way that warrants an
+        # immediate reconnect, False when the listener should stop.
+        resume_from = self.mirror.last_key() if self.ready.is_set() else None
+        params = {"auth": self.id_token} if self.id_token else {}
+        if resume_from is not None:
+            params.update(orderBy='"$key"', startAt=json.dumps(resume_from))
+        response = self.transport.get_stream(
+            self.url,
+            EVENT_STREAM_HEADERS,
+            params=params,
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+        )
+        self.response = response
+        self.connections += 1
+        try:
+            if response.status_code == 403:
+                return False
+            # Anything else, including 401 for an expired token, is retried
+            # with backoff and whatever token the latest reader handed over.
+            response.raise_for_status()
+            lines = response.iter_lines(chunk_size=None, decode_unicode=True)
+            first = True
+            for event, data in iter_events(lines):
+                if self.stopped.is_set() or self.idle():
+                    return False
+                if event in {"put", "patch"}:
+                    payload = json.loads(data)
+                    if first and resume_from is not None and payload["path"] == "/":
+                        snapshot = payload["data"] or {}
+                        if resume_from not in snapshot:
+                            self.ready.clear()
+                            return True
+                        self.mirror.apply("patch", "/", snapshot)
+                    else:
+                        self.mirror.apply(event, payload["path"], payload["data"])
+                    first = False
+                    self.ready.set()
+                elif event == "auth_revoked":
+                    return True
+                elif event == "cancel":
+                    # Security rules no longer allow reading this location.
+                    return False
+            return True
+        finally:
+            self.response = None
+            response.close()
+
+
+class ChatHistoryListeners:
+    # Process-wide registry: at most one live listener per uid.
+    def __init__(
+        self,
+        database_url: str,
+        transport: PooledTransport = None,
+        idle_timeout: float = IDLE_TIMEOUT,
+    ) -> None:
+        self.database_url = database_url.rstrip("/")
+        self.transport = transport
+        self.idle_timeout = idle_timeout
+        self.listeners = {}
+        self.lock = threading.Lock()
+
+    def url(self, uid: str) -> str:
+        return f"{self.database_url}/users/{uid}/chat_history.json"
+
+    def get(self, uid: str) -> Optional[ChatHistoryListener]:
+        listener = self.listeners.get(uid)
+        if listener is None or listener.stopped.is_set():
+            return None
+        return listener
+
+    def subscribe(self, uid: str, id_token: Optional[str]) -> ChatHistoryListener:
+        with self.lock:
+            for key, listener in list(self.listeners.items()):
+                if listener.stopped.is_set():
+                    del self.listeners[key]
+            listener = self.listeners.get(uid)
+            if listener is None:
+                listener = self.listeners[uid] = ChatHistoryListener(
+                    self.url(uid),
+                    id_token,
+                    transport=self.transport,
+                    idle_timeout=self.idle_timeout,
+                ).start()
+            return listener
+
+    def close(self, uid: str) -> None:
+        with self.lock:
+            listener = self.listeners.pop(uid, None)
+        if listener is not None:
+            listener.close()
@@ -0,0 +1,83 @@
+import base64
+import hashlib
+import io
+from dataclasses import dataclass
+from typing import Dict, Iterable
+from PIL import Image, ImageOps
+
+
+MAX_DIMENSION = 2048
+THUMBNAIL_SIZE = 256
+QUALITY = 82
+ENCODING = "WEBP"
+MIME_TYPE = "image/webp"
+# Size of one base64 chunk node; keeps every single RTDB write small.
+CHUNK_SIZE = 512 * 1024
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    digest: str
+    full: bytes
+    thumbnail: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_size: int
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def encode(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=ENCODING, quality=QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def prepare_image(
+    data: bytes,
+    max_dimension: int = MAX_DIMENSION,
+    thumbnail_size: int = THUMBNAIL_SIZE,
+) -> PreparedImage:
+    # The digest is taken over the uploaded bytes, so re-uploading the same
+    # file always maps to the same stored blob.
+    with Image.open(io.BytesIO(data)) as source:
+        original_mime = Image.MIME.get(source.format, "application/octet-stream")
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in {"RGB", "RGBA"}:
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        full = image.copy()
+        full.thumbnail((max_dimension, max_dimension))
+        full_bytes = encode(full)
+        mime_type = MIME_TYPE
+        if len(full_bytes) >= len(data) and full.size == image.size:
+            # Re-encoding did not help and nothing was scaled down, so keep
+            # the original file. Compared against the transposed image: a
+            # rotated photo swaps width and height without being resized.
+            full_bytes, mime_type = data, original_mime
+        thumbnail = image.copy()
+        thumbnail.thumbnail((thumbnail_size, thumbnail_size))
+        return PreparedImage(
+            digest=content_hash(data),
+            full=full_bytes,
+            thumbnail=encode(thumbnail),
+            mime_type=mime_type,
+            width=full.width,
+            height=full.height,
+            original_size=len(data),
+        )
+
+
+def to_chunks(data: bytes, chunk_size: int = CHUNK_SIZE) -> Dict[str, str]:
+    encoded = base64.b64encode(data).decode()
+    return {
+        # Prefixed so RTDB never turns the chunk node into a JSON array.
+        f"c{index:04d}": encoded[offset : offset + chunk_size]
+        for index, offset in enumerate(range(0, len(encoded), chunk_size))
+    }
+
+
+def from_chunks(chunks: Iterable[str]) -> bytes:
+    return base64.b64decode("".join(chunks))
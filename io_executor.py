@@ -0,0 +1,209 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Hashable, Optional
+from urllib.parse import urlsplit
+
+
+# Requests in flight per host. Matches the transport's connection pool, so a
+# request never waits for a connection or opens one outside the pool.
+DEFAULT_HOST_LIMIT = 10
+DEFAULT_MAX_WORKERS = 32
+
+# Set on the executor's own threads, where calls run inline (see call()).
+_worker = threading.local()
+
+
+class PoolShutDown(RuntimeError):
+    pass
+
+
+def host_of(target: str) -> str:
+    return urlsplit(target).netloc or target
+
+
+def _mark_worker(executor: "IOExecutor") -> None:
+    _worker.active = True
+    with executor.lock:
+        executor.threads += 1
+
+
+class IOExecutor:
+    # One asyncio loop on a daemon thread, shared by the whole process, that
+    # every outbound request is submitted to. The loop only schedules: HTTP
+    # itself stays on requests (and the firebase client built on it), run
+    # in a bounded pool of I/O threads. What the loop adds is process-wide
+    # coordination across Streamlit's per-session script threads:
+    # - at most host_limit requests in flight per host, queued fairly
+    #   (asyncio.Semaphore wakes waiters in order);
+    # - single-flight reads: calls with the same coalesce key while one is in
+    #   flight share its result instead of sending the request again;
+    # - read-your-writes per scope (a uid): no read of a scope is shared
+    #   across a write to it.
+    # Script code uses the blocking call(); background work can submit().
+    def __init__(
+        self,
+        host_limit: int = DEFAULT_HOST_LIMIT,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> None:
+        self.host_limit = host_limit
+        self.enabled = True
+        self.lock = threading.Lock()
+        # I/O threads started so far; the pool starts them as work arrives.
+        self.threads = 0
+        self.pool = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="io",
+            initializer=_mark_worker,
+            initargs=(self,),
+        )
+        self.semaphores = {}
+        self.flights = {}
+        # scope -> number of writes to it in flight.
+        self.writing = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="io-loop", daemon=True
+        )
+        self.thread.start()
+
+    async def limited(self, host: str, request: Callable):
+        semaphore = self.semaphores.get(host)
+        if semaphore is None:
+            semaphore = self.semaphores[host] = asyncio.Semaphore(self.host_limit)
+        async with semaphore:
+            try:
+                future = self.loop.run_in_executor(self.pool, request)
+            except RuntimeError as error:
+                # The pool takes no new work once the interpreter is exiting.
+                raise PoolShutDown() from error
+            return await future
+
+    async def dispatch(
+        self,
+        host: str,
+        request: Callable,
+        coalesce: Optional[Hashable],
+        scope: Optional[Hashable],
+        write: bool,
+    ):
+        # Runs on the loop thread, so the bookkeeping needs no locks.
+        self.calls += 1
+        if write and scope is not None:
+            return await self.run_write(scope, host, request)
+        if coalesce is None:
+            return await self.limited(host, request)
+        if scope is not None and scope in self.writing:
+            # Read-your-writes: while the scope has a write in flight, its
+            # reads neither start nor join a shared flight.
+            return await self.limited(host, request)
+        flight = self.flights.get(coalesce)
+        if flight is None:
+            flight = self.loop.create_task(self.limited(host, request))
+            flight.scope = scope
+            self.flights[coalesce] = flight
+            flight.add_done_callback(functools.partial(self.land, coalesce))
+        else:
+            self.coalesced += 1
+        # A caller giving up must not cancel the request for the others.
+        return await asyncio.shield(flight)
+
+    async def run_write(self, scope: Hashable, host: str, request: Callable):
+        # Reads of the scope already in flight may predate this write, so
+        # later reads must not join them.
+        self.writing[scope] = self.writing.get(scope, 0) + 1
+        for coalesce, flight in list(self.flights.items()):
+            if flight.scope == scope:
+                del self.flights[coalesce]
+        try:
+            return await self.limited(host, request)
+        finally:
+            self.writing[scope] -= 1
+            if not self.writing[scope]:
+                del self.writing[scope]
+
+    def land(self, coalesce: Hashable, flight: asyncio.Task) -> None:
+        if self.flights.get(coalesce) is flight:
+            del self.flights[coalesce]
+
+    def submit(
+        self,
+        target: str,
+        function: Callable,
+        *args,
+        coalesce: Optional[Hashable] = None,
+        scope: Optional[Hashable] = None,
+        write: bool = False,
+        **kwargs,
+    ) -> Future:
+        # The caller's context variables (telemetry spans) follow the call.
+        request = functools.partial(
+            contextvars.copy_context().run, function, *args, **kwargs
+        )
+        return asyncio.run_coroutine_threadsafe(
+            self.dispatch(host_of(target), request, coalesce, scope, write),
+            self.loop,
+        )
+
+    def call(
+        self,
+        target: str,
+        function: Callable,
+        *args,
+        coalesce: Optional[Hashable] = None,
+        scope: Optional[Hashable] = None,
+        write: bool = False,
+        **kwargs,
+    ):
+        # Blocking facade: returns function's result or raises its exception.
+        # On an I/O thread (a request issuing another, such as a token
+        # refresh posting through the transport) the call runs inline; going
+        # back through the loop could wait on the very slot it holds. Once
+        # the pool or the loop stops taking work at interpreter exit (before
+        # atexit handlers such as the final write-behind flush run), calls
+        # run inline as well.
+        if not self.enabled or getattr(_worker, "active", False):
+            return function(*args, **kwargs)
+        if threading.current_thread() is self.thread:
+            raise RuntimeError("blocking call on the I/O loop thread")
+        try:
+            future = self.submit(
+                target,
+                function,
+                *args,
+                coalesce=coalesce,
+                scope=scope,
+                write=write,
+                **kwargs,
+            )
+            return future.result()
+        except PoolShutDown:
+            return function(*args, **kwargs)
+        except RuntimeError:
+            if not self.loop.is_closed():
+                raise
+            return function(*args, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "threads": self.threads,
+        }
+
+
+_io_executor = None
+_io_executor_lock = threading.Lock()
+
+
+def get_io_executor(host_limit: int = DEFAULT_HOST_LIMIT) -> IOExecutor:
+    global _io_executor
+    if _io_executor is None:
+        with _io_executor_lock:
+            if _io_executor is None:
+                _io_executor = IOExecutor(host_limit=host_limit)
+    return _io_executor
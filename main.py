@@ -1,14 +1,25 @@
 import time
 import streamlit as st
+from assistant import Assistant
 from auth import FirebaseAuthenticator
+from credential_loader import start_telemetry
 from db import RealtimeDB
+from telemetry import begin_rerun, current_rerun, span
 
 
-class App(FirebaseAuthenticator, RealtimeDB):
+class App(FirebaseAuthenticator, RealtimeDB, Assistant):
     def __init__(self):
-        super().__init__()
+        # Telemetry is configured from the secrets file; it has to be on
+        # before the first rerun of a process starts collecting spans.
+        start_telemetry()
+        begin_rerun()
+        with span("app.init"):
+            super().__init__()
         self.set_page_config()
 
+    def on_sign_in(self, user_session):
+        self.prefetch_home_page(user_session)
+
     def set_page_config(self):
         st.set_page_config(
             page_title="AcademAI",
@@ -18,106 +29,191 @@ class App(FirebaseAuthenticator, RealtimeDB):
         )
 
     def auth_page(self):
-        if "user_info" not in st.session_state:
-            col1, col2, col3 = st.columns([2, 5, 2])
-            login_register = col2.toggle(
-                label="**Login/Register**", key="login_register"
-            )
-            if login_register:
-                do_you_have_an_account = "No"
-            else:
-                do_you_have_an_account = "Yes"
-            auth_form = col2.form(key="Authentication form", clear_on_submit=False)
-            email = auth_form.text_input(
-                label="**Email**",
-                type="default",
-                placeholder="Enter your email",
-                autocomplete="email",
-            )
-            password = (
-                auth_form.text_input(
-                    label="**Password**",
-                    type="password",
-                    placeholder="Enter your password",
-                    autocomplete="current-password",
-                )
-                if do_you_have_an_account in {"Yes", "No"}
-                else auth_form.empty()
+        self.validate_session()
+        if "user_session" not in st.session_state:
+            self.auth_form()
+        else:
+            self.home_page()
+        if self.config.telemetry.get("dev_panel", False):
+            self.developer_panel()
+
+    # The auth form, the chat pane and the interactive sidebar panes are
+    # fragments: interacting with one reruns only that function, against the
+    # App built by the last full run, instead of the whole script. They
+    # share nothing but st.session_state and the services on self, and each
+    # reads what it shows when it runs (the chat pane its history, the
+    # search pane the index the chat pane adds to, the chat pane the
+    # documents the library pane stores). Anything that changes who is
+    # signed in (sign-in, sign-out, deleting the account) calls st.rerun(),
+    # which from a fragment reruns the whole app.
+    @st.experimental_fragment
+    def auth_form(self):
+        col1, col2, col3 = st.columns([2, 5, 2])
+        login_register = col2.toggle(label="**Login/Register**", key="login_register")
+        if login_register:
+            do_you_have_an_account = "No"
+        else:
+            do_you_have_an_account = "Yes"
+        auth_form = col2.form(key="Authentication form", clear_on_submit=False)
+        email = auth_form.text_input(
+            label="**Email**",
+            type="default",
+            placeholder="Enter your email",
+            autocomplete="email",
+        )
+        password = (
+            auth_form.text_input(
+                label="**Password**",
+                type="password",
+                placeholder="Enter your password",
+                autocomplete="current-password",
             )
-            auth_notification = col2.empty()
-
-            if do_you_have_an_account == "Yes":
-                if auth_form.form_submit_button(
-                    label="Sign In", use_container_width=True, type="primary"
-                ):
-                    with auth_notification, st.spinner("Signing in"):
-                        self.sign_in(email, password)
-
-                if auth_form.form_submit_button(
-                    label="Forgot Password", use_container_width=True, type="secondary"
-                ):
-                    with auth_notification, st.spinner("Sending password reset link"):
-                        self.reset_password(email)
-                if auth_form.form_submit_button(
-                    label="Continue as Guest",
-                    use_container_width=True,
-                    type="secondary",
-                ):
-                    self.sign_in_test_user()
-            elif do_you_have_an_account == "No" and auth_form.form_submit_button(
-                label="Create Account", use_container_width=True, type="primary"
+            if do_you_have_an_account in {"Yes", "No"}
+            else auth_form.empty()
+        )
+        auth_notification = col2.empty()
+
+        if do_you_have_an_account == "Yes":
+            if auth_form.form_submit_button(
+                label="Sign In", use_container_width=True, type="primary"
             ):
-                with auth_notification, st.spinner("Creating account"):
-                    self.create_account(email, password)
+                with auth_notification, st.spinner("Signing in"):
+                    self.sign_in(email, password)
 
-            if "auth_success" in st.session_state:
-                auth_notification.success(st.session_state.auth_success)
-                del st.session_state.auth_success
-            elif "auth_warning" in st.session_state:
-                auth_notification.error(st.session_state.auth_warning)
-                del st.session_state.auth_warning
+            if auth_form.form_submit_button(
+                label="Forgot Password", use_container_width=True, type="secondary"
+            ):
+                with auth_notification, st.spinner("Sending password reset link"):
+                    self.reset_password(email)
+            if auth_form.form_submit_button(
+                label="Continue as Guest",
+                use_container_width=True,
+                type="secondary",
+            ):
+                self.sign_in_test_user()
+        elif do_you_have_an_account == "No" and auth_form.form_submit_button(
+            label="Create Account", use_container_width=True, type="primary"
+        ):
+            with auth_notification, st.spinner("Creating account"):
+                self.create_account(email, password)
 
-        else:
-            self.home_page()
+        if "auth_success" in st.session_state:
+            auth_notification.success(st.session_state.auth_success)
+            del st.session_state.auth_success
+        elif "auth_warning" in st.session_state:
+            auth_notification.error(st.session_state.auth_warning)
+            del st.session_state.auth_warning
 
     def home_page(self):
         self.sidebar()
-        try:
-            if (
-                st.session_state.user_info["fullUserInfo"]["users"][0]["localId"]
-                != "test_user_id"
-                and st.session_state.user_info["fullUserInfo"]["users"][0]["email"]
-                != "test_user_email"
-                and st.session_state.user_info["idToken"] != "test_id_token"
-            ):
-                st.title(
-                    f"**Welcome, _{st.session_state.user_info['fullUserInfo']['users'][0]['email'].split('@')[0]}_!**"
-                )
-            else:
-                st.title("**Welcome, Guest!**")
-                st.warning(
-                    """
-                    # You are currently in guest mode.
-                    - Sign in to access your account.
-                    - You can still add items to your cart and browse the store.
-                    """
-                )
-        except:
+        # chat_pane stays outside any try: st.stop() and reruns inside it are
+        # raised as BaseExceptions and must reach Streamlit.
+        user_session = st.session_state.get("user_session")
+        if user_session is None:
             st.title("**Welcome!**")
+        elif not user_session.is_guest:
+            st.title(f"**Welcome, _{user_session.display_name}_!**")
+            self.chat_pane()
+        else:
+            st.title("**Welcome, Guest!**")
+            st.warning(
+                """
+                # You are currently in guest mode.
+                - Sign in to access your account.
+                - You can still add items to your cart and browse the store.
+                """
+            )
         st.info(
             """
             # AcademAI
             """
         )
 
+    @st.experimental_fragment
+    def chat_pane(self):
+        user_id = st.session_state.user_session.uid
+        history = self.load_user_chat_history()
+        for message in history.values():
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
+        prompt = st.chat_input("Ask AcademAI anything")
+        if prompt:
+            with st.chat_message("user"):
+                st.markdown(prompt)
+            self.push_chat_message_for_user(
+                user_id, {"role": "user", "content": prompt}
+            )
+            messages, oldest_included = self.build_assistant_context(
+                history, prompt, user_id
+            )
+            with st.chat_message("assistant"):
+                st.write_stream(self.stream_assistant_reply(user_id, messages))
+            self.fold_chat_history(history, oldest_included)
+
     def sidebar(self):
-        st.sidebar.write("# Your Account")
+        user_session = st.session_state.user_session
+        with st.sidebar:
+            st.write("# Your Account")
+            self.sign_out_pane()
+            if not user_session.is_guest:
+                with st.expander("**Premium Access**"):
+                    st.write(f"**Email:** {user_session.email}")
+                    st.success(
+                        f"""### Your account has premium access, this includes:"""
+                    )
+                    st.success(
+                        """ 
+                        - *Subcrition Plan: Base ($9.99/month)* \n
+                        - Chat with the AI assistant.\n
+                        - Premnium Support.\n
+                        **More features coming soon!**
+                        """
+                    )
+            else:
+                with st.expander("**Guest Access**"):
+
+                    st.warning(f"""### Your are in guest mode""")
+                    st.warning(
+                        """ 
+                        - *Subcrition Plan: Guest (Free)* \n
+                        - No AI assistant chat.\n
+                        - No premium support.\n
+                        - Just UI/UX experience.\n
+                        **Upgrade to premium for more features!**
+                        """
+                    )
+            if not user_session.is_guest:
+                with st.expander("**Search Chat History**"):
+                    self.search_pane()
+                with st.expander("**Course Material**"):
+                    self.documents_pane()
+                with st.expander("**Click for Account Settings**"):
+                    self.account_settings()
+
+            st.info(
+                """
+            # About
+            - Made with ❤️ by [AcademAI](#)
+            """
+            )
 
-        if st.sidebar.button("**Sign Out**"):
+    @st.experimental_fragment
+    def sign_out_pane(self):
+        user_session = st.session_state.user_session
+        if st.button("**Sign Out**"):
+            self.cancel_assistant_reply()
+            self.flush_chat_messages(user_session.uid)
             session_state_variables = [
-                "user_info",
+                "user_session",
                 "delete_account_warning_shown",
                 "delete_account_clicked",
+                "reauth_proof",
+                "search_query",
+                "search_page",
+                "prefetch",
+                "chat_summary",
+                "verified_id_token",
+                "verified_id_token_exp",
                 "auth_success",
                 "auth_warning",
                 "auth_error",
@@ -128,7 +224,7 @@ class App(FirebaseAuthenticator, RealtimeDB):
                     del st.session_state[var]
                 except KeyError:
                     continue
-            st.sidebar.success(
+            st.success(
                 """
                     ##### Signed out successfully.
                     - You have been signed out.
@@ -137,56 +233,85 @@ class App(FirebaseAuthenticator, RealtimeDB):
             )
             time.sleep(2)
             st.rerun()
-        if (
-            st.session_state.user_info["fullUserInfo"]["users"][0]["localId"]
-            != "test_user_id"
-            and st.session_state.user_info["fullUserInfo"]["users"][0]["email"]
-            != "test_user_email"
-            and st.session_state.user_info["idToken"] != "test_id_token"
-        ):
-            with st.sidebar.expander("**Premium Access**"):
-                st.write(
-                    f"**Email:** {st.session_state.user_info['fullUserInfo']['users'][0]['email']}"
-                )
-                st.success(f"""### Your account has premium access, this includes:""")
-                st.success(
-                    """ 
-                    - *Subcrition Plan: Base ($9.99/month)* \n
-                    - Chat with the AI assistant.\n
-                    - Premnium Support.\n
-                    **More features coming soon!**
-                    """
-                )
-        else:
-            with st.sidebar.expander("**Guest Access**"):
-
-                st.warning(f"""### Your are in guest mode""")
-                st.warning(
-                    """ 
-                    - *Subcrition Plan: Guest (Free)* \n
-                    - No AI assistant chat.\n
-                    - No premium support.\n
-                    - Just UI/UX experience.\n
-                    **Upgrade to premium for more features!**
-                    """
-                )
-        if (
-            st.session_state.user_info["fullUserInfo"]["users"][0]["localId"]
-            != "test_user_id"
-            and st.session_state.user_info["fullUserInfo"]["users"][0]["email"]
-            != "test_user_email"
-            and st.session_state.user_info["idToken"] != "test_id_token"
-        ):
-            with st.sidebar.expander("**Click for Account Settings**"):
-                self.account_settings()
 
-        st.sidebar.info(
-            """
-        # About
-        - Made with ❤️ by [AcademAI](#)
-        """
+    @st.experimental_fragment
+    def search_pane(self):
+        page_size = 5
+        query = st.text_input("Search your messages", key="search_query")
+        if not query:
+            return
+        page = st.number_input("Page", min_value=1, value=1, key="search_page")
+        total, hits = self.search_chat_history(
+            query, offset=(page - 1) * page_size, limit=page_size
         )
+        if not total:
+            st.caption("No messages match.")
+            return
+        pages = -(-total // page_size)
+        st.caption(f"{total} matching messages, page {min(page, pages)} of {pages}")
+        for key, message in hits:
+            st.markdown(f"**{message['role'].title()}:** {message['content'][:300]}")
+
+    @st.experimental_fragment
+    def documents_pane(self):
+        # Loads numpy; home page only.
+        from documents import DOCUMENT_TYPES, content_hash
 
+        user_id = st.session_state.user_session.uid
+        files = st.file_uploader(
+            "Add notes, slides or papers for the assistant to draw on",
+            type=list(DOCUMENT_TYPES),
+            accept_multiple_files=True,
+            key="document_upload",
+        )
+        if files and st.button("Add to library"):
+            # Duplicates are set aside first: the ingestor reports both them
+            # and files with no text as 0 passages added.
+            new, seen = [], set()
+            for file in files:
+                data = file.getvalue()
+                digest = content_hash(data)
+                if digest in seen or self.has_document(user_id, digest):
+                    st.info(f"{file.name} is already in your library.")
+                else:
+                    seen.add(digest)
+                    new.append((file.name, data))
+            with st.spinner("Reading documents..."):
+                added = self.ingest_documents(user_id, new) if new else []
+            for name, passages in added:
+                if passages is None:
+                    st.error(f"Could not read {name}.")
+                elif passages:
+                    st.success(f"Added {name} ({passages} passages).")
+                else:
+                    st.warning(
+                        f"No text found in {name}. Scanned or image-only PDFs "
+                        "cannot be searched yet."
+                    )
+        documents = self.list_documents(user_id)
+        for document in documents:
+            st.caption(f"{document['name']} · {document['passages']} passages")
+        if documents and st.button("Clear library"):
+            self.clear_documents(user_id)
+            st.rerun()
+
+    def developer_panel(self):
+        spans = current_rerun()
+        with st.sidebar.expander("**Developer: rerun timings**"):
+            if not spans:
+                st.caption("Enable [telemetry] in the secrets file to trace reruns.")
+                return
+            st.dataframe(
+                [
+                    {"span": name, "ms": round(elapsed * 1000, 2), "ok": not failed}
+                    for name, elapsed, failed in spans
+                ],
+                use_container_width=True,
+                hide_index=True,
+            )
+            st.caption("Spans nest: app.init includes the construction phases.")
+
+    @st.experimental_fragment
     def account_settings(self):
         with st.form(key="delete_account_form", clear_on_submit=True):
             st.subheader("Delete Account:")
@@ -194,7 +319,8 @@ class App(FirebaseAuthenticator, RealtimeDB):
             submit_button = st.form_submit_button(label="**Confirm Delete Account**")
             if submit_button:
                 if st.session_state.get("delete_account_warning_shown", False):
-                    # Verify the password again before deleting the account
+                    # Checked against the re-auth proof from the first click,
+                    # so retyping the password does not sign in again
                     if self.verify_password(password):
                         with st.spinner("Deleting account"):
                             self.delete_account(password)
@@ -229,9 +355,7 @@ class App(FirebaseAuthenticator, RealtimeDB):
             submit_button = st.form_submit_button(label="**Reset Password**")
             if submit_button:
                 with st.spinner("Resetting password"):
-                    self.reset_password(
-                        st.session_state.user_info["fullUserInfo"]["users"][0]["email"]
-                    )
+                    self.reset_password(st.session_state.user_session.email)
                 if "auth_success" in st.session_state:
                     st.success(st.session_state.auth_success)
                     del st.session_state.auth_success
@@ -0,0 +1,38 @@
+from concurrent.futures import Future
+from typing import Callable, Optional
+from io_executor import IOExecutor, get_io_executor
+
+
+class SessionPrefetch:
+    # Reads started together the moment a user signs in, run concurrently on
+    # the shared I/O executor while Streamlit reruns into the home page. The
+    # futures live in the user's session state; each is taken at most once,
+    # by the code that would otherwise have made the same read itself, so
+    # the first render waits for the slowest read instead of all of them in
+    # turn. Later reruns load the usual way.
+    def __init__(self, io: Optional[IOExecutor] = None) -> None:
+        self.io = io or get_io_executor()
+        self.futures = {}
+
+    def start(
+        self,
+        name: str,
+        target: str,
+        function: Callable,
+        *args,
+        coalesce=None,
+        scope=None,
+    ) -> None:
+        # function runs on an I/O thread: it must not touch st.* (session
+        # state, caches, secrets), so everything it needs is passed in.
+        self.futures[name] = self.io.submit(
+            target, function, *args, coalesce=coalesce, scope=scope
+        )
+
+    def take(self, name: str) -> Optional[Future]:
+        return self.futures.pop(name, None)
+
+    def cancel(self) -> None:
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Iterator, List, Optional
+
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL = 24 * 60 * 60
+# Number of trailing conversation messages that make up the cache key.
+DEFAULT_WINDOW = 3
+PUNCTUATION = re.compile(r"[^\w\s]")
+WHITESPACE = re.compile(r"\s+")
+REPLAY_CHUNK = re.compile(r"\S+\s*|\s+")
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return WHITESPACE.sub(" ", PUNCTUATION.sub(" ", text)).strip()
+
+
+def cache_key(
+    model: str,
+    system_prompt: str,
+    messages: List[dict],
+    window: int = DEFAULT_WINDOW,
+    scope: Optional[str] = None,
+) -> str:
+    # System messages (the rolling summary, retrieved passages) shape the
+    # reply as much as the last turns do, so they are part of the key
+    # verbatim wherever they sit, in or out of the window.
+    context = [
+        message["content"] for message in messages if message["role"] == "system"
+    ]
+    conversation = [message for message in messages if message["role"] != "system"]
+    recent = [
+        (message["role"], normalize(message["content"]))
+        for message in conversation[-window:]
+    ]
+    material = json.dumps(
+        [model, system_prompt, scope, context, recent], ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def replay(text: str) -> Iterator[str]:
+    # Cache hits go through the same generator interface as live streams.
+    for match in REPLAY_CHUNK.finditer(text):
+        yield match.group(0)
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl: float = DEFAULT_TTL,
+        path: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = None
+        if path is not None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(
+                path, check_same_thread=False, isolation_level=None
+            )
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, text TEXT NOT NULL, expires_at REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS responses_expiry ON responses (expires_at);"
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self.entries[key]
+                entry = None
+            if entry is None and self.connection is not None:
+                row = self.connection.execute(
+                    "SELECT expires_at, text FROM responses "
+                    "WHERE key = ? AND expires_at > ?",
+                    (key, now),
+                ).fetchone()
+                if row is not None:
+                    entry = self.entries[key] = row
+                    self.trim()
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, text: str) -> None:
+        expires_at = self.clock() + self.ttl
+        with self.lock:
+            self.entries[key] = (expires_at, text)
+            self.entries.move_to_end(key)
+            self.trim()
+            if self.connection is not None:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO responses (key, text, expires_at) "
+                    "VALUES (?, ?, ?)",
+                    (key, text, expires_at),
+                )
+                self.connection.execute(
+                    "DELETE FROM responses WHERE expires_at <= ?", (self.clock(),)
+                )
+
+    def trim(self) -> None:
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+            }
@@ -0,0 +1,291 @@
+import bisect
+import heapq
+import json
+import math
+import os
+import re
+import struct
+import tempfile
+import threading
+import zlib
+from array import array
+from collections import Counter, OrderedDict
+from typing import Iterable, List, Mapping, Tuple
+import numpy as np
+
+
+WORD_PATTERN = re.compile(r"\w+")
+# Okapi BM25 parameters.
+K1 = 1.2
+B = 0.75
+# A prefix never expands to more than this many terms (the most frequent win).
+MAX_EXPANSIONS = 64
+# Journal entries replayed on load before the snapshot is rewritten; the
+# limit grows with the index so rewrites stay amortised O(1) per message.
+JOURNAL_LIMIT = 1000
+MAGIC = b"ACSI1\n"
+HEADER = struct.Struct("<6Q")
+DEFAULT_MAX_LOADED = 64
+
+
+def tokenize(text: str) -> List[str]:
+    return WORD_PATTERN.findall(text.casefold())
+
+
+class ChatSearchIndex:
+    # Inverted index over one user's messages. Documents get dense ids in
+    # the order they are added; each term maps to parallel arrays of doc ids
+    # (ascending) and term frequencies. The history is append-only, so the
+    # only removal is dropping the whole index.
+    def __init__(self, snapshot_path: str, journal_path: str) -> None:
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.keys = []
+        self.ids = {}
+        self.lengths = array("I")
+        self.total_length = 0
+        self.postings = {}
+        self.vocabulary = None
+        self.norms = None
+        self.journaled = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.ids
+
+    def index(self, key: str, counts: Mapping[str, int]) -> None:
+        doc = len(self.keys)
+        self.keys.append(key)
+        self.ids[key] = doc
+        length = sum(counts.values())
+        self.lengths.append(length)
+        self.total_length += length
+        for term, count in counts.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = (array("I"), array("I"))
+                self.vocabulary = None
+            posting[0].append(doc)
+            posting[1].append(count)
+        self.norms = None
+
+    def add(self, messages: Iterable[Tuple[str, Mapping[str, str]]]) -> int:
+        # Indexes messages not seen yet and journals them; returns how many
+        # were new.
+        entries = []
+        with self.lock:
+            for key, message in messages:
+                if key in self.ids:
+                    continue
+                counts = Counter(tokenize(message.get("content", "")))
+                self.index(key, counts)
+                entries.append(json.dumps([key, counts], ensure_ascii=False))
+            if not entries:
+                return 0
+            with open(self.journal_path, "a", encoding="utf-8") as journal:
+                journal.write("\n".join(entries) + "\n")
+            self.journaled += len(entries)
+            if self.journaled >= max(JOURNAL_LIMIT, len(self.keys) // 2):
+                self.save()
+        return len(entries)
+
+    def expand(self, prefix: str) -> List[str]:
+        if self.vocabulary is None:
+            self.vocabulary = sorted(self.postings)
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        end = bisect.bisect_left(self.vocabulary, prefix + "\U0010ffff", start)
+        matches = self.vocabulary[start:end]
+        if len(matches) > MAX_EXPANSIONS:
+            matches = heapq.nlargest(
+                MAX_EXPANSIONS, matches, key=lambda term: len(self.postings[term][0])
+            )
+        return matches
+
+    def doc_norms(self) -> np.ndarray:
+        # K1 * (1 - B + B * |d| / avgdl) per document, cached until an add.
+        if self.norms is None:
+            lengths = np.frombuffer(self.lengths, dtype=np.uint32).astype(np.float64)
+            average = self.total_length / len(self.keys) or 1.0
+            self.norms = K1 * (1 - B + B * lengths / average)
+        return self.norms
+
+    def search(
+        self, query: str, offset: int = 0, limit: int = 10, prefix: bool = True
+    ) -> Tuple[int, List[Tuple[str, float]]]:
+        # BM25 over the query terms; with prefix, the last term also matches
+        # longer words ("deriv" finds "derivative"). Returns the number of
+        # matching messages and one page of (key, score), best first.
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return 0, []
+        with self.lock:
+            if not self.keys:
+                return 0, []
+            groups = [[term] for term in terms]
+            if prefix:
+                groups[-1] = self.expand(terms[-1]) or groups[-1]
+            norms = self.doc_norms()
+            documents = len(self.keys)
+            scores = np.zeros(documents)
+            for group in groups:
+                for term in group:
+                    posting = self.postings.get(term)
+                    if posting is None:
+                        continue
+                    # Views over the postings; dropped before the lock is.
+                    docs = np.frombuffer(posting[0], dtype=np.uint32)
+                    counts = np.frombuffer(posting[1], dtype=np.uint32)
+                    frequency = len(docs)
+                    idf = math.log(
+                        1 + (documents - frequency + 0.5) / (frequency + 0.5)
+                    )
+                    counts = counts.astype(np.float64)
+                    # Doc ids are unique within a posting, so += cannot collide.
+                    scores[docs] += idf * (K1 + 1) * counts / (counts + norms[docs])
+                    del docs, counts
+            matched = np.flatnonzero(scores)
+            wanted = offset + limit
+            if wanted <= 0 or offset >= len(matched):
+                return len(matched), []
+            candidates = matched
+            if wanted < len(matched):
+                # Everything scoring at least the wanted-th best, ties included,
+                # so the tie-break below sees all of them.
+                cut = -np.partition(-scores[matched], wanted - 1)[wanted - 1]
+                candidates = matched[scores[matched] >= cut]
+            # Best score first; newer messages win ties.
+            order = np.lexsort((-candidates, -scores[candidates]))
+            page = candidates[order][offset:wanted]
+            return len(matched), [
+                (self.keys[doc], float(scores[doc])) for doc in page.tolist()
+            ]
+
+    def dump(self) -> bytes:
+        # keys, lengths, terms, document frequencies, delta-coded doc ids and
+        # term frequencies, zlib-compressed. Arrays are in native byte order:
+        # the file is a local cache, never shipped between machines.
+        terms = sorted(self.postings)
+        frequencies = array("I", (len(self.postings[term][0]) for term in terms))
+        docs, counts = array("I"), array("I")
+        for term in terms:
+            docs.extend(self.postings[term][0])
+            counts.extend(self.postings[term][1])
+        deltas = np.array(docs, dtype=np.uint32)
+        deltas[1:] -= deltas[:-1].copy()
+        # Each term's first doc id is stored as is.
+        starts = np.cumsum(frequencies, dtype=np.int64)[:-1]
+        deltas[starts] = np.frombuffer(docs, dtype=np.uint32)[starts]
+        parts = [
+            "\n".join(self.keys).encode(),
+            self.lengths.tobytes(),
+            "\n".join(terms).encode(),
+            frequencies.tobytes(),
+            deltas.tobytes(),
+            counts.tobytes(),
+        ]
+        return MAGIC + zlib.compress(HEADER.pack(*map(len, parts)) + b"".join(parts))
+
+    def restore(self, data: bytes) -> None:
+        payload = zlib.decompress(data[len(MAGIC) :])
+        sizes = HEADER.unpack_from(payload)
+        parts, offset = [], HEADER.size
+        for size in sizes:
+            parts.append(payload[offset : offset + size])
+            offset += size
+        keys, lengths, terms, frequencies, deltas, counts = parts
+        self.keys = keys.decode().split("\n") if keys else []
+        self.ids = {key: doc for doc, key in enumerate(self.keys)}
+        self.lengths = array("I", lengths)
+        self.total_length = sum(self.lengths)
+        frequencies = array("I", frequencies)
+        # A running sum over every posting, rebased at each term's start.
+        sums = np.cumsum(np.frombuffer(deltas, dtype=np.uint32), dtype=np.int64)
+        terms = terms.decode().split("\n") if terms else []
+        position = 0
+        for term, frequency in zip(terms, frequencies):
+            end = position + frequency
+            base = sums[position - 1] if position else 0
+            docs = (sums[position:end] - base).astype(np.uint32)
+            self.postings[term] = (
+                array("I", docs.tobytes()),
+                array("I", counts[4 * position : 4 * end]),
+            )
+            position = end
+
+    def load(self) -> None:
+        try:
+            with open(self.snapshot_path, "rb") as file:
+                data = file.read()
+            if data.startswith(MAGIC):
+                self.restore(data)
+        except (OSError, ValueError, zlib.error, struct.error):
+            self.__init__(self.snapshot_path, self.journal_path)
+        try:
+            with open(self.journal_path, encoding="utf-8") as journal:
+                for line in journal:
+                    try:
+                        key, counts = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-append.
+                        continue
+                    if key not in self.ids:
+                        self.index(key, counts)
+                        self.journaled += 1
+        except OSError:
+            pass
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.snapshot_path)
+        handle, temporary = tempfile.mkstemp(dir=directory, prefix=".")
+        with os.fdopen(handle, "wb") as file:
+            file.write(self.dump())
+        os.replace(temporary, self.snapshot_path)
+        open(self.journal_path, "w").close()
+        self.journaled = 0
+
+
+class SearchIndexes:
+    # Per-user indexes under one directory, loaded on demand and kept in an
+    # LRU of at most max_loaded users.
+    def __init__(self, directory: str, max_loaded: int = DEFAULT_MAX_LOADED) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_loaded = max_loaded
+        self.loaded = OrderedDict()
+        self.lock = threading.Lock()
+
+    def paths(self, uid: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory, uid)
+        return base + ".idx", base + ".log"
+
+    def get(self, uid: str) -> ChatSearchIndex:
+        with self.lock:
+            index = self.loaded.get(uid)
+            if index is not None:
+                self.loaded.move_to_end(uid)
+                return index
+            index = ChatSearchIndex(*self.paths(uid))
+            index.load()
+            self.loaded[uid] = index
+            while len(self.loaded) > self.max_loaded:
+                self.loaded.popitem(last=False)
+            return index
+
+    def drop(self, uid: str) -> None:
+        with self.lock:
+            index = self.loaded.pop(uid, None)
+            if index is not None:
+                with index.lock:
+                    self.remove_files(uid)
+            else:
+                self.remove_files(uid)
+
+    def remove_files(self, uid: str) -> None:
+        for path in self.paths(uid):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,60 @@
+from typing import Optional
+
+
+GUEST_UID = "test_user_id"
+GUEST_EMAIL = "test_user_email"
+GUEST_ID_TOKEN = "test_id_token"
+
+
+class UserSession:
+    # One per signed-in browser session, kept in st.session_state. Only the
+    # fields the app reads are stored, without a per-instance __dict__, so
+    # thousands of concurrent sessions stay cheap.
+    __slots__ = ("uid", "email", "id_token", "refresh_token", "expires_at", "guest")
+
+    def __init__(
+        self,
+        uid: str,
+        email: Optional[str],
+        id_token: Optional[str],
+        refresh_token: Optional[str] = None,
+        expires_at: float = 0.0,
+        guest: bool = False,
+    ) -> None:
+        self.uid = uid
+        self.email = email
+        self.id_token = id_token
+        self.refresh_token = refresh_token
+        self.expires_at = expires_at
+        self.guest = guest
+
+    @classmethod
+    def from_claims(cls, claims: dict, tokens: dict) -> "UserSession":
+        return cls(
+            uid=claims["user_id"],
+            email=claims.get("email"),
+            id_token=tokens["idToken"],
+            refresh_token=tokens.get("refreshToken"),
+            expires_at=claims["exp"],
+        )
+
+    @classmethod
+    def for_guest(cls) -> "UserSession":
+        return cls(GUEST_UID, GUEST_EMAIL, GUEST_ID_TOKEN, guest=True)
+
+    @property
+    def is_guest(self) -> bool:
+        return self.guest
+
+    @property
+    def display_name(self) -> str:
+        return (self.email or "").split("@")[0]
+
+    def apply_tokens(self, tokens: dict) -> None:
+        self.id_token = tokens["idToken"]
+        self.refresh_token = tokens["refreshToken"]
+        self.expires_at = tokens["expiresAt"]
+
+    def __repr__(self) -> str:
+        # Tokens are left out so that sessions can be logged safely.
+        return f"UserSession(uid={self.uid!r}, guest={self.guest!r})"
@@ -0,0 +1,174 @@
+import bisect
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Tuple
+
+
+# Upper bounds in seconds, from a cached lookup up to a slow cold start.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+METRIC_NAME = "academai_span_duration_seconds"
+ERROR_METRIC_NAME = "academai_span_errors_total"
+
+logger = logging.getLogger("academai.telemetry")
+# Spans finished during the current script rerun, when one is being traced.
+rerun_spans = contextvars.ContextVar("rerun_spans", default=None)
+# Shared by every span() call while telemetry is off, so tracing costs one
+# global lookup and a no-op context manager.
+NULL_SPAN = nullcontext()
+enabled = False
+log_spans = False
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "errors")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float, failed: bool) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.errors += failed
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float, failed: bool = False) -> None:
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds, failed)
+
+    def render(self) -> str:
+        # Prometheus text exposition format, version 0.0.4.
+        lines = [
+            f"# HELP {METRIC_NAME} Time spent in traced calls.",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        errors = [
+            f"# HELP {ERROR_METRIC_NAME} Traced calls that raised.",
+            f"# TYPE {ERROR_METRIC_NAME} counter",
+        ]
+        with self.lock:
+            snapshot = [
+                (name, list(histogram.counts), histogram.total, histogram.errors)
+                for name, histogram in sorted(self.histograms.items())
+            ]
+        for name, counts, total, failed in snapshot:
+            label = f'span="{name}"'
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS + ("+Inf",), counts):
+                cumulative += bucket
+                lines.append(
+                    f'{METRIC_NAME}_bucket{{{label},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f"{METRIC_NAME}_sum{{{label}}} {total:.6f}")
+            lines.append(f"{METRIC_NAME}_count{{{label}}} {cumulative}")
+            errors.append(f"{ERROR_METRIC_NAME}{{{label}}} {failed}")
+        return "\n".join(lines + errors) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class Span:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> "Span":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        elapsed = time.perf_counter() - self.started
+        failed = exc_type is not None
+        metrics.observe(self.name, elapsed, failed)
+        spans = rerun_spans.get()
+        if spans is not None:
+            spans.append((self.name, elapsed, failed))
+        if log_spans:
+            logger.info(
+                json.dumps(
+                    {
+                        "span": self.name,
+                        "ms": round(elapsed * 1000, 3),
+                        "ok": not failed,
+                    }
+                )
+            )
+
+
+def span(name: str):
+    return Span(name) if enabled else NULL_SPAN
+
+
+def traced(name: str) -> Callable:
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with Span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def begin_rerun() -> None:
+    # Starts a fresh per-rerun span list for the developer panel; spans from
+    # background threads only feed the histograms.
+    rerun_spans.set([] if enabled else None)
+
+
+def current_rerun() -> List[Tuple[str, float, bool]]:
+    return list(rerun_spans.get() or ())
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("content-type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+def configure(
+    enable: bool, log: bool = False, metrics_port: Optional[int] = None
+) -> Optional[ThreadingHTTPServer]:
+    global enabled, log_spans
+    enabled = enable
+    log_spans = enable and log
+    if enable and metrics_port:
+        return serve_metrics(metrics_port)
+    return None
@@ -0,0 +1,80 @@
+import datetime
+import os
+import sys
+import time
+import jwt
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROJECT_ID = "test-project"
+
+
+class TestSigningKey:
+    # A locally generated RSA key and self-signed certificate, served in the
+    # {kid: pem} shape of Google's securetoken certificate endpoint.
+    def __init__(self, kid: str = "test-key") -> None:
+        self.kid = kid
+        self.private_key = rsa.generate_private_key(
+            public_exponent=65537, key_size=2048
+        )
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "test")])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        certificate = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(self.private_key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(self.private_key, hashes.SHA256())
+        )
+        self.certificate_pem = certificate.public_bytes(
+            serialization.Encoding.PEM
+        ).decode()
+
+    def certificates(self) -> dict:
+        return {self.kid: self.certificate_pem}
+
+    def mint(self, now: float, kid: str = None, **overrides) -> str:
+        claims = {
+            "iss": "https://securetoken.google.com/" + PROJECT_ID,
+            "aud": PROJECT_ID,
+            "auth_time": int(now),
+            "user_id": "uid-1",
+            "sub": "uid-1",
+            "iat": int(now),
+            "exp": int(now) + 3600,
+            "email": "student@example.com",
+            "email_verified": True,
+        }
+        claims.update(overrides)
+        return jwt.encode(
+            claims,
+            self.private_key,
+            algorithm="RS256",
+            headers={"kid": kid or self.kid},
+        )
+
+
+class FakeClock:
+    def __init__(self, now: float = None) -> None:
+        self.now = time.time() if now is None else now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture(scope="session")
+def signing_key() -> TestSigningKey:
+    return TestSigningKey()
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
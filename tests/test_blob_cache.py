@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+import pytest
+from blob_cache import BlobCache
+
+
+class Origin:
+    # The blob store behind the cache: counts downloads and validator reads.
+    def __init__(self, data: bytes = b"image", validator: str = "v1") -> None:
+        self.data = data
+        self.validator = validator
+        self.fetches = 0
+        self.validations = 0
+        self.gate = None
+
+    def fetch(self) -> bytes:
+        self.fetches += 1
+        if self.gate is not None:
+            assert self.gate.wait(5)
+        return self.data
+
+    def validate(self) -> str:
+        self.validations += 1
+        return self.validator
+
+
+@pytest.fixture
+def cache(tmp_path, clock) -> BlobCache:
+    return BlobCache(str(tmp_path), max_bytes=10, revalidate_after=60, clock=clock)
+
+
+def get(cache: BlobCache, name: str, origin: Origin):
+    found = cache.get_or_fetch(name, origin.fetch, origin.validate)
+    return None if found is None else bytes(found)
+
+
+def test_concurrent_misses_share_one_download(cache):
+    origin = Origin()
+    origin.gate = threading.Event()
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(get(cache, "a", origin)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    # Let the others queue up behind the first download.
+    while not origin.fetches:
+        time.sleep(0.001)
+    time.sleep(0.05)
+    origin.gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == [b"image"] * 5
+    assert origin.fetches == 1
+
+
+def test_failed_download_is_not_cached(cache):
+    def unreachable() -> bytes:
+        raise ConnectionError("rtdb unreachable")
+
+    with pytest.raises(ConnectionError):
+        cache.get_or_fetch("a", unreachable)
+    assert cache.get_or_fetch("a", lambda: None) is None
+    assert get(cache, "a", Origin()) == b"image"
+
+
+def test_least_recently_used_blob_is_evicted(cache, tmp_path):
+    for name in ("a", "b"):
+        get(cache, name, Origin(b"1234"))
+    get(cache, "a", Origin(b"1234"))
+    get(cache, "c", Origin(b"1234"))
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.total == 8
+    assert not os.path.exists(tmp_path / "b")
+
+
+def test_hits_are_revalidated_after_a_while(cache, clock):
+    origin = Origin()
+    get(cache, "a", origin)
+    assert origin.validations == 1
+    clock.now += 59
+    assert get(cache, "a", origin) == b"image"
+    assert origin.validations == 1
+    clock.now += 1
+    assert get(cache, "a", origin) == b"image"
+    assert (origin.fetches, origin.validations) == (1, 2)
+    # A changed validator means the blob was replaced: download it again.
+    clock.now += 60
+    origin.data, origin.validator = b"new", "v2"
+    assert get(cache, "a", origin) == b"new"
+    assert origin.fetches == 2
+
+
+def test_blob_gone_at_the_origin_is_dropped(cache, clock):
+    origin = Origin()
+    get(cache, "a", origin)
+    clock.now += 60
+    origin.validator = None
+    origin.data = None
+    assert get(cache, "a", origin) is None
+    assert "a" not in cache.entries
+
+
+def test_files_from_a_previous_process_are_revalidated(tmp_path, clock):
+    get(BlobCache(str(tmp_path), clock=clock), "a", Origin())
+    cache = BlobCache(str(tmp_path), clock=clock)
+    assert cache.total == len(b"image")
+    origin = Origin(b"fresh")
+    # The validator was not persisted, so the first hit cannot be trusted.
+    assert get(cache, "a", origin) == b"fresh"
+    assert origin.fetches == 1
@@ -0,0 +1,181 @@
+import json
+import pytest
+import requests
+from circuit_breaker import CircuitBreaker, CircuitBreakerRegistry, CircuitOpen
+from transport import IdentityToolkitClient
+
+
+def response(status: int, message: str = None) -> requests.Response:
+    result = requests.Response()
+    result.status_code = status
+    payload = {"error": {"code": status, "message": message}} if message else {}
+    result._content = json.dumps(payload).encode()
+    return result
+
+
+class FakeTransport:
+    # Answers every post with the response queued for its email, or the
+    # default one.
+    def __init__(self, default: requests.Response) -> None:
+        self.default = default
+        self.by_email = {}
+        self.posts = []
+
+    def post(self, url: str, data: str, coalesce=None) -> requests.Response:
+        email = json.loads(data).get("email")
+        self.posts.append((url.split("?")[0].rsplit("/", 1)[-1], email))
+        return self.by_email.get(email, self.default)
+
+
+@pytest.fixture
+def breaker(clock) -> CircuitBreaker:
+    # No jitter: every opening lasts exactly base_delay * 2**openings.
+    return CircuitBreaker(
+        "test", threshold=3, base_delay=1.0, clock=clock, jitter=lambda: 1.0
+    )
+
+
+def client(clock, transport) -> IdentityToolkitClient:
+    toolkit = IdentityToolkitClient("key", transport=transport, base_url="http://it")
+    toolkit.breakers = CircuitBreakerRegistry(
+        threshold=2, base_delay=10.0, clock=clock, jitter=lambda: 1.0
+    )
+    return toolkit
+
+
+def sign_in(toolkit, email: str):
+    try:
+        return toolkit.post("verifyPassword", {"email": email, "password": "pw"})
+    except CircuitOpen as error:
+        return error
+
+
+def test_closed_open_half_open_closed(breaker, clock):
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpen) as raised:
+        breaker.before_call()
+    assert raised.value.retry_after == pytest.approx(1.0)
+    clock.now += 1.0
+    # Half-open: one probe goes through, everything else still fails fast.
+    breaker.before_call()
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    breaker.record_success()
+    breaker.before_call()
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_with_longer_backoff(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 1.0
+    breaker.before_call()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpen) as raised:
+        breaker.before_call()
+    assert raised.value.retry_after == pytest.approx(2.0)
+    clock.now += 2.0
+    breaker.before_call()
+    breaker.record_success()
+    # A success resets the backoff as well.
+    for _ in range(3):
+        breaker.record_failure()
+    with pytest.raises(CircuitOpen) as raised:
+        breaker.before_call()
+    assert raised.value.retry_after == pytest.approx(1.0)
+
+
+def test_released_probe_lets_the_next_one_through(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 1.0
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+
+
+def test_success_resets_consecutive_failures(breaker):
+    for _ in range(5):
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+    breaker.before_call()
+
+
+def test_guard_releases_other_breakers_when_one_is_open(clock):
+    registry = CircuitBreakerRegistry(threshold=1, clock=clock, jitter=lambda: 1.0)
+    registry.breaker("email:a").record_failure()
+    with pytest.raises(CircuitOpen):
+        with registry.guard("endpoint", "email:a"):
+            pass
+    with registry.guard("endpoint", None) as breakers:
+        assert [breaker.key for breaker in breakers] == ["endpoint"]
+
+
+def test_server_errors_open_the_endpoint_circuit_for_everyone(clock):
+    transport = FakeTransport(response(503, "UNAVAILABLE"))
+    toolkit = client(clock, transport)
+    for email in ("a@example.com", "b@example.com"):
+        assert sign_in(toolkit, email).status_code == 503
+    assert isinstance(sign_in(toolkit, "c@example.com"), CircuitOpen)
+    assert len(transport.posts) == 2
+    # Other endpoints have circuits of their own.
+    assert toolkit.post("getAccountInfo", {"idToken": "t"}).status_code == 503
+
+
+def test_blocked_account_opens_only_its_email_circuit(clock):
+    transport = FakeTransport(response(200))
+    transport.by_email["blocked@example.com"] = response(400, "USER_DISABLED")
+    toolkit = client(clock, transport)
+    for _ in range(2):
+        assert sign_in(toolkit, "blocked@example.com").status_code == 400
+    assert isinstance(sign_in(toolkit, "Blocked@Example.com "), CircuitOpen)
+    assert sign_in(toolkit, "other@example.com").status_code == 200
+    assert len(transport.posts) == 3
+
+
+def test_throttling_opens_both_circuits(clock):
+    transport = FakeTransport(response(200))
+    transport.by_email["a@example.com"] = response(
+        400, "TOO_MANY_ATTEMPTS_TRY_LATER : Too many unsuccessful attempts."
+    )
+    toolkit = client(clock, transport)
+    for _ in range(2):
+        sign_in(toolkit, "a@example.com")
+    assert isinstance(sign_in(toolkit, "a@example.com"), CircuitOpen)
+    assert isinstance(sign_in(toolkit, "b@example.com"), CircuitOpen)
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "INVALID_PASSWORD",
+        "EMAIL_NOT_FOUND",
+        "INVALID_LOGIN_CREDENTIALS",
+        "WEAK_PASSWORD",
+    ],
+)
+def test_user_errors_never_trip(clock, message):
+    transport = FakeTransport(response(400, message))
+    toolkit = client(clock, transport)
+    for _ in range(10):
+        assert sign_in(toolkit, "typo@example.com").status_code == 400
+    assert len(transport.posts) == 10
+    transport.default = response(200)
+    assert sign_in(toolkit, "typo@example.com").status_code == 200
+
+
+def test_connection_errors_count_against_the_endpoint(clock):
+    class Unreachable:
+        def post(self, *args, **kwargs):
+            raise requests.exceptions.ConnectionError("unreachable")
+
+    toolkit = client(clock, Unreachable())
+    for email in ("a@example.com", "b@example.com"):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            toolkit.post("verifyPassword", {"email": email})
+    assert isinstance(sign_in(toolkit, "c@example.com"), CircuitOpen)
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+from context_builder import MESSAGE_OVERHEAD, PASSAGE_INSTRUCTIONS, ContextBuilder
+
+
+def words(text: str) -> int:
+    return len(text.split())
+
+
+def history(*contents: str) -> OrderedDict:
+    return OrderedDict(
+        (f"k{index}", {"role": "user" if index % 2 == 0 else "assistant", "content": c})
+        for index, c in enumerate(contents)
+    )
+
+
+def builder(**kwargs) -> ContextBuilder:
+    # One token per word, so budgets are easy to count by hand.
+    return ContextBuilder(count=words, **kwargs)
+
+
+def cost(content: str) -> int:
+    return words(content) + MESSAGE_OVERHEAD
+
+
+def test_newest_messages_that_fit_the_budget():
+    turns = history(*["a b c"] * 5)
+    # The prompt and three turns fit; a fourth would not.
+    budget = cost("prompt") + 3 * cost("a b c") + 1
+    messages, oldest = builder(budget=budget).build(turns, "prompt")
+    assert oldest == "k2"
+    assert messages == [
+        {"role": turns[key]["role"], "content": "a b c"} for key in ("k2", "k3", "k4")
+    ] + [{"role": "user", "content": "prompt"}]
+
+
+def test_stops_at_the_first_message_that_does_not_fit():
+    turns = history("old", "a long message " * 10, "new")
+    budget = cost("prompt") + cost("new") + cost("old")
+    messages, oldest = builder(budget=budget).build(turns, "prompt")
+    assert oldest == "k2"
+    assert [message["content"] for message in messages] == ["new", "prompt"]
+
+
+def test_nothing_fits():
+    messages, oldest = builder(budget=cost("prompt")).build(history("a"), "prompt")
+    assert oldest is None
+    assert messages == [{"role": "user", "content": "prompt"}]
+
+
+def test_summary_replaces_the_messages_it_covers():
+    turns = history("one", "two", "three", "four")
+    summary = {"text": "one and two", "upto": "k1"}
+    messages, oldest = builder().build(turns, "prompt", summary)
+    assert oldest == "k2"
+    assert messages[0]["role"] == "system"
+    assert messages[0]["content"].endswith("one and two")
+    assert [message["content"] for message in messages[1:]] == [
+        "three",
+        "four",
+        "prompt",
+    ]
+
+
+def test_passages_stay_within_their_budget():
+    passages = [("notes.pdf", "w " * 5), ("slides.pdf", "w " * 5), ("x.pdf", "w")]
+    instructions = words(PASSAGE_INSTRUCTIONS) + MESSAGE_OVERHEAD
+    # Room for the instructions, the first excerpt and the short third one,
+    # but excerpts are taken best first and stop at the first misfit.
+    passage_budget = (
+        instructions + words("[notes.pdf] " + "w " * 5) + words("[x.pdf] w")
+    )
+    messages, _ = builder(passage_budget=passage_budget).build(
+        history("hi"), "prompt", passages=passages
+    )
+    assert messages[0]["role"] == "system"
+    assert messages[0]["content"].startswith(PASSAGE_INSTRUCTIONS)
+    assert "[notes.pdf]" in messages[0]["content"]
+    assert "[slides.pdf]" not in messages[0]["content"]
+    assert "[x.pdf]" not in messages[0]["content"]
+    assert [message["content"] for message in messages[1:]] == ["hi", "prompt"]
+
+
+def test_pending_fold_waits_for_the_threshold():
+    turns = history("a b", "c d", "e f", "g h")
+    context = builder(fold_threshold=2 * cost("a b"))
+    # Only k0 fell out of the window: below the threshold.
+    assert context.pending_fold(turns, "k1") == []
+    # k0 and k1 did, oldest first.
+    assert [key for key, _ in context.pending_fold(turns, "k2")] == ["k0", "k1"]
+
+
+def test_pending_fold_skips_what_is_summarized():
+    turns = history("a b", "c d", "e f", "g h")
+    context = builder(fold_threshold=cost("a b"))
+    summary = {"text": "a b", "upto": "k0"}
+    assert [key for key, _ in context.pending_fold(turns, "k2", summary)] == ["k1"]
+    # With nothing in the window, every unsummarized message is pending.
+    assert [key for key, _ in context.pending_fold(turns, None, summary)] == [
+        "k1",
+        "k2",
+        "k3",
+    ]
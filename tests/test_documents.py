@@ -0,0 +1,28 @@
+import pytest
+from documents import DocumentIngestor, content_hash
+from embeddings import HashingEmbedder
+from vector_index import VectorStore
+
+
+@pytest.fixture
+def ingestor(tmp_path):
+    embedder = HashingEmbedder(dimensions=64)
+    store = VectorStore(str(tmp_path), embedder.name, embedder.dimensions)
+    ingestor = DocumentIngestor(store, embedder, workers=1)
+    yield ingestor
+    ingestor.close()
+
+
+def test_document_without_text_is_not_stored(ingestor):
+    blank = b"   \n\n  "
+    assert ingestor.ingest("uid-a", [("blank.txt", blank)]) == [("blank.txt", 0)]
+    assert not ingestor.store.has_document("uid-a", content_hash(blank))
+    assert ingestor.store.documents("uid-a") == []
+
+
+def test_duplicate_is_found_before_ingesting(ingestor):
+    notes = b"eigenvalues of a symmetric matrix are real"
+    assert ingestor.ingest("uid-a", [("notes.txt", notes)]) == [("notes.txt", 1)]
+    assert ingestor.store.has_document("uid-a", content_hash(notes))
+    assert not ingestor.store.has_document("uid-b", content_hash(notes))
+    assert ingestor.ingest("uid-a", [("copy.txt", notes)]) == [("copy.txt", 0)]
@@ -0,0 +1,163 @@
+import json
+from collections import OrderedDict
+import pytest
+from db import sync_chat_history
+from history_cache import ChatHistoryCache
+
+
+def message(content: str) -> dict:
+    return {"role": "user", "content": content}
+
+
+def size(key: str, content: str) -> int:
+    # What the cache accounts for one message: its key and JSON payload.
+    return len(key) + len(json.dumps(message(content)))
+
+
+class Snapshot:
+    def __init__(self, value) -> None:
+        self.value = value
+
+    def val(self):
+        return self.value
+
+
+class HistoryQuery:
+    # Just enough of the firebase query builder for read_chat_history_pages
+    # against users/{uid}/chat_history, ordered by key.
+    def __init__(self, database: "HistoryDatabase", path: tuple = ()) -> None:
+        self.database = database
+        self.path = path
+        self.start = self.end = None
+        self.first = self.last = None
+
+    def child(self, name: str) -> "HistoryQuery":
+        return HistoryQuery(self.database, self.path + (name,))
+
+    def order_by_key(self) -> "HistoryQuery":
+        return self
+
+    def start_at(self, key: str) -> "HistoryQuery":
+        self.start = key
+        return self
+
+    def end_at(self, key: str) -> "HistoryQuery":
+        self.end = key
+        return self
+
+    def limit_to_first(self, count: int) -> "HistoryQuery":
+        self.first = count
+        return self
+
+    def limit_to_last(self, count: int) -> "HistoryQuery":
+        self.last = count
+        return self
+
+    def get(self, token=None) -> Snapshot:
+        self.database.starts.append(self.start)
+        keys = sorted(
+            key
+            for key in self.database.messages
+            if (self.start is None or key >= self.start)
+            and (self.end is None or key <= self.end)
+        )
+        if self.first is not None:
+            keys = keys[: self.first]
+        if self.last is not None:
+            keys = keys[-self.last :]
+        return Snapshot(OrderedDict((key, self.database.messages[key]) for key in keys))
+
+
+class HistoryDatabase:
+    database_url = "http://rtdb.example.com"
+
+    def __init__(self, messages: dict) -> None:
+        self.messages = dict(messages)
+        # The start_at cursor of every request, in order.
+        self.starts = []
+
+    def child(self, name: str) -> HistoryQuery:
+        return HistoryQuery(self, (name,))
+
+
+@pytest.fixture
+def cache(tmp_path, clock) -> ChatHistoryCache:
+    return ChatHistoryCache(str(tmp_path / "history.sqlite3"), clock=clock)
+
+
+def cached_bytes(cache: ChatHistoryCache, uid: str) -> int:
+    row = cache.connection.execute(
+        "SELECT bytes FROM users WHERE uid = ?", (uid,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def test_sync_resumes_from_the_synced_key(cache):
+    database = HistoryDatabase({"k1": message("one"), "k2": message("two")})
+    sync_chat_history(database, cache, "uid-1", lambda: "token")
+    assert database.starts == [None]
+    assert cache.synced_key("uid-1") == "k2"
+    # Another device writes k3; this one writes k4 itself and caches it.
+    database.messages["k3"] = message("three")
+    database.messages["k4"] = message("four")
+    cache.store("uid-1", {"k4": message("four")})
+    assert cache.synced_key("uid-1") == "k2"
+    sync_chat_history(database, cache, "uid-1", lambda: "token")
+    assert database.starts[1:] == ["k2"]
+    assert list(cache.load("uid-1")) == ["k1", "k2", "k3", "k4"]
+    assert cache.synced_key("uid-1") == "k4"
+
+
+def test_synced_key_never_moves_back(cache):
+    cache.mark_synced("uid-1", "k5")
+    cache.mark_synced("uid-1", "k3")
+    cache.mark_synced("uid-1", None)
+    assert cache.synced_key("uid-1") == "k5"
+
+
+def test_freshness_follows_the_clock(cache, clock):
+    assert not cache.is_fresh("uid-1")
+    cache.mark_synced("uid-1", "k1")
+    assert cache.is_fresh("uid-1")
+    clock.now += cache.max_staleness
+    assert not cache.is_fresh("uid-1")
+
+
+def test_invalidate_drops_messages_and_sync_state(cache):
+    cache.store("uid-1", {"k1": message("one")})
+    cache.mark_synced("uid-1", "k1")
+    assert cache.load("uid-1")
+    cache.store("uid-2", {"k1": message("other")})
+    cache.invalidate("uid-1")
+    assert cache.load("uid-1") == OrderedDict()
+    assert cache.synced_key("uid-1") is None
+    assert not cache.is_fresh("uid-1")
+    assert cached_bytes(cache, "uid-1") == 0
+    assert list(cache.load("uid-2")) == ["k1"]
+
+
+def test_bytes_count_replaced_messages_once(cache):
+    cache.store("uid-1", {"k1": message("one"), "k2": message("two")})
+    assert cached_bytes(cache, "uid-1") == size("k1", "one") + size("k2", "two")
+    cache.store("uid-1", {"k2": message("two, edited")})
+    assert cached_bytes(cache, "uid-1") == (
+        size("k1", "one") + size("k2", "two, edited")
+    )
+
+
+def test_evicts_least_recently_used_users(tmp_path, clock):
+    cache = ChatHistoryCache(
+        str(tmp_path / "history.sqlite3"),
+        max_bytes=2 * size("k1", "aaaa"),
+        clock=clock,
+    )
+    for uid in ("uid-a", "uid-b"):
+        cache.store(uid, {"k1": message("aaaa")})
+        clock.now += 1
+    cache.load("uid-a")
+    clock.now += 1
+    # Over budget: uid-b was used longest ago; the user being stored stays.
+    cache.store("uid-c", {"k1": message("aaaa")})
+    assert cache.load("uid-b") == OrderedDict()
+    assert list(cache.load("uid-a")) == ["k1"]
+    assert list(cache.load("uid-c")) == ["k1"]
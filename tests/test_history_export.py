@@ -0,0 +1,77 @@
+import threading
+import pytest
+from history_export import ImportCheckpoint, import_messages
+
+MESSAGES = [
+    (f"k{index:03}", {"role": "user", "content": str(index)}) for index in range(20)
+]
+
+
+class Remote:
+    # Multi-path updates land here. Writes of the batch that starts at
+    # fail_at raise until the remote is repaired, and only once the batch
+    # after it has been written, so later batches settle out of order.
+    def __init__(self, fail_at: str = None) -> None:
+        self.fail_at = fail_at
+        self.messages = {}
+        self.batches = []
+        self.lock = threading.Lock()
+        self.later_written = threading.Event()
+
+    def write(self, batch: dict) -> None:
+        first = min(batch)
+        if first == self.fail_at:
+            assert self.later_written.wait(5)
+            raise ConnectionError("rtdb unreachable")
+        with self.lock:
+            self.messages.update(batch)
+            self.batches.append(first)
+        if self.fail_at is not None and first > self.fail_at:
+            self.later_written.set()
+
+
+def test_checkpoint_only_covers_the_settled_prefix(tmp_path):
+    checkpoint = ImportCheckpoint(str(tmp_path / "import.json"), "uid-1")
+    saved = []
+
+    def save(key: str) -> None:
+        saved.append(key)
+        checkpoint.save(key)
+
+    remote = Remote(fail_at="k010")
+    with pytest.raises(ConnectionError):
+        import_messages(
+            iter(MESSAGES),
+            remote.write,
+            batch_size=2,
+            concurrency=4,
+            on_checkpoint=save,
+        )
+    # Batches past the failed one were written, but the checkpoint stops
+    # before it.
+    assert "k012" in remote.messages
+    assert saved == ["k001", "k003", "k005", "k007", "k009"]
+    assert checkpoint.load() == "k009"
+
+    remote.fail_at = None
+    written = import_messages(
+        iter(MESSAGES),
+        remote.write,
+        batch_size=2,
+        concurrency=4,
+        resume_after=checkpoint.load(),
+        on_checkpoint=checkpoint.save,
+    )
+    assert written == 10
+    # Only the failed batch and those after it are sent again.
+    assert sorted(remote.batches[-5:]) == ["k010", "k012", "k014", "k016", "k018"]
+    assert sorted(remote.messages) == [key for key, _ in MESSAGES]
+    assert checkpoint.load() == "k019"
+
+
+def test_checkpoint_belongs_to_one_uid(tmp_path):
+    path = str(tmp_path / "import.json")
+    ImportCheckpoint(path, "uid-1").save("k005")
+    assert ImportCheckpoint(path, "uid-1").load() == "k005"
+    assert ImportCheckpoint(path, "uid-2").load() is None
+    assert ImportCheckpoint(str(tmp_path / "missing.json"), "uid-1").load() is None
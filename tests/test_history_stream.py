@@ -0,0 +1,172 @@
+import json
+import pytest
+import requests
+import history_stream
+from history_stream import ChatHistoryListener, ChatHistoryMirror, iter_events
+
+URL = "http://rtdb/users/uid-1/chat_history.json"
+
+
+def event(name: str, data=None, path: str = None) -> list:
+    # One server-sent event as RTDB writes it, blank line included.
+    payload = data if path is None else {"path": path, "data": data}
+    return [f"event: {name}", f"data: {json.dumps(payload)}", ""]
+
+
+def message(role: str, content: str) -> dict:
+    return {"role": role, "content": content}
+
+
+class Stream:
+    def __init__(self, lines: list, status_code: int = 200, drop: bool = False):
+        self.lines = lines
+        self.status_code = status_code
+        self.drop = drop
+        self.closed = False
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(self.status_code)
+
+    def iter_lines(self, chunk_size=None, decode_unicode=False):
+        yield from self.lines
+        if self.drop:
+            raise requests.exceptions.ChunkedEncodingError("connection reset")
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class RecordedTransport:
+    # Plays back one recorded stream per connection and keeps the query
+    # parameters each connection was opened with.
+    def __init__(self, *streams: Stream) -> None:
+        self.streams = list(streams)
+        self.params = []
+
+    def get_stream(self, url, headers, params=None, timeout=None) -> Stream:
+        assert url == URL
+        assert headers["accept"] == "text/event-stream"
+        self.params.append(dict(params or {}))
+        return self.streams.pop(0)
+
+
+def listener(*streams: Stream) -> ChatHistoryListener:
+    return ChatHistoryListener(URL, "token-1", transport=RecordedTransport(*streams))
+
+
+INITIAL = event(
+    "put",
+    {"-a": message("user", "hi"), "-b": message("assistant", "hello")},
+    path="/",
+) + event("keep-alive")
+
+
+def test_iter_events():
+    lines = event("put", {"x": 1}, path="/") + event("keep-alive")
+    assert list(iter_events(lines)) == [
+        ("put", '{"path": "/", "data": {"x": 1}}'),
+        ("keep-alive", "null"),
+    ]
+
+
+def test_mirror_put_patch_and_delete():
+    mirror = ChatHistoryMirror()
+    mirror.apply("put", "/", {"-b": message("user", "b"), "-a": message("user", "a")})
+    assert list(mirror.snapshot()) == ["-a", "-b"]
+    mirror.apply("put", "/-c", message("assistant", "c"))
+    mirror.apply("put", "/-a/content", "edited")
+    mirror.apply("put", "/-b", None)
+    assert mirror.snapshot() == {
+        "-a": message("user", "edited"),
+        "-c": message("assistant", "c"),
+    }
+    mirror.apply("patch", "/", {"-d": message("user", "d"), "-c/content": "c2"})
+    assert mirror.snapshot()["-c"]["content"] == "c2"
+    assert mirror.last_key() == "-d"
+    mirror.apply("put", "/", None)
+    assert mirror.snapshot() == {} and mirror.last_key() is None
+
+
+def test_snapshot_is_rebuilt_only_after_a_change():
+    mirror = ChatHistoryMirror()
+    mirror.apply("put", "/-a", message("user", "a"))
+    first = mirror.snapshot()
+    assert mirror.snapshot() is first
+    mirror.apply("put", "/-b", message("user", "b"))
+    assert mirror.snapshot() is not first
+
+
+def test_stream_applies_put_and_patch_and_ignores_keep_alive():
+    lines = (
+        INITIAL
+        + event("put", message("user", "more"), path="/-c")
+        + event("keep-alive")
+        + event("patch", {"-b/content": "hello!", "-d": message("user", "d")}, path="/")
+    )
+    history = listener(Stream(lines))
+    assert history.listen() is True
+    assert history.ready.is_set()
+    assert list(history.read("token-2")) == ["-a", "-b", "-c", "-d"]
+    assert history.mirror.snapshot()["-b"]["content"] == "hello!"
+    assert history.transport.params == [{"auth": "token-1"}]
+
+
+def test_cancel_stops_the_listener():
+    history = listener(Stream(INITIAL + event("cancel", "Permission denied")))
+    assert history.listen() is False
+    assert len(history.read(None)) == 2
+
+
+def test_forbidden_stops_and_auth_revoked_reconnects():
+    assert listener(Stream([], status_code=403)).listen() is False
+    assert listener(Stream(INITIAL + event("auth_revoked", "expired"))).listen()
+    with pytest.raises(requests.exceptions.HTTPError):
+        listener(Stream([], status_code=401)).listen()
+
+
+def test_resume_after_a_dropped_stream():
+    resumed = event(
+        "put", {"-b": message("assistant", "hello"), "-c": message("user", "new")}, "/"
+    )
+    history = listener(Stream(INITIAL, drop=True), Stream(resumed))
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        history.listen()
+    history.id_token = "token-2"
+    assert history.listen() is True
+    assert history.transport.params[1] == {
+        "auth": "token-2",
+        "orderBy": '"$key"',
+        "startAt": '"-b"',
+    }
+    # The resumed snapshot only covers -b onwards; -a is kept.
+    assert list(history.mirror.snapshot()) == ["-a", "-b", "-c"]
+
+
+def test_resync_when_the_resume_key_is_gone():
+    rewritten = event("put", {"-x": message("user", "after a clear")}, path="/")
+    history = listener(Stream(INITIAL, drop=True), Stream(rewritten), Stream(rewritten))
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        history.listen()
+    assert history.listen() is True
+    assert not history.ready.is_set()
+    history.listen()
+    assert history.transport.params[2] == {"auth": "token-1"}
+    assert list(history.mirror.snapshot()) == ["-x"]
+
+
+def test_run_reconnects_and_resumes(monkeypatch):
+    monkeypatch.setattr(history_stream, "RECONNECT_DELAY", 0.001)
+    resumed = event("put", {"-b": message("assistant", "hello")}, path="/") + event(
+        "put", message("user", "new"), path="/-c"
+    )
+    history = listener(
+        Stream(INITIAL, drop=True),
+        Stream(resumed),
+        Stream(event("cancel", "Permission denied")),
+    )
+    history.run()
+    assert history.connections == 3
+    assert "startAt" in history.transport.params[1]
+    assert list(history.mirror.snapshot()) == ["-a", "-b", "-c"]
+    assert history.stopped.is_set()
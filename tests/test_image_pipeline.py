@@ -0,0 +1,50 @@
+import io
+import os
+from PIL import Image
+from image_pipeline import from_chunks, prepare_image, to_chunks
+
+
+def noisy_jpeg(width: int, height: int, orientation: int = None) -> bytes:
+    # Noise at a low JPEG quality: re-encoding it as WEBP only grows it.
+    image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=20, exif=exif)
+    return buffer.getvalue()
+
+
+def test_keeps_original_when_reencoding_does_not_help():
+    data = noisy_jpeg(96, 48)
+    prepared = prepare_image(data)
+    assert prepared.full is data
+    assert prepared.mime_type == "image/jpeg"
+    assert (prepared.width, prepared.height) == (96, 48)
+
+
+def test_keeps_rotated_original():
+    # Orientation 6: stored landscape, shown portrait.
+    data = noisy_jpeg(96, 48, orientation=6)
+    prepared = prepare_image(data)
+    assert prepared.full is data
+    assert (prepared.width, prepared.height) == (48, 96)
+
+
+def test_scales_down_large_images():
+    prepared = prepare_image(noisy_jpeg(400, 100), max_dimension=100)
+    assert prepared.mime_type == "image/webp"
+    assert (prepared.width, prepared.height) == (100, 25)
+
+
+def test_digest_is_taken_over_the_upload():
+    data = noisy_jpeg(32, 32)
+    assert prepare_image(data).digest == prepare_image(data).digest
+    assert prepare_image(data).digest != prepare_image(noisy_jpeg(32, 32)).digest
+
+
+def test_chunks_round_trip():
+    data = bytes(range(256)) * 10
+    chunks = to_chunks(data, chunk_size=100)
+    assert all(key.startswith("c") for key in chunks)
+    assert from_chunks(chunks[key] for key in sorted(chunks)) == data
@@ -0,0 +1,123 @@
+import threading
+import time
+import pytest
+from io_executor import IOExecutor
+
+TARGET = "https://rtdb.example.com/users/uid-1.json"
+
+
+class Gate:
+    # A request that blocks until opened and counts how often it was sent.
+    def __init__(self, value=None) -> None:
+        self.value = value
+        self.opened = threading.Event()
+        self.started = threading.Event()
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.calls += 1
+        self.started.set()
+        assert self.opened.wait(5)
+        return self.value
+
+
+@pytest.fixture
+def io():
+    executor = IOExecutor(host_limit=4, max_workers=8)
+    yield executor
+    executor.pool.shutdown(wait=False)
+
+
+def wait_for(condition) -> None:
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_call_returns_and_raises(io):
+    assert io.call(TARGET, lambda x: x * 2, 21) == 42
+    with pytest.raises(KeyError):
+        io.call(TARGET, lambda: {}["missing"])
+
+
+def test_concurrent_reads_are_coalesced(io):
+    read = Gate("history")
+    futures = [io.submit(TARGET, read, coalesce=("history", "uid-1")) for _ in range(5)]
+    wait_for(lambda: io.calls == 5)
+    read.opened.set()
+    assert [future.result(5) for future in futures] == ["history"] * 5
+    assert read.calls == 1
+    assert io.coalesced == 4
+
+
+def test_reads_after_a_write_do_not_join_older_reads(io):
+    stale, write = Gate("before"), Gate()
+    first = io.submit(TARGET, stale, coalesce="summary", scope="uid-1")
+    assert stale.started.wait(5)
+    written = io.submit(TARGET, write, scope="uid-1", write=True)
+    assert write.started.wait(5)
+    # While the write is in flight, reads go out on their own.
+    during = io.submit(TARGET, lambda: "during", coalesce="summary", scope="uid-1")
+    assert during.result(5) == "during"
+    write.opened.set()
+    written.result(5)
+    after = io.submit(TARGET, lambda: "after", coalesce="summary", scope="uid-1")
+    assert after.result(5) == "after"
+    stale.opened.set()
+    assert first.result(5) == "before"
+    assert io.coalesced == 0
+
+
+def test_writes_leave_other_scopes_coalescing(io):
+    read, write = Gate("other"), Gate()
+    first = io.submit(TARGET, read, coalesce="summary-2", scope="uid-2")
+    assert read.started.wait(5)
+    io.submit(TARGET, write, scope="uid-1", write=True)
+    second = io.submit(TARGET, read, coalesce="summary-2", scope="uid-2")
+    wait_for(lambda: io.coalesced == 1)
+    read.opened.set()
+    write.opened.set()
+    assert first.result(5) == second.result(5) == "other"
+    assert read.calls == 1
+
+
+def test_host_limit(io):
+    gate = Gate()
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def request():
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        gate()
+        with lock:
+            active[0] -= 1
+
+    futures = [io.submit(TARGET, request) for _ in range(10)]
+    other = io.submit("https://other.example.com/x", lambda: "free")
+    assert other.result(5) == "free"
+    wait_for(lambda: gate.calls == 4)
+    gate.opened.set()
+    for future in futures:
+        future.result(5)
+    assert peak[0] == 4
+    # The four blocked requests and the other host's call each held a thread.
+    assert 5 <= io.stats()["threads"] <= 8
+
+
+def test_runs_inline_once_the_pool_is_shut_down(io):
+    io.pool.shutdown()
+    assert io.call(TARGET, threading.current_thread) is threading.current_thread()
+
+
+def test_runs_inline_on_io_threads(io):
+    def nested():
+        return io.call(TARGET, threading.current_thread)
+
+    worker = io.call(TARGET, nested)
+    assert worker is not threading.current_thread()
+    assert worker.name.startswith("io")
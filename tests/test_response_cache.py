@@ -0,0 +1,35 @@
+from response_cache import cache_key
+
+SUMMARY = {"role": "system", "content": "Summary of the earlier conversation: A"}
+PASSAGES = {"role": "system", "content": "Excerpts ...\n\n[notes.pdf] B"}
+
+
+def key(*messages, **kwargs) -> str:
+    return cache_key("model", "system prompt", list(messages), **kwargs)
+
+
+def test_normalized_prompt_matches():
+    assert key({"role": "user", "content": "What is a p-value?"}) == key(
+        {"role": "user", "content": "what is a  p value"}
+    )
+
+
+def test_system_context_is_part_of_the_key():
+    prompt = {"role": "user", "content": "Explain it again."}
+    plain = key(prompt)
+    with_summary = key(SUMMARY, prompt)
+    with_passages = key(SUMMARY, PASSAGES, prompt)
+    assert len({plain, with_summary, with_passages}) == 3
+    other = {"role": "system", "content": "Excerpts ...\n\n[slides.pdf] C"}
+    assert key(SUMMARY, other, prompt) != with_passages
+
+
+def test_system_context_outside_the_window():
+    turns = [{"role": "user", "content": str(index)} for index in range(5)]
+    assert key(PASSAGES, *turns, window=2) != key(*turns, window=2)
+    assert key(*turns, window=2) == key(*turns[-2:], window=2)
+
+
+def test_scope():
+    prompt = {"role": "user", "content": "hi"}
+    assert key(prompt, scope="uid-1") != key(prompt, scope="uid-2")
@@ -0,0 +1,87 @@
+import random
+import pytest
+from search_index import ChatSearchIndex, SearchIndexes
+
+SUBJECTS = ["derivative", "derivation", "integral", "matrix", "eigenvalue"]
+QUERIES = ["derivative", "deriv", "integral matrix", "eigenvalue w3", "w1", "nothing"]
+
+
+def messages(start: int, count: int, seed: int = 3) -> list:
+    # Filler words with a few subject terms, so postings have both long runs
+    # and large gaps between doc ids.
+    rng = random.Random(seed + start)
+    result = []
+    for index in range(start, start + count):
+        words = [f"w{rng.randint(0, 40)}" for _ in range(rng.randint(3, 20))]
+        if index % 7 == 0:
+            words.append(rng.choice(SUBJECTS))
+        result.append((f"k{index:05}", {"role": "user", "content": " ".join(words)}))
+    return result
+
+
+@pytest.fixture
+def paths(tmp_path) -> tuple:
+    return str(tmp_path / "uid-1.idx"), str(tmp_path / "uid-1.log")
+
+
+def reloaded(paths: tuple) -> ChatSearchIndex:
+    index = ChatSearchIndex(*paths)
+    index.load()
+    return index
+
+
+def results(index: ChatSearchIndex) -> list:
+    return [index.search(query, limit=20) for query in QUERIES]
+
+
+def test_snapshot_and_journal_reload_to_the_same_index(paths):
+    index = ChatSearchIndex(*paths)
+    index.add(messages(0, 300))
+    index.save()
+    index.add(messages(300, 50))
+    assert index.journaled == 50
+
+    restored = reloaded(paths)
+    assert restored.keys == index.keys
+    assert restored.postings == index.postings
+    assert restored.total_length == index.total_length
+    assert restored.journaled == 50
+    assert results(restored) == results(index)
+    assert restored.search("derivative")[0] > 0
+
+
+def test_a_rewritten_snapshot_matches_too(paths):
+    index = ChatSearchIndex(*paths)
+    index.add(messages(0, 100))
+    index.save()
+    index.add(messages(100, 20))
+    restored = reloaded(paths)
+    restored.save()
+    assert restored.journaled == 0
+    assert results(reloaded(paths)) == results(index)
+
+
+def test_torn_journal_line_is_skipped(paths):
+    index = ChatSearchIndex(*paths)
+    index.add(messages(0, 10))
+    with open(paths[1], "a", encoding="utf-8") as journal:
+        journal.write('["k99999", {"w1"')
+    assert results(reloaded(paths)) == results(index)
+
+
+def test_damaged_snapshot_falls_back_to_the_journal(paths):
+    index = ChatSearchIndex(*paths)
+    index.add(messages(0, 10))
+    with open(paths[0], "wb") as snapshot:
+        snapshot.write(b"ACSI1\nnot zlib")
+    assert results(reloaded(paths)) == results(index)
+
+
+def test_drop_removes_both_files(tmp_path):
+    indexes = SearchIndexes(str(tmp_path))
+    index = indexes.get("uid-1")
+    index.add(messages(0, 10))
+    index.save()
+    index.add(messages(10, 5))
+    indexes.drop("uid-1")
+    assert len(indexes.get("uid-1")) == 0
@@ -0,0 +1,160 @@
+import json
+import threading
+import pytest
+import requests
+from io_executor import IOExecutor
+from session import UserSession
+from token_refresh import REFRESH_MARGIN, TokenRefreshError, TokenRefreshManager
+
+
+def response(status: int, payload: dict) -> requests.Response:
+    result = requests.Response()
+    result.status_code = status
+    result._content = json.dumps(payload).encode()
+    return result
+
+
+def tokens(refresh_token: str) -> requests.Response:
+    return response(
+        200,
+        {
+            "id_token": f"id-from-{refresh_token}",
+            "refresh_token": f"{refresh_token}-next",
+            "expires_in": "3600",
+        },
+    )
+
+
+def rejected(message: str) -> requests.Response:
+    return response(400, {"error": {"code": 400, "message": message}})
+
+
+class SecureToken:
+    # Answers each exchange with the next queued outcome (a response or an
+    # exception), or fresh tokens; `gate`, when set, holds every exchange
+    # until it is opened.
+    def __init__(self, io: IOExecutor) -> None:
+        self.io = io
+        self.outcomes = []
+        self.posts = []
+        self.gate = None
+
+    def post(self, url: str, data: str) -> requests.Response:
+        refresh_token = json.loads(data)["refresh_token"]
+        self.posts.append(refresh_token)
+        if self.gate is not None:
+            assert self.gate.wait(5)
+        outcome = self.outcomes.pop(0) if self.outcomes else tokens(refresh_token)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def securetoken():
+    io = IOExecutor()
+    yield SecureToken(io)
+    io.pool.shutdown(wait=False)
+
+
+@pytest.fixture
+def manager(securetoken, clock) -> TokenRefreshManager:
+    return TokenRefreshManager("key", transport=securetoken, clock=clock)
+
+
+def session(clock, expires_in: float) -> UserSession:
+    return UserSession("uid-1", None, "id-old", "refresh-1", clock.now + expires_in)
+
+
+def test_one_exchange_per_refresh_token(manager, securetoken):
+    securetoken.gate = threading.Event()
+    futures = [manager.refresh("refresh-1") for _ in range(3)]
+    other = manager.refresh("refresh-2")
+    assert all(future is futures[0] for future in futures)
+    assert other is not futures[0]
+    securetoken.gate.set()
+    assert futures[0].result(5)["idToken"] == "id-from-refresh-1"
+    assert other.result(5)["idToken"] == "id-from-refresh-2"
+    assert sorted(securetoken.posts) == ["refresh-1", "refresh-2"]
+    # A rerun after the exchange finished reuses it.
+    assert manager.refresh("refresh-1") is futures[0]
+    assert len(securetoken.posts) == 2
+
+
+def test_refreshes_within_the_margin(manager, securetoken, clock):
+    user = session(clock, REFRESH_MARGIN + 1)
+    assert manager.current(user) == "id-old"
+    assert securetoken.posts == []
+    clock.now += 2
+    # Inside the margin the old token is still valid: the exchange starts,
+    # and its result is picked up once it is done.
+    securetoken.gate = threading.Event()
+    assert manager.current(user) == "id-old"
+    securetoken.gate.set()
+    manager.refresh("refresh-1").result(5)
+    assert manager.current(user) == "id-from-refresh-1"
+    assert user.refresh_token == "refresh-1-next"
+    assert user.expires_at == clock.now + 3600
+    assert securetoken.posts == ["refresh-1"]
+
+
+def test_expired_token_waits_for_the_exchange(manager, securetoken, clock):
+    user = session(clock, -1)
+    assert manager.current(user) == "id-from-refresh-1"
+
+
+def test_exchanged_tokens_are_reused_until_they_go_stale(manager, securetoken, clock):
+    first = manager.refresh("refresh-1")
+    first.result(5)
+    clock.now += 3600 - REFRESH_MARGIN - 1
+    assert manager.refresh("refresh-1") is first
+    clock.now += 1
+    second = manager.refresh("refresh-1")
+    assert second is not first
+    second.result(5)
+    assert securetoken.posts == ["refresh-1", "refresh-1"]
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "INVALID_REFRESH_TOKEN",
+        "TOKEN_EXPIRED",
+        "USER_DISABLED",
+        "USER_NOT_FOUND",
+    ],
+)
+def test_rejected_refresh_token_ends_the_session(manager, securetoken, clock, message):
+    securetoken.outcomes.append(rejected(message))
+    with pytest.raises(TokenRefreshError):
+        manager.current(session(clock, -1))
+
+
+@pytest.mark.parametrize(
+    "outcome",
+    [
+        requests.exceptions.ConnectionError("securetoken unreachable"),
+        requests.exceptions.Timeout("timed out"),
+        response(503, {"error": {"code": 503, "message": "UNAVAILABLE"}}),
+        rejected("INVALID_GRANT_TYPE"),
+    ],
+)
+def test_outages_are_not_a_rejection(manager, securetoken, clock, outcome):
+    securetoken.outcomes.append(outcome)
+    with pytest.raises(requests.exceptions.RequestException) as raised:
+        manager.current(session(clock, -1))
+    assert not isinstance(raised.value, TokenRefreshError)
+
+
+def test_failed_exchange_is_not_resent_on_every_rerun(manager, securetoken, clock):
+    securetoken.outcomes.append(requests.exceptions.ConnectionError("down"))
+    expired = session(clock, -1)
+    for _ in range(3):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            manager.current(expired)
+    assert securetoken.posts == ["refresh-1"]
+    # A session whose token is still valid keeps using it meanwhile.
+    assert manager.current(session(clock, 60)) == "id-old"
+    clock.now += manager.retry_delay
+    assert manager.current(expired) == "id-from-refresh-1"
+    assert securetoken.posts == ["refresh-1", "refresh-1"]
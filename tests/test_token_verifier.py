@@ -0,0 +1,141 @@
+import jwt
+import pytest
+import requests
+from conftest import PROJECT_ID
+from token_verifier import (
+    MIN_REFRESH_INTERVAL,
+    EmailNotVerified,
+    IdTokenVerifier,
+    InvalidIdToken,
+    KeysUnavailable,
+    PublicKeyCache,
+)
+
+
+class Certificates:
+    # Stands in for fetch_certificates; fails on demand.
+    def __init__(self, signing_key, max_age: int = 3600) -> None:
+        self.signing_key = signing_key
+        self.max_age = max_age
+        self.calls = 0
+        self.failing = False
+
+    def __call__(self, url: str):
+        self.calls += 1
+        if self.failing:
+            raise requests.exceptions.ConnectionError("certs unreachable")
+        return self.signing_key.certificates(), f"public, max-age={self.max_age}"
+
+
+@pytest.fixture
+def certificates(signing_key) -> Certificates:
+    return Certificates(signing_key)
+
+
+@pytest.fixture
+def verifier(certificates, clock) -> IdTokenVerifier:
+    keys = PublicKeyCache(fetch=certificates, clock=clock)
+    return IdTokenVerifier(PROJECT_ID, keys=keys, clock=clock)
+
+
+def test_valid_token(verifier, signing_key, clock):
+    claims = verifier.verify(signing_key.mint(clock.now))
+    assert claims["sub"] == "uid-1"
+    assert claims["email"] == "student@example.com"
+
+
+@pytest.mark.parametrize(
+    "overrides",
+    [
+        {"aud": "another-project"},
+        {"iss": "https://securetoken.google.com/another-project"},
+        {"exp": -1},
+        {"iat": 600},
+        {"auth_time": 600},
+        {"sub": ""},
+    ],
+    ids=["aud", "iss", "expired", "future-iat", "future-auth-time", "empty-sub"],
+)
+def test_rejected_claims(verifier, signing_key, clock, overrides):
+    # Relative times are offsets from the clock.
+    for claim in ("exp", "iat", "auth_time"):
+        if claim in overrides:
+            overrides[claim] = int(clock.now) + overrides[claim]
+    with pytest.raises(InvalidIdToken):
+        verifier.verify(signing_key.mint(clock.now, **overrides))
+
+
+def test_expired_after_issue(verifier, signing_key, clock):
+    token = signing_key.mint(clock.now)
+    clock.now += 3601
+    with pytest.raises(InvalidIdToken, match="expired"):
+        verifier.verify(token)
+
+
+def test_wrong_algorithm(verifier, signing_key, clock):
+    token = jwt.encode(
+        {"sub": "uid-1", "aud": PROJECT_ID},
+        "shared-secret",
+        algorithm="HS256",
+        headers={"kid": signing_key.kid},
+    )
+    with pytest.raises(InvalidIdToken, match="algorithm"):
+        verifier.verify(token)
+
+
+def test_unknown_kid(verifier, signing_key, clock):
+    with pytest.raises(InvalidIdToken, match="Unknown signing key"):
+        verifier.verify(signing_key.mint(clock.now, kid="rotated-away"))
+
+
+def test_unknown_kid_refetch_is_rate_limited(
+    verifier, signing_key, certificates, clock
+):
+    verifier.verify(signing_key.mint(clock.now))
+    for _ in range(3):
+        with pytest.raises(InvalidIdToken):
+            verifier.verify(signing_key.mint(clock.now, kid="rotated-away"))
+    assert certificates.calls == 1
+    clock.now += MIN_REFRESH_INTERVAL
+    with pytest.raises(InvalidIdToken):
+        verifier.verify(signing_key.mint(clock.now, kid="rotated-away"))
+    assert certificates.calls == 2
+
+
+def test_unverified_email(verifier, signing_key, clock):
+    with pytest.raises(EmailNotVerified) as raised:
+        verifier.verify(signing_key.mint(clock.now, email_verified=False))
+    assert raised.value.claims["sub"] == "uid-1"
+    claims = verifier.verify(
+        signing_key.mint(clock.now, email_verified=False),
+        require_email_verified=False,
+    )
+    assert claims["email_verified"] is False
+
+
+def test_garbage_token(verifier):
+    with pytest.raises(InvalidIdToken):
+        verifier.verify("not-a-jwt")
+
+
+def test_stale_keys_served_when_refresh_fails(
+    verifier, signing_key, certificates, clock
+):
+    verifier.verify(signing_key.mint(clock.now))
+    clock.now += certificates.max_age + 1
+    certificates.failing = True
+    assert verifier.verify(signing_key.mint(clock.now))["sub"] == "uid-1"
+    # The failed refresh is not retried on every call...
+    verifier.verify(signing_key.mint(clock.now))
+    assert certificates.calls == 2
+    # ...but again once the retry interval has passed.
+    clock.now += MIN_REFRESH_INTERVAL
+    certificates.failing = False
+    verifier.verify(signing_key.mint(clock.now))
+    assert certificates.calls == 3
+
+
+def test_no_keys_and_refresh_fails(verifier, signing_key, certificates, clock):
+    certificates.failing = True
+    with pytest.raises(KeysUnavailable):
+        verifier.verify(signing_key.mint(clock.now))
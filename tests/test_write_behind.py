@@ -0,0 +1,67 @@
+import pytest
+from write_behind import WriteBehindRegistry
+
+
+class FlakyWrite:
+    def __init__(self, failures: int) -> None:
+        self.failures = failures
+        self.calls = []
+
+    def __call__(self, uid: str, messages: dict, token: str) -> None:
+        self.calls.append((uid, list(messages.values()), token))
+        if len(self.calls) <= self.failures:
+            raise ConnectionError("rtdb unreachable")
+
+
+def registry(write, clock, **kwargs) -> WriteBehindRegistry:
+    return WriteBehindRegistry(
+        write,
+        renew=lambda refresh_token: f"renewed-{refresh_token}",
+        clock=clock,
+        background=False,
+        **kwargs,
+    )
+
+
+def test_retry_renews_token(clock):
+    write = FlakyWrite(failures=1)
+    writes = registry(write, clock)
+    writes.append("uid-1", {"content": "hi"}, "expired", "refresh-1")
+    with pytest.raises(ConnectionError):
+        writes.flush("uid-1")
+    assert writes.pending("uid-1")
+    writes.flush("uid-1")
+    assert [token for _, _, token in write.calls] == ["expired", "renewed-refresh-1"]
+    assert not writes.pending("uid-1")
+    assert writes.take_dropped("uid-1") == 0
+
+
+def test_backoff_delays_retries(clock):
+    write = FlakyWrite(failures=1)
+    writes = registry(write, clock, max_age=0.0)
+    writes.append("uid-1", {"content": "hi"}, "token")
+    with pytest.raises(ConnectionError):
+        writes.flush("uid-1")
+    buffer = writes.buffer("uid-1")
+    assert not writes.is_due(buffer, clock.now)
+    clock.now = buffer.retry_at
+    assert writes.is_due(buffer, clock.now)
+
+
+def test_batch_dropped_after_max_attempts(clock):
+    write = FlakyWrite(failures=10)
+    writes = registry(write, clock, max_attempts=3)
+    writes.append("uid-1", {"content": "one"}, "token", "refresh-1")
+    writes.append("uid-1", {"content": "two"}, "token", "refresh-1")
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            writes.flush("uid-1")
+    assert len(write.calls) == 3
+    assert not writes.pending("uid-1")
+    assert writes.take_dropped("uid-1") == 2
+    assert writes.take_dropped("uid-1") == 0
+    # Later messages start over with a full set of attempts.
+    writes.append("uid-1", {"content": "three"}, "token", "refresh-1")
+    with pytest.raises(ConnectionError):
+        writes.flush("uid-1")
+    assert writes.pending("uid-1")
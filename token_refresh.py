@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Callable
+from session import UserSession
+from transport import PooledTransport, error_message, get_transport
+
+
+SECURE_TOKEN_URL = "https://securetoken.googleapis.com/v1/token"
+# Refresh this many seconds before the ID token expires.
+REFRESH_MARGIN = 300
+# A failed exchange is reused for this long, so that reruns during a
+# securetoken outage do not each send another one.
+RETRY_DELAY = 10
+# Answers meaning the refresh token will never work again; anything else
+# (timeouts, 5xx, throttling) says nothing about the session.
+REJECTED_ERRORS = frozenset(
+    {"INVALID_REFRESH_TOKEN", "TOKEN_EXPIRED", "USER_DISABLED", "USER_NOT_FOUND"}
+)
+
+
+class TokenRefreshError(Exception):
+    # securetoken rejected the refresh token: the session is over.
+    pass
+
+
+class TokenRefreshManager:
+    def __init__(
+        self,
+        api_key: str,
+        transport: PooledTransport = None,
+        base_url: str = SECURE_TOKEN_URL,
+        margin: int = REFRESH_MARGIN,
+        clock: Callable[[], float] = time.time,
+        retry_delay: float = RETRY_DELAY,
+    ) -> None:
+        self.url = f"{base_url}?key={api_key}"
+        self.transport = transport or get_transport()
+        self.margin = margin
+        self.clock = clock
+        self.retry_delay = retry_delay
+        # refresh token -> Future of the exchanged tokens. Completed futures
+        # are kept until their tokens go stale (or, for a failed exchange,
+        # until retry_delay has passed) so that a rerun arriving after the
+        # exchange finished reuses it instead of starting another.
+        self.in_flight = {}
+        # refresh token -> when its failed exchange may be retried.
+        self.retry_at = {}
+        self.lock = threading.Lock()
+
+    def exchange(self, refresh_token: str) -> dict:
+        # Raises TokenRefreshError only for a definitive rejection; transport
+        # errors and other HTTP errors propagate as they are.
+        try:
+            response = self.transport.post(
+                self.url,
+                json.dumps(
+                    {"grant_type": "refresh_token", "refresh_token": refresh_token}
+                ),
+            )
+            if response.status_code == 400:
+                message = error_message(response)
+                if message.split(" ")[0] in REJECTED_ERRORS:
+                    raise TokenRefreshError(message)
+            response.raise_for_status()
+            payload = response.json()
+        except Exception:
+            self.retry_at[refresh_token] = self.clock() + self.retry_delay
+            raise
+        return {
+            "idToken": payload["id_token"],
+            "refreshToken": payload["refresh_token"],
+            "expiresAt": self.clock() + int(payload["expires_in"]),
+        }
+
+    def is_stale(self, refresh_token: str, future: Future) -> bool:
+        if not future.done():
+            return False
+        if future.exception() is not None:
+            return self.retry_at.get(refresh_token, 0) <= self.clock()
+        return future.result()["expiresAt"] - self.margin <= self.clock()
+
+    def refresh(self, refresh_token: str) -> Future:
+        with self.lock:
+            future = self.in_flight.get(refresh_token)
+            if future is None or self.is_stale(refresh_token, future):
+                for token, pending in list(self.in_flight.items()):
+                    if self.is_stale(token, pending):
+                        del self.in_flight[token]
+                        self.retry_at.pop(token, None)
+                # Runs on the I/O executor, so it needs no threads of its own.
+                future = self.transport.io.submit(
+                    self.url, self.exchange, refresh_token
+                )
+                self.in_flight[refresh_token] = future
+            return future
+
+    def current(self, session: UserSession) -> str:
+        if session.refresh_token is None:
+            return session.id_token
+        remaining = session.expires_at - self.clock()
+        if remaining > self.margin:
+            return session.id_token
+        future = self.refresh(session.refresh_token)
+        if remaining > 0 and (not future.done() or future.exception() is not None):
+            # The current token is still valid; pick up the new one later.
+            return session.id_token
+        session.apply_tokens(future.result())
+        return session.id_token
+
+
+@lru_cache(maxsize=None)
+def get_token_refresh_manager(
+    api_key: str, base_url: str = SECURE_TOKEN_URL
+) -> TokenRefreshManager:
+    return TokenRefreshManager(api_key, base_url=base_url)
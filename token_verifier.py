@@ -0,0 +1,161 @@
+import logging
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Optional, Tuple
+from transport import get_transport
+
+
+GOOGLE_CERTS_URL = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/"
+    "securetoken@system.gserviceaccount.com"
+)
+ISSUER_PREFIX = "https://securetoken.google.com/"
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+# Never go back to the network for an unknown kid more often than this.
+MIN_REFRESH_INTERVAL = 60
+DEFAULT_MAX_AGE = 3600
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidIdToken(Exception):
+    pass
+
+
+class KeysUnavailable(Exception):
+    # The signing keys could not be fetched and none are cached: tokens can
+    # be neither accepted nor rejected right now.
+    pass
+
+
+class EmailNotVerified(InvalidIdToken):
+    def __init__(self, claims: dict) -> None:
+        super().__init__("EMAIL_NOT_VERIFIED")
+        self.claims = claims
+
+
+def fetch_certificates(url: str) -> Tuple[dict, Optional[str]]:
+    response = get_transport().get(url)
+    response.raise_for_status()
+    return response.json(), response.headers.get("cache-control")
+
+
+class PublicKeyCache:
+    def __init__(
+        self,
+        url: str = GOOGLE_CERTS_URL,
+        fetch: Callable[[str], Tuple[dict, Optional[str]]] = fetch_certificates,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.url = url
+        self.fetch = fetch
+        self.clock = clock
+        self.keys = {}
+        self.expires_at = 0.0
+        self.fetched_at = float("-inf")
+        self.lock = threading.Lock()
+
+    def refresh(self) -> None:
+        # PyJWT and cryptography are only loaded once a token is checked, so
+        # the sign-in page renders without them.
+        from cryptography.x509 import load_pem_x509_certificate
+
+        certificates, cache_control = self.fetch(self.url)
+        keys = {
+            kid: load_pem_x509_certificate(pem.encode()).public_key()
+            for kid, pem in certificates.items()
+        }
+        match = MAX_AGE_PATTERN.search(cache_control or "")
+        max_age = int(match.group(1)) if match else DEFAULT_MAX_AGE
+        now = self.clock()
+        self.keys = keys
+        self.fetched_at = now
+        self.expires_at = now + max_age
+
+    def get(self, kid: str):
+        now = self.clock()
+        if now < self.expires_at and kid in self.keys:
+            return self.keys[kid]
+        with self.lock:
+            now = self.clock()
+            stale = now >= self.expires_at
+            unknown = kid not in self.keys
+            if stale or (unknown and now - self.fetched_at >= MIN_REFRESH_INTERVAL):
+                try:
+                    self.refresh()
+                except Exception as error:
+                    # Google rotates keys well before retiring the old ones,
+                    # so stale keys keep verifying while the fetch is retried
+                    # at most once per MIN_REFRESH_INTERVAL.
+                    if not self.keys:
+                        raise KeysUnavailable(str(error)) from error
+                    logger.warning("Refreshing ID token signing keys failed: %s", error)
+                    self.fetched_at = now
+                    self.expires_at = now + MIN_REFRESH_INTERVAL
+            return self.keys.get(kid)
+
+
+class IdTokenVerifier:
+    def __init__(
+        self,
+        project_id: str,
+        keys: PublicKeyCache = None,
+        clock: Callable[[], float] = time.time,
+        leeway: int = 0,
+    ) -> None:
+        self.project_id = project_id
+        self.issuer = ISSUER_PREFIX + project_id
+        self.keys = keys or PublicKeyCache(clock=clock)
+        self.clock = clock
+        self.leeway = leeway
+
+    def verify(self, id_token: str, require_email_verified: bool = True) -> dict:
+        import jwt
+
+        try:
+            header = jwt.get_unverified_header(id_token)
+        except jwt.PyJWTError as error:
+            raise InvalidIdToken(str(error))
+        if header.get("alg") != "RS256":
+            raise InvalidIdToken("Unexpected signing algorithm")
+        key = self.keys.get(header.get("kid"))
+        if key is None:
+            raise InvalidIdToken("Unknown signing key")
+        try:
+            # exp/iat are checked below against self.clock so that tests can
+            # pin the time; everything else is left to PyJWT.
+            claims = jwt.decode(
+                id_token,
+                key,
+                algorithms=["RS256"],
+                audience=self.project_id,
+                issuer=self.issuer,
+                options={
+                    "require": ["exp", "iat", "aud", "iss", "sub"],
+                    "verify_exp": False,
+                    "verify_iat": False,
+                },
+            )
+        except jwt.PyJWTError as error:
+            raise InvalidIdToken(str(error))
+        now = self.clock()
+        if claims["exp"] <= now - self.leeway:
+            raise InvalidIdToken("Token expired")
+        if claims["iat"] > now + self.leeway:
+            raise InvalidIdToken("Token issued in the future")
+        if claims.get("auth_time", 0) > now + self.leeway:
+            raise InvalidIdToken("Token authenticated in the future")
+        if not claims["sub"]:
+            raise InvalidIdToken("Token has no subject")
+        if require_email_verified and not claims.get("email_verified", False):
+            raise EmailNotVerified(claims)
+        return claims
+
+
+@lru_cache(maxsize=None)
+def get_token_verifier(
+    project_id: str, certs_url: str = GOOGLE_CERTS_URL
+) -> IdTokenVerifier:
+    return IdTokenVerifier(project_id, keys=PublicKeyCache(url=certs_url))
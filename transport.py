@@ -0,0 +1,206 @@
+import json
+import re
+import threading
+from functools import lru_cache
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter
+from circuit_breaker import CircuitBreakerRegistry
+from io_executor import IOExecutor, get_io_executor
+
+
+IDENTITY_TOOLKIT_URL = "https://www.googleapis.com/identitytoolkit/v3/relyingparty"
+IDENTITY_TOOLKIT_ENDPOINTS = (
+    "verifyPassword",
+    "getAccountInfo",
+    "getOobConfirmationCode",
+    "signupNewUser",
+    "deleteAccount",
+)
+# Endpoints that only read: identical requests in flight are sent once.
+IDENTITY_TOOLKIT_READS = frozenset({"getAccountInfo"})
+JSON_HEADERS = {"content-type": "application/json; charset=UTF-8"}
+DEFAULT_POOL_SIZE = 10
+
+INVALID_CREDENTIALS = "invalid_credentials"
+BLOCKED = "blocked"
+OTHER = "other"
+INVALID_CREDENTIALS_ERRORS = frozenset(
+    {
+        "INVALID_EMAIL",
+        "EMAIL_NOT_FOUND",
+        "INVALID_PASSWORD",
+        "MISSING_PASSWORD",
+        "INVALID_LOGIN_CREDENTIALS",
+    }
+)
+# Matched anywhere in the message, case-insensitively: Identity Toolkit
+# appends free text such as "TOO_MANY_ATTEMPTS_TRY_LATER : Too many ...".
+BLOCKED_ERRORS = re.compile(
+    "TOO_MANY_ATTEMPTS_TRY_LATER|USER_DISABLED|OPERATION_NOT_ALLOWED|USER_NOT_FOUND",
+    re.IGNORECASE,
+)
+THROTTLED_ERRORS = re.compile("TOO_MANY_ATTEMPTS_TRY_LATER", re.IGNORECASE)
+
+
+@lru_cache(maxsize=256)
+def classify_error(message: str) -> str:
+    if message in INVALID_CREDENTIALS_ERRORS:
+        return INVALID_CREDENTIALS
+    if BLOCKED_ERRORS.search(message):
+        return BLOCKED
+    return OTHER
+
+
+def error_message(response: requests.models.Response) -> str:
+    try:
+        return response.json()["error"]["message"]
+    except (ValueError, KeyError, TypeError):
+        return ""
+
+
+class PooledTransport:
+    # A single requests.Session backed by a urllib3 connection pool. The pool
+    # itself is thread-safe; cookies are disabled so that no per-user state
+    # ever lives on the shared session. Plain requests go through the shared
+    # I/O executor; streams are read by their caller for as long as they
+    # last, so they do not take one of its slots.
+    def __init__(
+        self,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        timeout: float = None,
+        io: IOExecutor = None,
+    ) -> None:
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.io = io or get_io_executor(pool_size)
+        self.session = requests.Session()
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        self.session.headers.update(JSON_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post(
+        self,
+        url: str,
+        data: str,
+        headers: dict = None,
+        timeout=None,
+        coalesce=None,
+    ) -> requests.models.Response:
+        # coalesce: a key naming the request, for POSTs that only read.
+        return self.io.call(
+            url,
+            self.session.post,
+            url,
+            data=data,
+            headers=headers,
+            timeout=timeout or self.timeout,
+            coalesce=coalesce,
+        )
+
+    def get(self, url: str) -> requests.models.Response:
+        return self.io.call(
+            url, self.session.get, url, timeout=self.timeout, coalesce=("GET", url)
+        )
+
+    def stream(
+        self, url: str, data: str, headers: dict, timeout=None
+    ) -> requests.models.Response:
+        return self.session.post(
+            url, data=data, headers=headers, stream=True, timeout=timeout
+        )
+
+    def get_stream(
+        self, url: str, headers: dict, params: dict = None, timeout=None
+    ) -> requests.models.Response:
+        return self.session.get(
+            url, params=params, headers=headers, stream=True, timeout=timeout
+        )
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport(pool_size: int = DEFAULT_POOL_SIZE) -> PooledTransport:
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = PooledTransport(pool_size=pool_size)
+    return _transport
+
+
+class IdentityToolkitClient:
+    def __init__(
+        self,
+        api_key: str,
+        transport: PooledTransport = None,
+        base_url: str = IDENTITY_TOOLKIT_URL,
+    ) -> None:
+        self.transport = transport or get_transport()
+        self.urls = {
+            endpoint: f"{base_url}/{endpoint}?key={api_key}"
+            for endpoint in IDENTITY_TOOLKIT_ENDPOINTS
+        }
+        self.breakers = CircuitBreakerRegistry()
+
+    def post(self, endpoint: str, payload: dict) -> requests.models.Response:
+        # Guarded by one circuit per endpoint and one per email address, so a
+        # throttled endpoint or a hammered account fails fast locally (with
+        # CircuitOpen) instead of adding to the shared API key's rate limit.
+        email = payload.get("email")
+        email_key = f"email:{email.strip().lower()}" if email else None
+        data = json.dumps(payload)
+        coalesce = (endpoint, data) if endpoint in IDENTITY_TOOLKIT_READS else None
+        with self.breakers.guard(endpoint, email_key) as breakers:
+            try:
+                response = self.transport.post(
+                    self.urls[endpoint], data, coalesce=coalesce
+                )
+            except requests.exceptions.RequestException:
+                breakers[0].record_failure()
+                raise
+            self.record_outcome(response, breakers[0], breakers[1:])
+            return response
+
+    def record_outcome(
+        self, response: requests.models.Response, endpoint_breaker, email_breakers
+    ) -> None:
+        if response.status_code < 400:
+            for breaker in [endpoint_breaker, *email_breakers]:
+                breaker.record_success()
+            return
+        message = error_message(response)
+        if response.status_code == 429 or response.status_code >= 500:
+            endpoint_breaker.record_failure()
+        elif THROTTLED_ERRORS.search(message):
+            endpoint_breaker.record_failure()
+            for breaker in email_breakers:
+                breaker.record_failure()
+        elif classify_error(message) == BLOCKED:
+            # The endpoint answered normally; the account is what is failing.
+            endpoint_breaker.record_success()
+            for breaker in email_breakers:
+                breaker.record_failure()
+        elif classify_error(message) == INVALID_CREDENTIALS:
+            # A mistyped email or password says nothing against the account:
+            # it must not lock its owner out. Repeated guessing is throttled
+            # by Identity Toolkit itself, which trips the circuit above.
+            endpoint_breaker.record_success()
+
+
+@lru_cache(maxsize=None)
+def get_identity_toolkit(
+    api_key: str,
+    base_url: str = IDENTITY_TOOLKIT_URL,
+    pool_size: int = DEFAULT_POOL_SIZE,
+) -> IdentityToolkitClient:
+    return IdentityToolkitClient(
+        api_key, transport=get_transport(pool_size), base_url=base_url
+    )
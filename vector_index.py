@@ -0,0 +1,253 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+import numpy as np
+
+
+# Rows scored per matrix product, so a query never materialises more than
+# one block of scores however large the index grows.
+BLOCK_ROWS = 1 << 18
+DEFAULT_MAPPED_USERS = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS indexes (
+    uid TEXT PRIMARY KEY,
+    embedder TEXT NOT NULL,
+    dimensions INTEGER NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS documents (
+    uid TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    name TEXT NOT NULL,
+    first_row INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    added REAL NOT NULL,
+    PRIMARY KEY (uid, digest)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS passages (
+    uid TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (uid, position)
+) WITHOUT ROWID;
+"""
+
+
+@dataclass(frozen=True)
+class Passage:
+    document: str
+    text: str
+    score: float
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    # Indices of the k highest scores, best first, without sorting them all.
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class VectorStore:
+    # Per-user passage embeddings for retrieval. Each user's vectors are one
+    # flat float32 file, rows in insertion order, read through a memory map;
+    # passage texts and document metadata live in SQLite. The committed row
+    # count in `indexes` is authoritative: vectors are appended before that
+    # transaction, so a crash in between leaves a tail that the next add
+    # overwrites. An index built by another embedder is discarded on first
+    # use, since its vectors are not comparable.
+    def __init__(
+        self,
+        directory: str,
+        embedder: str,
+        dimensions: int,
+        mapped_users: int = DEFAULT_MAPPED_USERS,
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.embedder = embedder
+        self.dimensions = dimensions
+        self.mapped_users = mapped_users
+        self.mapped = OrderedDict()
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            os.path.join(directory, "passages.sqlite3"),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def vectors_path(self, uid: str) -> str:
+        return os.path.join(self.directory, f"{uid}.f32")
+
+    def rows(self, uid: str) -> int:
+        # Caller holds the lock.
+        row = self.connection.execute(
+            "SELECT embedder, dimensions, rows FROM indexes WHERE uid = ?", (uid,)
+        ).fetchone()
+        if row is None:
+            return 0
+        if row[:2] != (self.embedder, self.dimensions):
+            self.remove(uid)
+            return 0
+        return row[2]
+
+    def has_document(self, uid: str, digest: str) -> bool:
+        with self.lock:
+            self.rows(uid)
+            row = self.connection.execute(
+                "SELECT 1 FROM documents WHERE uid = ? AND digest = ?", (uid, digest)
+            ).fetchone()
+        return row is not None
+
+    def add(
+        self,
+        uid: str,
+        digest: str,
+        name: str,
+        passages: Sequence[str],
+        vectors: np.ndarray,
+    ) -> int:
+        # Appends one document's passages; returns how many were added (0 if
+        # the same file is already indexed for this user).
+        if len(passages) != len(vectors):
+            raise ValueError("one vector per passage is required")
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(vectors) and vectors.shape[1] != self.dimensions:
+            raise ValueError(
+                f"expected {self.dimensions}-dimensional vectors, "
+                f"got {vectors.shape[1]}"
+            )
+        with self.lock:
+            first = self.rows(uid)
+            if self.connection.execute(
+                "SELECT 1 FROM documents WHERE uid = ? AND digest = ?", (uid, digest)
+            ).fetchone():
+                return 0
+            path = self.vectors_path(uid)
+            with open(path, "ab") as file:
+                file.truncate(first * self.dimensions * 4)
+                file.write(vectors.tobytes())
+            self.connection.execute("BEGIN")
+            try:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO passages VALUES (?, ?, ?, ?)",
+                    [
+                        (uid, first + offset, digest, text)
+                        for offset, text in enumerate(passages)
+                    ],
+                )
+                self.connection.execute(
+                    "INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?)",
+                    (uid, digest, name, first, len(passages), time.time()),
+                )
+                self.connection.execute(
+                    "INSERT INTO indexes VALUES (?, ?, ?, ?) ON CONFLICT (uid) "
+                    "DO UPDATE SET rows = excluded.rows",
+                    (uid, self.embedder, self.dimensions, first + len(passages)),
+                )
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.mapped.pop(uid, None)
+        return len(passages)
+
+    def matrix(self, uid: str) -> Optional[np.ndarray]:
+        # Read-only map of the committed rows. Appends only ever write past
+        # them, so a map stays valid while the file grows; it is replaced
+        # after each add.
+        with self.lock:
+            matrix = self.mapped.get(uid)
+            if matrix is not None:
+                self.mapped.move_to_end(uid)
+                return matrix
+            rows = self.rows(uid)
+            if not rows:
+                return None
+            matrix = np.memmap(
+                self.vectors_path(uid),
+                dtype=np.float32,
+                mode="r",
+                shape=(rows, self.dimensions),
+            )
+            self.mapped[uid] = matrix
+            while len(self.mapped) > self.mapped_users:
+                self.mapped.popitem(last=False)
+            return matrix
+
+    def search(
+        self, uid: str, vector: np.ndarray, k: int = 4, min_score: float = 0.0
+    ) -> List[Passage]:
+        # Cosine similarity (all rows are unit length) against every passage,
+        # one block-sized matrix-vector product at a time; each block only
+        # contributes its own top k to the final selection.
+        matrix = self.matrix(uid)
+        if matrix is None or k <= 0:
+            return []
+        vector = np.asarray(vector, dtype=np.float32)
+        rows, scores = [], []
+        for start in range(0, len(matrix), BLOCK_ROWS):
+            block = matrix[start : start + BLOCK_ROWS] @ vector
+            best = top_k(block, k)
+            rows.append(best + start)
+            scores.append(block[best])
+        rows, scores = np.concatenate(rows), np.concatenate(scores)
+        best = top_k(scores, k)
+        hits = [
+            (int(row), float(score))
+            for row, score in zip(rows[best], scores[best])
+            if score > min_score
+        ]
+        if not hits:
+            return []
+        placeholders = ",".join("?" * len(hits))
+        with self.lock:
+            found = {
+                position: (name, text)
+                for position, name, text in self.connection.execute(
+                    "SELECT p.position, d.name, p.text FROM passages p "
+                    "JOIN documents d ON d.uid = p.uid AND d.digest = p.digest "
+                    f"WHERE p.uid = ? AND p.position IN ({placeholders})",
+                    (uid, *(row for row, _ in hits)),
+                )
+            }
+        return [Passage(*found[row], score) for row, score in hits if row in found]
+
+    def documents(self, uid: str) -> List[dict]:
+        with self.lock:
+            self.rows(uid)
+            return [
+                {"name": name, "passages": rows, "added": added}
+                for name, rows, added in self.connection.execute(
+                    "SELECT name, rows, added FROM documents WHERE uid = ? "
+                    "ORDER BY first_row",
+                    (uid,),
+                )
+            ]
+
+    def clear(self, uid: str) -> None:
+        with self.lock:
+            self.remove(uid)
+
+    def remove(self, uid: str) -> None:
+        # Caller holds the lock. Unlinking a mapped file is fine on POSIX;
+        # searches already holding the map finish against the old rows.
+        self.mapped.pop(uid, None)
+        self.connection.execute("BEGIN")
+        for table in ("passages", "documents", "indexes"):
+            self.connection.execute(f"DELETE FROM {table} WHERE uid = ?", (uid,))
+        self.connection.execute("COMMIT")
+        try:
+            os.remove(self.vectors_path(uid))
+        except OSError:
+            pass
@@ -0,0 +1,241 @@
+import atexit
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+logger = logging.getLogger(__name__)
+
+
+class PushKeyGenerator:
+    # Same layout as Firebase push IDs: 8 chars of millisecond timestamp and
+    # 12 random chars. Within one millisecond (or if the clock steps back) the
+    # random part is incremented, so keys are strictly increasing per process.
+    def __init__(self, clock: Callable[[], float] = time.time) -> None:
+        self.clock = clock
+        self.last_time = 0
+        self.last_random = [0] * 12
+        self.random = random.SystemRandom()
+        self.lock = threading.Lock()
+
+    def __call__(self) -> str:
+        with self.lock:
+            now = int(self.clock() * 1000)
+            if now <= self.last_time:
+                now = self.last_time
+                index = 11
+                while self.last_random[index] == 63:
+                    self.last_random[index] = 0
+                    index -= 1
+                self.last_random[index] += 1
+            else:
+                self.last_random = [self.random.randrange(64) for _ in range(12)]
+            self.last_time = now
+            random_chars = self.last_random[:]
+        time_chars = []
+        for _ in range(8):
+            time_chars.append(PUSH_CHARS[now % 64])
+            now //= 64
+        return "".join(reversed(time_chars)) + "".join(
+            PUSH_CHARS[value] for value in random_chars
+        )
+
+
+class WriteBehindBuffer:
+    def __init__(self) -> None:
+        self.pending = []
+        self.token = None
+        self.refresh_token = None
+        self.oldest = None
+        self.failures = 0
+        self.retry_at = 0.0
+        self.lock = threading.Lock()
+        # Held for the whole write so that batches of one user never overlap.
+        self.flush_lock = threading.Lock()
+
+
+class WriteBehindRegistry:
+    # Per-user buffers of chat messages. Keys are generated at enqueue time,
+    # so the order of a user's messages is fixed before anything is sent;
+    # pending messages are written as one multi-path update once a buffer is
+    # full or its oldest message is max_age seconds old. A failed batch goes
+    # back to the front of its buffer and is retried with exponential backoff,
+    # with a renewed ID token, up to max_attempts times; after that it is
+    # dropped and counted, for the user's next rerun to report.
+    def __init__(
+        self,
+        write: Callable[[str, Dict[str, dict], str], None],
+        renew: Optional[Callable[[str], str]] = None,
+        max_messages: int = 20,
+        max_age: float = 1.0,
+        tick: float = 0.25,
+        max_backoff: float = 30.0,
+        max_attempts: int = 5,
+        clock: Callable[[], float] = time.monotonic,
+        background: bool = True,
+    ) -> None:
+        self.write = write
+        self.renew = renew
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self.tick = tick
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self.generate_key = PushKeyGenerator()
+        self.buffers = {}
+        # uid -> number of messages dropped since it was last taken.
+        self.dropped = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        if background:
+            self.thread = threading.Thread(
+                target=self.run, name="chat-write-behind", daemon=True
+            )
+            self.thread.start()
+            atexit.register(self.close)
+
+    def buffer(self, uid: str) -> WriteBehindBuffer:
+        with self.lock:
+            buffer = self.buffers.get(uid)
+            if buffer is None:
+                buffer = self.buffers[uid] = WriteBehindBuffer()
+            return buffer
+
+    def append(
+        self, uid: str, message: dict, token: str, refresh_token: str = None
+    ) -> str:
+        # Under the registry lock so that prune() cannot drop the buffer
+        # between looking it up and appending to it.
+        with self.lock:
+            buffer = self.buffers.get(uid)
+            if buffer is None:
+                buffer = self.buffers[uid] = WriteBehindBuffer()
+            buffer.lock.acquire()
+        try:
+            key = self.generate_key()
+            buffer.pending.append((key, message))
+            buffer.token = token
+            buffer.refresh_token = refresh_token
+            if buffer.oldest is None:
+                buffer.oldest = self.clock()
+            full = len(buffer.pending) >= self.max_messages
+        finally:
+            buffer.lock.release()
+        if full:
+            self.wakeup.set()
+        return key
+
+    def pending(self, uid: str) -> list:
+        buffer = self.buffer(uid)
+        with buffer.lock:
+            return list(buffer.pending)
+
+    def take_dropped(self, uid: str) -> int:
+        with self.lock:
+            return self.dropped.pop(uid, 0)
+
+    def discard(self, uid: str) -> None:
+        with self.lock:
+            buffer = self.buffers.pop(uid, None)
+        if buffer is not None:
+            with buffer.flush_lock, buffer.lock:
+                buffer.pending = []
+
+    def flush(self, uid: str = None) -> None:
+        if uid is not None:
+            self.flush_buffer(uid, self.buffer(uid))
+            return
+        with self.lock:
+            buffers = list(self.buffers.items())
+        failure = None
+        for uid, buffer in buffers:
+            try:
+                self.flush_buffer(uid, buffer)
+            except Exception as error:
+                failure = failure or error
+        if failure is not None:
+            raise failure
+
+    def flush_buffer(self, uid: str, buffer: WriteBehindBuffer) -> None:
+        with buffer.flush_lock:
+            with buffer.lock:
+                batch, buffer.pending = buffer.pending, []
+                oldest, buffer.oldest = buffer.oldest, None
+                token, refresh_token = buffer.token, buffer.refresh_token
+                failures = buffer.failures
+            if not batch:
+                return
+            try:
+                if failures and refresh_token is not None and self.renew is not None:
+                    # The last attempt may have failed on an expired token,
+                    # and the user may not rerun again to supply a new one.
+                    token = self.renew(refresh_token)
+                self.write(uid, dict(batch), token)
+            except Exception:
+                dropped = 0
+                with buffer.lock:
+                    buffer.failures += 1
+                    if buffer.failures < self.max_attempts:
+                        buffer.pending = batch + buffer.pending
+                        buffer.oldest = oldest
+                        backoff = min(self.max_backoff, self.tick * 2**buffer.failures)
+                        buffer.retry_at = self.clock() + backoff
+                    else:
+                        buffer.failures = 0
+                        buffer.retry_at = 0.0
+                        dropped = len(batch)
+                if dropped:
+                    logger.error(
+                        "Dropped %d chat messages for %s after %d attempts",
+                        dropped,
+                        uid,
+                        self.max_attempts,
+                    )
+                    with self.lock:
+                        self.dropped[uid] = self.dropped.get(uid, 0) + dropped
+                raise
+            with buffer.lock:
+                buffer.failures = 0
+                buffer.retry_at = 0.0
+
+    def is_due(self, buffer: WriteBehindBuffer, now: float) -> bool:
+        with buffer.lock:
+            if not buffer.pending or now < buffer.retry_at:
+                return False
+            return (
+                len(buffer.pending) >= self.max_messages
+                or now - buffer.oldest >= self.max_age
+            )
+
+    def prune(self) -> None:
+        with self.lock:
+            for uid, buffer in list(self.buffers.items()):
+                if not buffer.flush_lock.locked() and not buffer.pending:
+                    del self.buffers[uid]
+
+    def run(self) -> None:
+        while True:
+            self.wakeup.wait(self.tick)
+            self.wakeup.clear()
+            now = self.clock()
+            with self.lock:
+                buffers = list(self.buffers.items())
+            for uid, buffer in buffers:
+                if self.is_due(buffer, now):
+                    try:
+                        self.flush_buffer(uid, buffer)
+                    except Exception:
+                        logger.exception("Flushing chat messages for %s failed", uid)
+            self.prune()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Flushing chat messages on shutdown failed")